@@ -1,20 +1,87 @@
+import asyncio
 import gzip
 import json
-import re
 from collections import defaultdict
-from fuzzywuzzy.process import extractOne
-from fuzzywuzzy.fuzz import QRatio
-from fuzzywuzzy.utils import full_process
+from functools import partial
 from mycroft.skills.core import intent_file_handler
 from mycroft.util.log import LOG
 from mycroft.skills.common_play_skill import CommonPlaySkill, CPSMatchLevel
 from mycroft.util import play_wav
 from os.path import dirname, join, abspath, isfile
-from os import stat
-from .lms_client import LMSClient
+from os import replace, stat
+from threading import Lock, RLock, Thread, local
+from time import monotonic, time
+from .lms_client import (
+    LMSClient,
+    LIBRARY_TAGS,
+    POOL_SIZE as LMS_POOL_SIZE,
+)
+from .library_index import build_sources
+from .library_sync import (
+    FINGERPRINT_TAGS,
+    MAX_CHANGED_FRACTION,
+    album_fingerprints,
+    apply_album_changes,
+    diff_albums,
+    fingerprintable,
+)
+from .fuzzy_index import MatchIndex, CANDIDATES, processed_keys
+from .batch_scorer import BACKENDS as SCORER_BACKENDS, numpy_available
+from .cache_format import (
+    convert as convert_cache,
+    read_json_library,
+    read_keys,
+    read_library,
+    read_sources,
+    write_keys,
+    write_library,
+    write_sources,
+)
+from .sqlite_store import SQLiteStore, SQLiteTable
+from .refresh_cycle import RefreshCycle
+from .player_registry import PlayerRegistry, TTL as PLAYER_CACHE_TTL
+from .lazy_sources import LazyCategory
+from .async_lms_client import AsyncLMSClient
+from .player_state import PlayerStateCache, CLI_PORT
+from .phrase_classifier import PhraseClassifier, REGEXES as PHRASE_REGEXES
+from .phrase_cache import PhraseCache, SIZE as PHRASE_CACHE_SIZE
+from .stage_metrics import StageMetrics
 
 __author__ = "johanpalmqvist"
 
+# Number of titles fetched per request when saving the library cache
+LIBRARY_PAGE_SIZE = 2000
+
+# Categories searched by generic_query (in priority order)
+GENERIC_QUERY_CATEGORIES = (
+    "playlist",
+    "favorite",
+    "podcast",
+    "genre",
+    "artist",
+    "album",
+    "title",
+)
+
+# Specific query categories: (sources category, data key (None for the
+# name itself), bonus)
+SPECIFIC_QUERIES = {
+    "album": ("album", "album_id", 0.1),
+    "artist": ("artist", "artist_id", 0.1),
+    "title": ("title", "url", 0),
+    "genre": ("genre", "genre_id", 0.1),
+    "music": ("genre", "genre_id", 0.1),
+    "playlist": ("playlist", None, 0.1),
+    "favorite": ("favorite", "favorite_id", 0.1),
+    "podcast": ("podcast", "podcast_id", 0.1),
+}
+
+# Categories built from the library (saved per category for lazy loading)
+LIBRARY_CATEGORIES = ("artist", "album", "title", "genre")
+
+# Seconds between writes of the stage metrics file
+METRICS_INTERVAL = 60
+
 
 class SqueezeBoxMediaSkill(CommonPlaySkill):
     def __init__(self):
@@ -28,6 +95,9 @@ class SqueezeBoxMediaSkill(CommonPlaySkill):
         self.add_event("mycroft.audio.service.prev", self.handle_previoustrack)
         self.add_event("mycroft.audio.service.pause", self.handle_pause)
         self.add_event("mycroft.audio.service.resume", self.handle_resume)
+        self.add_event("squeezebox.refresh.status", self.handle_refresh_status)
+        self.add_event("squeezebox.match.stats", self.handle_match_stats)
+        self.add_event("squeezebox.metrics", self.handle_metrics)
 
         self.settings_change_callback = self.get_settings
 
@@ -37,27 +107,100 @@ class SqueezeBoxMediaSkill(CommonPlaySkill):
         self.library_cache_filename = join(
             abspath(dirname(__file__)), "library_cache.json.gz"
         )
+        self.sources_keys_filename = join(
+            abspath(dirname(__file__)), "sources_cache.keys.sqbx"
+        )
         self.library_total_duration_state_filename = join(
             abspath(dirname(__file__)), "library_total_duration_state.json.gz"
         )
-        self.scorer = QRatio
-        self.processor = full_process
+        self.library_last_scan_state_filename = join(
+            abspath(dirname(__file__)), "library_last_scan_state.json.gz"
+        )
+        self.metrics_filename = join(
+            abspath(dirname(__file__)), "stage_metrics.prom"
+        )
         self.regexes = {}
+        self.classifier = PhraseClassifier(
+            {regex: self.translate_regex(regex) for regex in PHRASE_REGEXES}
+        )
+        self.sources = defaultdict(dict)
+        self.match_index = MatchIndex()
+        self.sources_lock = RLock()
+        self.sources_loaded_at = None
+        # Incremented whenever new sources are swapped in
+        self.sources_version = 0
+        self.phrase_cache = PhraseCache()
+        self.sources_store = None
+        # Stores replaced by a settings change (closed once no longer
+        # serving sources)
+        self.retired_stores = []
+        # Refresh cycle per thread (see refresh_cycle)
+        self.refresh_cycles = local()
+        self.refresh_lock = Lock()
+        # Held while updating the cache files
+        self.cache_lock = Lock()
+        self.refresh_thread = None
+        self.refresh_running = False
+        self.refresh_pending = False
+        self.refresh_state = "idle"
+        self.refresh_started_at = None
+        self.player_states = None
+        self.metrics = StageMetrics()
+
+    # Refresh cycle of the current thread (None outside a refresh)
+    @property
+    def refresh_cycle(self):
+        return getattr(self.refresh_cycles, "cycle", None)
+
+    @refresh_cycle.setter
+    def refresh_cycle(self, cycle):
+        self.refresh_cycles.cycle = cycle
 
     def get_settings(self):
         LOG.debug("Settings: {}".format(self.settings))
+        if getattr(self, "lms", None):
+            self.lms.close()
+        try:
+            pool_size = int(self.settings.get("pool_size") or LMS_POOL_SIZE)
+        except (TypeError, ValueError):
+            LOG.warning("Invalid pool size setting. Using default.")
+            pool_size = LMS_POOL_SIZE
         try:
             self.lms = LMSClient(
                 self.settings.get("server"),
                 self.settings.get("port"),
                 self.settings.get("username"),
                 self.settings.get("password"),
+                pool_size,
+                str(self.settings.get("keep_alive", True)).lower() != "false",
             )
         except Exception as e:
             LOG.error(
                 "Could not load server configuration. Exception: {}".format(e)
             )
             raise ValueError("Could not load server configuration.")
+        try:
+            player_cache_ttl = int(
+                self.settings.get("player_cache_ttl", PLAYER_CACHE_TTL)
+            )
+        except (TypeError, ValueError):
+            LOG.warning("Invalid player cache TTL setting. Using default.")
+            player_cache_ttl = PLAYER_CACHE_TTL
+        self.players = PlayerRegistry(self.lms, player_cache_ttl)
+        if self.player_states is not None:
+            self.player_states.stop()
+            self.player_states = None
+        if (
+            str(self.settings.get("player_state_enabled", False)).lower()
+            == "true"
+        ):
+            self.player_states = PlayerStateCache(
+                self.settings.get("server"),
+                self.settings.get("cli_port") or CLI_PORT,
+                self.settings.get("username"),
+                self.settings.get("password"),
+            )
+            self.player_states.start()
         try:
             self.default_player_name = self.settings.get("default_player_name")
         except Exception as e:
@@ -78,9 +221,168 @@ class SqueezeBoxMediaSkill(CommonPlaySkill):
         self.podcast_source_enabled = self.settings.get(
             "podcast_source_enabled", True
         )
+        self.incremental_sync_enabled = (
+            str(self.settings.get("incremental_sync_enabled", True)).lower()
+            != "false"
+        )
+        self.cache_format = self.settings.get("cache_format", "json")
+        self.select_cache_format()
+        self.sources_backend = self.settings.get("sources_backend", "file")
+        self.select_sources_backend()
+        self.select_state_files()
+        try:
+            self.library_page_size = int(
+                self.settings.get("library_page_size", LIBRARY_PAGE_SIZE)
+            )
+        except (TypeError, ValueError):
+            LOG.warning("Invalid library page size setting. Using default.")
+            self.library_page_size = LIBRARY_PAGE_SIZE
+        try:
+            self.fuzzy_candidates = int(
+                self.settings.get("fuzzy_candidates", CANDIDATES)
+            )
+        except (TypeError, ValueError):
+            LOG.warning("Invalid fuzzy candidates setting. Using default.")
+            self.fuzzy_candidates = CANDIDATES
+        self.scorer_backend = self.settings.get("scorer_backend", "fuzzywuzzy")
+        self.select_scorer_backend()
+        try:
+            phrase_cache_size = int(
+                self.settings.get("phrase_cache_size", PHRASE_CACHE_SIZE)
+            )
+        except (TypeError, ValueError):
+            LOG.warning("Invalid phrase cache size setting. Using default.")
+            phrase_cache_size = PHRASE_CACHE_SIZE
+        self.phrase_cache = PhraseCache(phrase_cache_size)
+        self.lazy_loading_enabled = (
+            str(self.settings.get("lazy_loading_enabled", True)).lower()
+            != "false"
+        )
+        try:
+            self.source_idle_eviction = int(
+                self.settings.get("source_idle_eviction", 0)
+            )
+        except (TypeError, ValueError):
+            LOG.warning("Invalid idle eviction setting. Disabling eviction.")
+            self.source_idle_eviction = 0
+        self.cancel_scheduled_event("SqueezeBoxEvictIdleSources")
+        if self.lazy_loading_enabled and self.source_idle_eviction > 0:
+            self.schedule_repeating_event(
+                self.evict_idle_sources,
+                None,
+                self.source_idle_eviction,
+                name="SqueezeBoxEvictIdleSources",
+            )
+        self.metrics.enabled = (
+            str(self.settings.get("metrics_enabled", True)).lower() != "false"
+        )
+        try:
+            self.metrics_interval = int(
+                self.settings.get("metrics_interval", METRICS_INTERVAL)
+            )
+        except (TypeError, ValueError):
+            LOG.warning("Invalid metrics interval setting. Using default.")
+            self.metrics_interval = METRICS_INTERVAL
+        self.cancel_scheduled_event("SqueezeBoxWriteMetrics")
+        if self.metrics.enabled and self.metrics_interval > 0:
+            self.schedule_repeating_event(
+                self.write_metrics,
+                None,
+                self.metrics_interval,
+                name="SqueezeBoxWriteMetrics",
+            )
 
         self.get_sources("connecting...")
 
+    # Select fuzzy match scorer backend (falling back to fuzzywuzzy when
+    # numpy or python-Levenshtein is missing)
+    def select_scorer_backend(self):
+        if self.scorer_backend not in SCORER_BACKENDS:
+            LOG.warning("Unknown scorer backend setting. Using fuzzywuzzy.")
+            self.scorer_backend = "fuzzywuzzy"
+        if self.scorer_backend == "numpy" and not numpy_available():
+            LOG.warning(
+                "Numpy scorer backend needs numpy and python-Levenshtein. "
+                "Using fuzzywuzzy."
+            )
+            self.scorer_backend = "fuzzywuzzy"
+        self.match_index.scorer = self.scorer_backend
+        LOG.info("Using {} scorer backend".format(self.scorer_backend))
+
+    # Select cache file format (converting existing gzip JSON caches when
+    # switching to binary)
+    def select_cache_format(self):
+        skill_dir = abspath(dirname(__file__))
+        json_sources_cache_filename = join(skill_dir, "sources_cache.json.gz")
+        json_library_cache_filename = join(skill_dir, "library_cache.json.gz")
+        if self.cache_format != "binary":
+            self.sources_cache_filename = json_sources_cache_filename
+            self.library_cache_filename = json_library_cache_filename
+            return
+        self.sources_cache_filename = join(skill_dir, "sources_cache.sqbx")
+        self.library_cache_filename = join(skill_dir, "library_cache.sqbx")
+        for json_filename, filename in (
+            (json_library_cache_filename, self.library_cache_filename),
+            (json_sources_cache_filename, self.sources_cache_filename),
+        ):
+            if isfile(json_filename) and not isfile(filename):
+                LOG.info("Converting {} to {}".format(json_filename, filename))
+                try:
+                    convert_cache(json_filename, filename)
+                except Exception as e:
+                    LOG.warning(
+                        "Failed to convert cache. Exception: {}".format(e)
+                    )
+
+    # Select sources backend (SQLite database or cache file). The previous
+    # store stays open while the sources being served still read from it.
+    def select_sources_backend(self):
+        if self.sources_store is not None:
+            self.retired_stores.append(self.sources_store)
+            self.sources_store = None
+        if self.sources_backend != "sqlite":
+            return
+        filename = join(abspath(dirname(__file__)), "sources_cache.sqlite")
+        try:
+            self.sources_store = SQLiteStore(filename)
+            self.sources_cache_filename = filename
+            LOG.info(
+                "Using SQLite sources backend ({} tokenizer)".format(
+                    self.sources_store.tokenizer
+                )
+            )
+        except Exception as e:
+            LOG.error(
+                "Could not open SQLite sources backend. Using cache file. "
+                "Exception: {}".format(e)
+            )
+
+    # Select library state files of the cache format and sources backend.
+    # Each combination keeps its own state, so after switching back to one
+    # its caches are updated if the library changed in the meantime.
+    def select_state_files(self):
+        skill_dir = abspath(dirname(__file__))
+        suffix = ""
+        if self.cache_format == "binary":
+            suffix += ".binary"
+        if self.sources_store is not None:
+            suffix += ".sqlite"
+        self.library_total_duration_state_filename = join(
+            skill_dir, "library_total_duration_state{}.json.gz".format(suffix)
+        )
+        self.library_last_scan_state_filename = join(
+            skill_dir, "library_last_scan_state{}.json.gz".format(suffix)
+        )
+
+    # Check if sources cache exists (and is not empty)
+    def sources_cache_exists(self):
+        if self.sources_store is not None:
+            return bool(self.sources_store.categories())
+        return (
+            isfile(self.sources_cache_filename)
+            and stat(self.sources_cache_filename).st_size > 26
+        )
+
     # Regex handler
     def translate_regex(self, regex):
         if regex not in self.regexes:
@@ -91,140 +393,375 @@ class SqueezeBoxMediaSkill(CommonPlaySkill):
                 self.regexes[regex] = string
         return self.regexes[regex]
 
-    # Get sources
+    # Get sources. The last good sources cache keeps being served while a
+    # background worker refreshes the sources and swaps them in when ready.
     def get_sources(self, message):
+        with self.refresh_lock:
+            if self.refresh_running:
+                LOG.info("Refresh already running. Queued another refresh.")
+                self.refresh_pending = True
+                return
+            self.refresh_running = True
+            self.refresh_pending = False
+            self.refresh_thread = Thread(
+                target=self.refresh_sources,
+                name="SqueezeBoxRefresh",
+                daemon=True,
+            )
+            self.refresh_thread.start()
+
+    # Refresh sources (run by background worker, again for every refresh
+    # requested while running)
+    def refresh_sources(self):
+        try:
+            if self.sources_loaded_at is None:
+                self.load_stale_sources()
+        except Exception as e:
+            LOG.error("Failed to load sources cache. Exception: {}".format(e))
+        while True:
+            self.refresh_sources_once()
+            with self.refresh_lock:
+                if not self.refresh_pending:
+                    self.refresh_running = False
+                    return
+                self.refresh_pending = False
+
+    # Load sources and build their match index, then swap them in
+    def refresh_sources_once(self):
+        self.refresh_state = "refreshing"
+        self.refresh_started_at = time()
+        self.refresh_cycle = RefreshCycle(self.lms)
+        try:
+            with self.cache_lock:
+                sources = self.load_sources()
+            LOG.info("Building match index")
+            match_index = self.new_match_index()
+            match_index.build(sources)
+            self.refresh_cycle.checkpoint("match index")
+            self.swap_sources(sources, match_index)
+            self.refresh_state = "idle"
+        except Exception as e:
+            self.refresh_state = "failed"
+            LOG.error("Failed to refresh sources. Exception: {}".format(e))
+        finally:
+            LOG.info("Refresh cycle: {}".format(self.refresh_cycle.summary()))
+            self.refresh_cycle = None
+
+    # Load last good sources cache (without contacting the server) so it can
+    # be served while refreshing
+    def load_stale_sources(self):
+        if not (
+            self.media_library_source_enabled and self.sources_cache_exists()
+        ):
+            return
+        sources = self.load_sources_cache()
+        if not sources:
+            return
+        match_index = self.new_match_index()
+        match_index.build(sources)
+        self.swap_sources(sources, match_index)
+        LOG.info("Serving sources cache while refreshing")
+
+    # Create match index (using the processed keys saved with the sources
+    # cache)
+    def new_match_index(self):
+        return MatchIndex(
+            self.fuzzy_candidates,
+            self.load_processed_keys(),
+            self.scorer_backend,
+        )
+
+    # Swap in new sources and match index (atomically for matching), then
+    # close retired stores the new sources don't read from
+    def swap_sources(self, sources, match_index):
+        with self.sources_lock:
+            self.sources = sources
+            self.match_index = match_index
+            self.sources_loaded_at = time()
+            self.sources_version += 1
+            serving = {
+                mapping.store
+                for mapping in sources.values()
+                if isinstance(mapping, SQLiteTable)
+            }
+            retired = [
+                store for store in self.retired_stores if store not in serving
+            ]
+            self.retired_stores = [
+                store for store in self.retired_stores if store in serving
+            ]
+        for store in retired:
+            store.close()
+
+    # Evict source categories and match indexes not used for the idle
+    # eviction period (reloaded on next use)
+    def evict_idle_sources(self, message=None):
+        with self.sources_lock:
+            evicted = set(
+                self.match_index.evict_idle(self.source_idle_eviction)
+            )
+            for category, mapping in list(self.sources.items()):
+                if isinstance(mapping, LazyCategory) and mapping.idle(
+                    self.source_idle_eviction
+                ):
+                    mapping.evict()
+                    evicted.add(category)
+        if evicted:
+            LOG.info(
+                "Evicted idle sources: {}".format(", ".join(sorted(evicted)))
+            )
+
+    # Get refresh state and age of the sources being served
+    def get_refresh_status(self):
+        return {
+            "state": self.refresh_state,
+            "pending": self.refresh_pending,
+            "age": None
+            if self.sources_loaded_at is None
+            else time() - self.sources_loaded_at,
+            "refresh_age": None
+            if self.refresh_started_at is None
+            else time() - self.refresh_started_at,
+        }
+
+    # Reply to squeezebox.refresh.status with refresh state and age
+    def handle_refresh_status(self, message):
+        self.bus.emit(message.response(self.get_refresh_status()))
+
+    # Reply to squeezebox.match.stats with phrase cache hits and misses and
+    # the number of keys scored and pruned
+    def handle_match_stats(self, message):
+        stats = self.phrase_cache.stats()
+        stats.update(self.match_index.stats())
+        self.bus.emit(message.response(stats))
+
+    # Reply to squeezebox.metrics with rolling histograms of time spent per
+    # match and playback stage
+    def handle_metrics(self, message):
+        self.bus.emit(message.response(self.metrics.snapshot()))
+
+    # Write stage metrics file (Prometheus text format)
+    def write_metrics(self, message=None):
+        try:
+            self.metrics.write(self.metrics_filename)
+        except OSError as e:
+            LOG.warning(
+                "Could not write stage metrics. Exception: {}".format(e)
+            )
+
+    # Load sources (from caches and server)
+    def load_sources(self):
         LOG.info("Loading content")
-        self.sources = defaultdict(dict)
+        sources = defaultdict(dict)
         LOG.debug("Selecting default backend")
         default_backend, default_playerid = self.get_playerid(None)
+        self.refresh_cycle.checkpoint("players")
 
         # Album, Artist, Genre, Title sources (cache server response)
         if self.media_library_source_enabled:
             self.update_sources_cache()
-            self.load_sources_cache()
+            sources.update(self.load_sources_cache() or {})
+            self.refresh_cycle.checkpoint("library")
         else:
             LOG.info("Media Library source disabled. Skipped.")
 
-        # Favorite sources (query server)
+        # Favorite, Playlist and Podcast sources (query server concurrently)
+        jobs = {}
         if self.favorite_source_enabled:
-            self.sources["favorite"] = defaultdict(dict)
-            favorites = self.lms.get_favorites()
-            for favorite in favorites:
-                try:
-                    if not self.sources["favorite"][favorite["name"]]:
-                        if (
-                            "audio" in favorite["type"]
-                            and favorite["isaudio"] == 1
-                        ):
-                            self.sources["favorite"][favorite["name"]][
-                                "favorite_id"
-                            ] = favorite["id"]
-                            LOG.debug(
-                                "Loaded favorite: {}".format(favorite["name"])
-                            )
-                except Exception as e:
-                    LOG.warning(
-                        "Failed to load favorite. Exception: {}".format(e)
-                    )
-            LOG.info("Loaded favorites")
+            jobs["favorite"] = (
+                lambda lms: lms.get_favorites(),
+                self.load_favorites,
+            )
         else:
             LOG.info("Favorite source disabled. Skipped.")
-
-        # Playlist sources (query server)
         if self.playlist_source_enabled:
-            self.sources["playlist"] = defaultdict(dict)
-            playlists = self.lms.get_playlists()
-            for playlist in playlists:
-                try:
-                    if not self.sources["playlist"][playlist["playlist"]]:
-                        self.sources["playlist"][playlist["playlist"]][
-                            "playlist_id"
-                        ] = playlist["id"]
-                        LOG.debug(
-                            "Loaded playlist: {}".format(playlist["playlist"])
-                        )
-                except Exception as e:
-                    LOG.warning(
-                        "Failed to load playlist. Exception: {}".format(e)
-                    )
-            LOG.info("Loaded playlists")
+            jobs["playlist"] = (
+                lambda lms: lms.get_playlists(),
+                self.load_playlists,
+            )
         else:
             LOG.info("Playlist source disabled. Skipped.")
-
-        # Podcast sources (query server)
         if self.podcast_source_enabled:
-            self.sources["podcast"] = defaultdict(dict)
-            podcasts = self.lms.get_podcasts(default_playerid)
-            for podcast in podcasts:
-                try:
-                    if not self.sources["podcast"][podcast["name"]]:
-                        if (
-                            not podcast["hasitems"] == 0
-                            and podcast["isaudio"] == 0
-                        ):
-                            self.sources["podcast"][podcast["name"]][
-                                "podcast_id"
-                            ] = podcast["id"]
-                            LOG.debug(
-                                "Loaded podcast: {}".format(podcast["name"])
-                            )
-                except Exception as e:
-                    LOG.warning(
-                        "Failed to load podcast. Exception: {}".format(e)
-                    )
-            LOG.info("Loaded podcasts")
+            jobs["podcast"] = (
+                lambda lms: lms.get_podcasts(default_playerid),
+                self.load_podcasts,
+            )
         else:
             LOG.info("Podcast source disabled. Skipped.")
+        sources.update(self.load_server_sources(jobs))
+        self.refresh_cycle.checkpoint("server sources")
 
         LOG.info("Loaded content")
+        return sources
+
+    # Run source loading jobs ({category: (fetch, load)}) where fetch gets
+    # the items from the async LMS client and load turns them into a source.
+    # The fetches run concurrently on one event loop, returning
+    # {category: source}. A failing source is logged and keeps its
+    # previously loaded data (if any).
+    def load_server_sources(self, jobs):
+        sources = {}
+        if not jobs:
+            return sources
+        fetched = asyncio.run(
+            self.fetch_server_sources(
+                {category: fetch for category, (fetch, _) in jobs.items()}
+            )
+        )
+        for category, result in fetched.items():
+            try:
+                if isinstance(result, BaseException):
+                    raise result
+                items, seconds = result
+                sources[category] = jobs[category][1](items)
+                LOG.info(
+                    "Loaded {} sources in {:.2f}s".format(category, seconds)
+                )
+            except Exception as e:
+                seconds = None
+                LOG.error(
+                    "Failed to load {} sources. Exception: {}".format(
+                        category, e
+                    )
+                )
+                if self.sources.get(category):
+                    LOG.info("Keeping previous {} sources".format(category))
+                    sources[category] = self.sources[category]
+            if self.refresh_cycle is not None:
+                self.refresh_cycle.record(category, seconds)
+        return sources
+
+    # Fetch ({category: fetch}) concurrently over one async LMS client,
+    # returning {category: (items, seconds) or exception}
+    async def fetch_server_sources(self, fetches):
+        async with AsyncLMSClient.from_client(self.lms) as lms:
+            results = await asyncio.gather(
+                *(self.timed_fetch(fetch, lms) for fetch in fetches.values()),
+                return_exceptions=True,
+            )
+        self.lms.request_count += lms.request_count
+        return dict(zip(fetches, results))
+
+    # Await fetch(lms), returning (result, seconds taken)
+    async def timed_fetch(self, fetch, lms):
+        start = monotonic()
+        result = await fetch(lms)
+        return result, monotonic() - start
+
+    # Load favorite sources from favorites
+    def load_favorites(self, favorites):
+        favorite_sources = defaultdict(dict)
+        for favorite in favorites:
+            try:
+                if not favorite_sources[favorite["name"]]:
+                    if (
+                        "audio" in favorite["type"]
+                        and favorite["isaudio"] == 1
+                    ):
+                        favorite_sources[favorite["name"]][
+                            "favorite_id"
+                        ] = favorite["id"]
+                        LOG.debug(
+                            "Loaded favorite: {}".format(favorite["name"])
+                        )
+            except Exception as e:
+                LOG.warning("Failed to load favorite. Exception: {}".format(e))
+        return favorite_sources
+
+    # Load playlist sources from playlists
+    def load_playlists(self, playlists):
+        playlist_sources = defaultdict(dict)
+        for playlist in playlists:
+            try:
+                if not playlist_sources[playlist["playlist"]]:
+                    playlist_sources[playlist["playlist"]][
+                        "playlist_id"
+                    ] = playlist["id"]
+                    LOG.debug(
+                        "Loaded playlist: {}".format(playlist["playlist"])
+                    )
+            except Exception as e:
+                LOG.warning("Failed to load playlist. Exception: {}".format(e))
+        return playlist_sources
+
+    # Load podcast sources from podcasts
+    def load_podcasts(self, podcasts):
+        podcast_sources = defaultdict(dict)
+        for podcast in podcasts:
+            try:
+                if not podcast_sources[podcast["name"]]:
+                    if (
+                        not podcast["hasitems"] == 0
+                        and podcast["isaudio"] == 0
+                    ):
+                        podcast_sources[podcast["name"]][
+                            "podcast_id"
+                        ] = podcast["id"]
+                        LOG.debug(
+                            "Loaded podcast: {}".format(podcast["name"])
+                        )
+            except Exception as e:
+                LOG.warning("Failed to load podcast. Exception: {}".format(e))
+        return podcast_sources
+
+    # Get value of key in player state from the CLI subscription (waiting
+    # for a change reported after since), None if not available
+    def get_player_state(self, playerid, key, since=None):
+        if self.player_states is None:
+            return None
+        return self.player_states.get(playerid, key, since)
+
+    # Get volume (reported after since, if given)
+    def get_volume(self, playerid, since=None):
+        volume = self.get_player_state(playerid, "volume", since)
+        if volume is None:
+            volume = self.lms.get_status(playerid)["volume"]
+        return volume
+
+    # Get current player mode
+    def get_current_mode(self, playerid):
+        mode = self.get_player_state(playerid, "mode")
+        if mode is None:
+            mode = self.lms.get_status(playerid)["mode"]
+        return mode
+
+    # Get artist currently playing
+    def get_current_artist(self, playerid):
+        if self.get_player_state(playerid, "title") is not None:
+            return self.get_player_state(playerid, "artist")
+        return self.lms.get_status(playerid)["artist"]
+
+    # Get title currently playing
+    def get_current_title(self, playerid):
+        title = self.get_player_state(playerid, "title")
+        if title is None:
+            title = self.lms.get_status(playerid)["title"]
+        return title
 
     # Get playerid matching input (fallback to default_player_name setting)
     def get_playerid(self, backend):
         if backend is None:
             backend = self.default_player_name.title()
         LOG.debug("Requested backend: {}".format(backend))
-        players = self.lms.get_players()
-        player_names = []
-        for player in players:
-            LOG.debug(
-                "Playerid={}, Name={}".format(
-                    player["playerid"], player["name"]
-                )
-            )
-            player_names.append(player["name"])
-        key, confidence = extractOne(
-            backend,
-            player_names,
-            processor=self.processor,
-            scorer=self.scorer,
-            score_cutoff=0,
-        )
-        confidence = confidence / 100.0
+        player_name, playerid, confidence = self.players.resolve(backend)
         LOG.debug("Player confidence: {}".format(confidence))
-        if confidence > 0.5:
-            extracted_player_name = key
-            LOG.debug("Extracted backend: {}".format(extracted_player_name))
-        else:
+        if playerid is None:
             LOG.error("Couldn't find player matching: {}".format(backend))
             data = {"backend": backend}
             self.play_dialog("playernotfound.wav", "playernotfound", data)
             return None, None
-        for player in players:
-            if extracted_player_name == player["name"]:
-                backend = player["name"]
-                playerid = player["playerid"]
-        return backend, playerid
+        LOG.debug(
+            "Extracted backend: {}, Playerid={}".format(player_name, playerid)
+        )
+        return player_name, playerid
 
     # Get backend name from phrase
     def get_backend(self, phrase):
         LOG.debug("Backend match phrase: {}".format(phrase))
-        match = re.search(self.translate_regex("backend"), phrase)
-        LOG.debug("Backend match regex: {}".format(match))
-        if match:
-            backend = match.group("backend")
+        backend, _ = self.classifier.split_backend(phrase)
+        if backend:
             LOG.debug("Backend match found: {}".format(backend))
         else:
-            backend = None
             LOG.debug("Backend match not found: {}".format(backend))
         return backend
 
@@ -232,8 +769,10 @@ class SqueezeBoxMediaSkill(CommonPlaySkill):
     def load_library_cache(self):
         LOG.info("Loading library cache")
         try:
-            with gzip.GzipFile(self.library_cache_filename) as f:
-                self.results = json.loads(f.read().decode("utf-8"))
+            if self.cache_format == "binary":
+                self.results = read_library(self.library_cache_filename)
+            else:
+                self.results = read_json_library(self.library_cache_filename)
             LOG.info("Loaded library cache")
         except Exception as e:
             LOG.error("Library cache not found. Exception: {}".format(e))
@@ -253,36 +792,230 @@ class SqueezeBoxMediaSkill(CommonPlaySkill):
                 "Creating missing duration file. Exception: {}".format(e)
             )
             self.save_library_total_duration()
-            return self.lms.get_library_total_duration()
+            return self.get_library_total_duration()
 
-    # Load sources cache file
+    # Load sources cache file (returns sources, None on failure). With lazy
+    # loading each category is read from its own file on first use.
     def load_sources_cache(self):
         LOG.info("Loading sources cache")
         try:
-            with gzip.GzipFile(self.sources_cache_filename) as f:
-                self.sources = json.loads(f.read().decode("utf-8"))
+            if self.sources_category_files_fresh():
+                sources = self.lazy_sources_categories()
+            elif self.sources_store is not None:
+                sources = self.sources_store.tables()
+            elif self.cache_format == "binary":
+                sources = read_sources(self.sources_cache_filename)
+            else:
+                with gzip.GzipFile(self.sources_cache_filename) as f:
+                    sources = json.loads(f.read().decode("utf-8"))
             LOG.info("Loaded sources cache")
+            return sources
         except Exception as e:
             LOG.error("Sources cache does not exist. Exception: {}.".format(e))
+            return None
 
-    # Save library cache file
-    def save_library_cache(self):
-        LOG.info("Saving library cache")
-        payload = {
-            "id": 1,
-            "method": "slim.request",
-            "params": ["query", ["titles", "0", "-1", "tags:aegilpstu"]],
+    # Load processed keys saved with the sources cache ({} if missing or
+    # saved with another sources cache file)
+    def load_processed_keys(self):
+        if self.sources_store is not None:
+            return {}
+        try:
+            return read_keys(
+                self.sources_keys_filename, self.sources_cache_filename
+            )
+        except Exception as e:
+            LOG.debug("Processed keys not loaded. Exception: {}".format(e))
+            return {}
+
+    # Get filename of sources cache file for category
+    def sources_category_filename(self, category):
+        base = self.sources_cache_filename
+        if base.endswith(".json.gz"):
+            base = base[: -len(".json.gz")]
+        return "{}.{}.json.gz".format(base, category)
+
+    # Check if lazy loading applies and the per-category sources cache files
+    # are at least as new as the sources cache file
+    def sources_category_files_fresh(self):
+        if not (
+            self.lazy_loading_enabled
+            and self.sources_store is None
+            and self.cache_format != "binary"
+            and isfile(self.sources_cache_filename)
+        ):
+            return False
+        saved_at = stat(self.sources_cache_filename).st_mtime
+        return all(
+            isfile(self.sources_category_filename(category))
+            and stat(self.sources_category_filename(category)).st_mtime
+            >= saved_at
+            for category in LIBRARY_CATEGORIES
+        )
+
+    # Get lazily loaded library categories reading their sources cache
+    # files. The files are opened now, so a later save (which replaces
+    # them) can't change what is loaded and the categories keep matching
+    # the processed keys of the match index built with them.
+    def lazy_sources_categories(self):
+        return {
+            category: LazyCategory(
+                category,
+                partial(
+                    self.load_sources_category,
+                    open(self.sources_category_filename(category), "rb"),
+                ),
+            )
+            for category in LIBRARY_CATEGORIES
         }
-        with gzip.GzipFile(self.library_cache_filename, "w") as f:
+
+    # Load one category from its (open) sources cache file
+    def load_sources_category(self, cache_file, category):
+        LOG.info("Loading {} sources".format(category))
+        cache_file.seek(0)
+        with gzip.GzipFile(fileobj=cache_file) as f:
+            return json.loads(f.read().decode("utf-8"))
+
+    # Write data to gzip JSON cache file (replaced atomically, so readers
+    # see either the old or the new file)
+    def write_json_cache(self, filename, data, indent=None):
+        partial_filename = "{}.partial".format(filename)
+        with gzip.GzipFile(partial_filename, "w") as f:
             f.write(
                 json.dumps(
-                    self.lms.lms_request(payload)["result"]["titles_loop"],
-                    sort_keys=True,
-                    indent=4,
-                    ensure_ascii=False,
+                    data, sort_keys=True, indent=indent, ensure_ascii=False
                 ).encode("utf-8")
             )
-        LOG.info("Saved library cache")
+        replace(partial_filename, filename)
+
+    # Save library cache file (fetched and written one page at a time unless
+    # library page size is 0)
+    def save_library_cache(self):
+        LOG.info("Saving library cache")
+        if self.library_page_size:
+            titles = (
+                title
+                for page in self.lms.iter_library_titles(
+                    self.library_page_size
+                )
+                for title in page
+            )
+        else:
+            payload = {
+                "id": 1,
+                "method": "slim.request",
+                "params": [
+                    "query",
+                    ["titles", "0", "-1", "tags:{}".format(LIBRARY_TAGS)],
+                ],
+            }
+            titles = self.lms.lms_request(payload)["result"]["titles_loop"]
+        count = self.write_library_cache(titles)
+        LOG.info("Saved library cache ({} titles)".format(count))
+
+    # Write titles (any iterable, consumed once) to library cache file one
+    # title per line (replaced atomically), returning number of titles
+    # written
+    def write_library_cache(self, titles):
+        if self.cache_format == "binary":
+            return write_library(self.library_cache_filename, titles)
+        count = 0
+        partial_filename = "{}.partial".format(self.library_cache_filename)
+        with gzip.GzipFile(partial_filename, "w") as f:
+            f.write(b"[")
+            for title in titles:
+                f.write(b",\n" if count else b"\n")
+                f.write(
+                    json.dumps(
+                        title, sort_keys=True, ensure_ascii=False
+                    ).encode("utf-8")
+                )
+                count += 1
+            f.write(b"\n]")
+        replace(partial_filename, self.library_cache_filename)
+        return count
+
+    # Synchronize library cache with LMS by refetching only albums whose
+    # tracks were added, removed or modified (full resync if the cache
+    # can't be compared or too much changed). Returns True if synchronized.
+    def sync_library_cache(self):
+        LOG.info("Synchronizing library cache")
+        self.load_library_cache()
+        cached = getattr(self, "results", None)
+        if not cached or not fingerprintable(cached):
+            LOG.info("Library cache can't be synchronized. Resyncing.")
+            return False
+        page_size = self.library_page_size or LIBRARY_PAGE_SIZE
+        listing = [
+            title
+            for page in self.lms.iter_library_titles(
+                page_size, FINGERPRINT_TAGS
+            )
+            for title in page
+        ]
+        current = album_fingerprints(listing)
+        changed, removed = diff_albums(album_fingerprints(cached), current)
+        LOG.info(
+            "Library sync: {} albums changed or added, {} removed".format(
+                len(changed), len(removed)
+            )
+        )
+        if len(changed) > len(current) * MAX_CHANGED_FRACTION:
+            LOG.info("Too many albums changed. Resyncing.")
+            return False
+        if not changed and not removed:
+            return True
+        fetched = []
+        for album_id in sorted(changed):
+            for page in self.lms.iter_library_titles(
+                page_size, album_id=album_id
+            ):
+                fetched.extend(page)
+        self.results = apply_album_changes(
+            cached, changed, removed, fetched, listing
+        )
+        count = self.write_library_cache(self.results)
+        LOG.info("Synchronized library cache ({} titles)".format(count))
+        return True
+
+    # Get library total duration from LMS (once per refresh cycle)
+    def get_library_total_duration(self):
+        if self.refresh_cycle is not None:
+            return self.refresh_cycle.library_total_duration()
+        return self.lms.get_library_total_duration()
+
+    # Get time of last library scan from LMS (once per refresh cycle)
+    def get_library_last_scan(self):
+        if self.refresh_cycle is not None:
+            return self.refresh_cycle.library_last_scan()
+        return self.lms.get_library_last_scan()
+
+    # Get library last scan state (None if missing)
+    def load_library_last_scan(self):
+        try:
+            with gzip.GzipFile(self.library_last_scan_state_filename) as f:
+                return json.loads(f.read().decode("utf-8"))
+        except Exception:
+            return None
+
+    # Save library last scan to state file
+    def save_library_last_scan(self, last_scan):
+        with gzip.GzipFile(self.library_last_scan_state_filename, "w") as f:
+            f.write(json.dumps(last_scan).encode("utf-8"))
+
+    # Check if LMS library seems to differ from the cached one depending on
+    # library total duration (and time of last scan for incremental sync)
+    def library_changed(self):
+        if (
+            self.get_library_total_duration()
+            != self.load_library_total_duration()
+        ):
+            return True
+        if self.incremental_sync_enabled:
+            return (
+                self.get_library_last_scan()
+                != self.load_library_last_scan()
+            )
+        return False
 
     # Save library total duration to state file
     def save_library_total_duration(self):
@@ -292,7 +1025,7 @@ class SqueezeBoxMediaSkill(CommonPlaySkill):
         ) as f:
             f.write(
                 json.dumps(
-                    self.lms.get_library_total_duration(),
+                    self.get_library_total_duration(),
                     sort_keys=True,
                     indent=4,
                     ensure_ascii=False,
@@ -305,145 +1038,78 @@ class SqueezeBoxMediaSkill(CommonPlaySkill):
         self.update_library_cache()
         self.load_library_cache()
 
-        # Artist sources
-        self.sources["artist"] = defaultdict(dict)
-        for result in self.results:
-            try:
-                if not self.sources["artist"][result["artist"]]:
-                    self.sources["artist"][result["artist"]][
-                        "artist_id"
-                    ] = result["artist_id"]
-                    self.sources["artist"][result["artist"]]["album"] = []
-            except Exception as e:
-                LOG.warning("Failed to load artist. Exception: {}".format(e))
-        LOG.info("Loaded artists")
-
-        # Album sources
-        self.sources["album"] = defaultdict(dict)
-        self.sources["title"] = defaultdict(dict)
-        for result_albums in self.results:
-            try:
-                if not self.sources["album"][result_albums["album"]]:
-                    self.sources["album"][result_albums["album"]][
-                        "album_id"
-                    ] = result_albums["album_id"]
-                    self.sources["album"][result_albums["album"]]["title"] = []
-                    self.sources["album"][
-                        "{} by {}".format(
-                            result_albums["album"], result_albums["artist"]
-                        )
-                    ]["album_id"] = result_albums["album_id"]
-                    self.sources["album"][
-                        "{} by {}".format(
-                            result_albums["album"], result_albums["artist"]
-                        )
-                    ]["title"] = []
-                    self.sources["artist"][result_albums["artist"]][
-                        "album"
-                    ].append(result_albums["album_id"])
-                    # Title sources
-                    for result_title in self.results:
-                        try:
-                            if (
-                                result_title["album_id"]
-                                == result_albums["album_id"]
-                            ):
-                                self.sources["title"][
-                                    result_title["title"]
-                                ] = {
-                                    "title_id": result_title["id"],
-                                    "url": result_title["url"],
-                                }
-                                artist_title = "{} by {}".format(
-                                    result_title["title"],
-                                    result_title["artist"],
-                                )
-                                self.sources["title"][artist_title] = {
-                                    "title_id": result_title["id"],
-                                    "url": result_title["url"],
-                                }
-                                self.sources["album"][result_albums["album"]][
-                                    "title"
-                                ].append(result_title["id"])
-                                self.sources["album"][
-                                    "{} by {}".format(
-                                        result_albums["album"],
-                                        result_albums["artist"],
-                                    )
-                                ]["title"].append(result_title["id"])
-                        except Exception as e:
-                            LOG.warning(
-                                "Failed to load album. Exception: {}".format(e)
-                            )
-                    LOG.debug(
-                        "Loaded titles for album: {}".format(
-                            result_albums["album"]
-                        )
-                    )
-            except Exception as e:
-                LOG.warning("Failed to load album. Exception: {}".format(e))
-        LOG.info("Loaded albums")
-
-        # Genre sources
-        self.sources["genre"] = defaultdict(dict)
-        for result_genres in self.results:
-            try:
-                if not self.sources["genre"][result_genres["genre"]]:
-                    self.sources["genre"][result_genres["genre"]][
-                        "genre_id"
-                    ] = result_genres["genre_id"]
-                    LOG.debug(
-                        "Loaded genre: {}".format(result_genres["genre"])
-                    )
-            except Exception as e:
-                LOG.warning("Failed to load genre. Exception: {}".format(e))
-        LOG.info("Loaded genres")
+        # Artist, Album, Title and Genre sources
+        sources, stats = build_sources(self.results, LOG)
+        LOG.info(
+            "Built sources index from {} tracks in {:.2f}s: {} artists, "
+            "{} albums, {} titles, {} genres".format(
+                stats["tracks"],
+                stats["seconds"],
+                stats["artist"],
+                stats["album"],
+                stats["title"],
+                stats["genre"],
+            )
+        )
 
         LOG.info("Saving sources cache")
-        with gzip.GzipFile(self.sources_cache_filename, "w") as f:
-            f.write(
-                json.dumps(
-                    self.sources, sort_keys=True, indent=4, ensure_ascii=False
-                ).encode("utf-8")
+        if self.sources_store is not None:
+            written, removed = self.sources_store.write(sources)
+            LOG.info(
+                "Updated SQLite sources: {} written, {} removed".format(
+                    written, removed
+                )
+            )
+        elif self.cache_format == "binary":
+            write_sources(self.sources_cache_filename, sources)
+        else:
+            self.write_json_cache(self.sources_cache_filename, sources, 4)
+            if self.lazy_loading_enabled:
+                for category in LIBRARY_CATEGORIES:
+                    self.write_json_cache(
+                        self.sources_category_filename(category),
+                        sources.get(category, {}),
+                    )
+        if self.sources_store is None:
+            write_keys(
+                self.sources_keys_filename,
+                processed_keys(sources, LIBRARY_CATEGORIES),
+                self.sources_cache_filename,
             )
         LOG.info("Saved sources cache")
 
     # Update library cache file if LMS library seems to differ depending on
-    # library total duration
+    # library total duration (and time of last scan for incremental sync)
     def update_library_cache(self):
         library_cache = False
         if isfile(self.library_cache_filename):
             if stat(self.library_cache_filename).st_size > 26:
                 library_cache = True
-        if (
-            self.lms.get_library_total_duration()
-            == self.load_library_total_duration()
-            and library_cache
-        ):
-            LOG.info("Library total duration unchanged. Not updating cache.")
+        if not self.library_changed() and library_cache:
+            LOG.info("Library unchanged. Not updating cache.")
             return False
         else:
-            LOG.info("Library total duration changed. Updating cache.")
-            self.save_library_cache()
+            LOG.info("Library changed. Updating cache.")
+            if not (
+                self.incremental_sync_enabled
+                and library_cache
+                and self.sync_library_cache()
+            ):
+                self.save_library_cache()
             self.save_library_total_duration()
+            if self.incremental_sync_enabled:
+                self.save_library_last_scan(self.get_library_last_scan())
             return True
 
     # Update sources cache file if LMS library seems to differ depending on
     # library total duration
     def update_sources_cache(self):
-        sources_cache = False
-        if isfile(self.sources_cache_filename):
-            if stat(self.sources_cache_filename).st_size > 26:
-                sources_cache = True
-        if (
-            self.lms.get_library_total_duration()
-            == self.load_library_total_duration()
-            and sources_cache
-        ):
-            LOG.info("Library total duration unchanged. Not updating cache.")
+        sources_cache = self.sources_cache_exists()
+        if not self.library_changed() and sources_cache:
+            LOG.info("Library unchanged. Not updating cache.")
             return False
         else:
-            LOG.info("Library total duration changed. Updating cache.")
+            LOG.info("Library changed. Updating cache.")
             self.save_sources_cache()
             self.save_library_total_duration()
             return True
@@ -463,12 +1129,8 @@ class SqueezeBoxMediaSkill(CommonPlaySkill):
     # Get best playlist match and confidence
     def get_best_playlist(self, playlist):
         LOG.debug("get_best_playlist: playlist={}".format(playlist))
-        key, confidence = extractOne(
-            playlist.lower(),
-            self.sources["playlist"].keys(),
-            processor=self.processor,
-            scorer=self.scorer,
-            score_cutoff=0,
+        key, confidence = self.match_index.extract_best(
+            "playlist", playlist.lower(), self.sources
         )
         confidence = confidence / 100.0
         LOG.debug(
@@ -481,12 +1143,8 @@ class SqueezeBoxMediaSkill(CommonPlaySkill):
     # Get best album match and confidence
     def get_best_album(self, album):
         LOG.debug("get_best_album: album={}".format(album))
-        key, confidence = extractOne(
-            album.lower(),
-            self.sources["album"].keys(),
-            processor=self.processor,
-            scorer=self.scorer,
-            score_cutoff=0,
+        key, confidence = self.match_index.extract_best(
+            "album", album.lower(), self.sources
         )
         confidence = confidence / 100.0
         LOG.debug(
@@ -499,12 +1157,8 @@ class SqueezeBoxMediaSkill(CommonPlaySkill):
     # Get best artist match and confidence
     def get_best_artist(self, artist):
         LOG.debug("get_best_artist: artist={}".format(artist))
-        key, confidence = extractOne(
-            artist.lower(),
-            self.sources["artist"].keys(),
-            processor=self.processor,
-            scorer=self.scorer,
-            score_cutoff=0,
+        key, confidence = self.match_index.extract_best(
+            "artist", artist.lower(), self.sources
         )
         confidence = confidence / 100.0
         LOG.debug(
@@ -517,12 +1171,8 @@ class SqueezeBoxMediaSkill(CommonPlaySkill):
     # Get best favorite match and confidence
     def get_best_favorite(self, favorite):
         LOG.debug("get_best_favorite: favorite={}".format(favorite))
-        key, confidence = extractOne(
-            favorite.lower(),
-            self.sources["favorite"].keys(),
-            processor=self.processor,
-            scorer=self.scorer,
-            score_cutoff=0,
+        key, confidence = self.match_index.extract_best(
+            "favorite", favorite.lower(), self.sources
         )
         confidence = confidence / 100.0
         LOG.debug(
@@ -535,12 +1185,8 @@ class SqueezeBoxMediaSkill(CommonPlaySkill):
     # Get best genre match and confidence
     def get_best_genre(self, genre):
         LOG.debug("get_best_genre: genre={}".format(genre))
-        key, confidence = extractOne(
-            genre.lower(),
-            self.sources["genre"].keys(),
-            processor=self.processor,
-            scorer=self.scorer,
-            score_cutoff=0,
+        key, confidence = self.match_index.extract_best(
+            "genre", genre.lower(), self.sources
         )
         confidence = confidence / 100.0
         LOG.debug(
@@ -553,12 +1199,8 @@ class SqueezeBoxMediaSkill(CommonPlaySkill):
     # Get best podcast match and confidence
     def get_best_podcast(self, podcast):
         LOG.debug("get_best_podcast: podcast={}".format(podcast))
-        key, confidence = extractOne(
-            podcast.lower(),
-            self.sources["podcast"].keys(),
-            processor=self.processor,
-            scorer=self.scorer,
-            score_cutoff=0,
+        key, confidence = self.match_index.extract_best(
+            "podcast", podcast.lower(), self.sources
         )
         confidence = confidence / 100.0
         LOG.debug(
@@ -571,12 +1213,8 @@ class SqueezeBoxMediaSkill(CommonPlaySkill):
     # Get best title match and confidence
     def get_best_title(self, title):
         LOG.debug("get_best_title: title={}".format(title))
-        key, confidence = extractOne(
-            title.lower(),
-            self.sources["title"].keys(),
-            processor=self.processor,
-            scorer=self.scorer,
-            score_cutoff=0,
+        key, confidence = self.match_index.extract_best(
+            "title", title.lower(), self.sources
         )
         confidence = confidence / 100.0
         LOG.debug(
@@ -589,10 +1227,32 @@ class SqueezeBoxMediaSkill(CommonPlaySkill):
     ######################################################################
     # Intent handling
     def CPS_match_query_phrase(self, phrase):
+        # Match against one set of sources (not swapped while matching),
+        # reusing the result for a phrase seen with the same sources and
+        # players
+        timer = self.metrics.timer()
+        with self.sources_lock:
+            version = (self.sources_version, self.players.version)
+            found, result = self.phrase_cache.get(phrase, version)
+            if found:
+                LOG.debug("CPS_match_query_phrase: cached {}".format(phrase))
+            else:
+                result, playerid = self.match_query_phrase(phrase)
+                # Not remembered if the player wasn't found (so it's
+                # reported again)
+                if playerid is not None:
+                    self.phrase_cache.put(phrase, version, result)
+        timer.total("match")
+        if result is None:
+            return None
+        phrase, confidence, data = result
+        return phrase, confidence, dict(data)
+
+    def match_query_phrase(self, phrase):
         LOG.debug("CPS_match_query_phrase={}".format(phrase))
+        timer = self.metrics.timer()
 
-        match = re.search(self.translate_regex("squeezebox_bonus"), phrase)
-        if match:
+        if self.classifier.has_bonus(phrase):
             LOG.debug(
                 "CPS_match_query_phrase: bonus found, phrase={}".format(phrase)
             )
@@ -605,23 +1265,20 @@ class SqueezeBoxMediaSkill(CommonPlaySkill):
             )
             bonus = 0
 
-        LOG.debug(
-            "CPS_match_query_phrase: on_squeezebox={}".format(
-                self.translate_regex("on_squeezebox")
-            )
-        )
-        phrase = re.sub(
-            self.translate_regex("on_squeezebox"), "", phrase
-        ).strip()
-
-        backend, playerid = self.get_playerid(self.get_backend(phrase))
-        phrase = re.sub(self.translate_regex("backend"), "", phrase)
+        phrase = self.classifier.strip_squeezebox(phrase)
+        backend, phrase = self.classifier.split_backend(phrase)
+        LOG.debug("Backend match found: {}".format(backend))
+        timer.checkpoint("match_regex")
+        backend, playerid = self.get_playerid(backend)
+        timer.checkpoint("match_player")
 
         confidence, data = self.continue_playback(phrase, bonus)
         if not data:
             confidence, data = self.specific_query(phrase, bonus)
+            timer.checkpoint("match_specific")
             if not data:
                 confidence, data = self.generic_query(phrase, bonus)
+                timer.checkpoint("match_generic")
         if data:
             LOG.debug("CPS_match_query_phrase: data={}".format(data))
             LOG.debug(
@@ -637,8 +1294,8 @@ class SqueezeBoxMediaSkill(CommonPlaySkill):
                 confidence = CPSMatchLevel.CATEGORY
             data["backend"] = backend
             data["playerid"] = playerid
-            return phrase, confidence, data
-        return None
+            return (phrase, confidence, data), playerid
+        return None, playerid
 
     def continue_playback(self, phrase, bonus):
         LOG.debug(
@@ -652,210 +1309,56 @@ class SqueezeBoxMediaSkill(CommonPlaySkill):
     def specific_query(self, phrase, bonus):
         LOG.debug("specific_query: phrase={}, bonus={}".format(phrase, bonus))
 
-        # Check album
-        match = re.match(self.translate_regex("album"), phrase)
-        LOG.debug("album specific_query: match={}".format(match))
-        if match:
-            bonus += 0.1
-            album = match.groupdict()["album"]
-            LOG.debug("album specific_query: album={}".format(album))
-            album, conf = self.get_best_album(album)
-            if not album:
-                LOG.debug("specific_query: album not found")
-                return None, None
-            confidence = min(conf + bonus, 1.0)
-            LOG.debug("specific_query: album confidence={}".format(confidence))
-            album_id = self.sources["album"][album]["album_id"]
-            return (
-                confidence,
-                {"data": album_id, "name": album, "type": "album"},
-            )
-
-        # Check artist
-        match = re.match(self.translate_regex("artist"), phrase)
-        LOG.debug("artist specific_query: match={}".format(match))
-        if match:
-            bonus += 0.1
-            artist = match.groupdict()["artist"]
-            LOG.debug("artist specific_query: artist={}".format(artist))
-            artist, conf = self.get_best_artist(artist)
-            if not artist:
-                LOG.debug("specific_query: artist not found")
-                return None, None
-            confidence = min(conf + bonus, 1.0)
-            LOG.debug(
-                "specific_query: artist confidence={}".format(confidence)
-            )
-            artist_id = self.sources["artist"][artist]["artist_id"]
-            return (
-                confidence,
-                {"data": artist_id, "name": artist, "type": "artist"},
-            )
-
-        # Check title
-        match = re.match(self.translate_regex("title"), phrase)
-        LOG.debug("title specific_query: match={}".format(match))
-        if match:
-            title = match.groupdict()["title"]
-            LOG.debug("title specific_query: title={}".format(title))
-            title, conf = self.get_best_title(title)
-            if not title:
-                LOG.debug("specific_query: title not found")
-                return None, None
-            confidence = min(conf + bonus, 1.0)
-            LOG.debug("specific_query: title confidence={}".format(confidence))
-            url = self.sources["title"][title]["url"]
-            return (confidence, {"data": url, "name": title, "type": "title"})
-
-        # Check genre
-        match = re.match(self.translate_regex("genre"), phrase)
-        LOG.debug("genre specific_query: match={}".format(match))
-        if match:
-            bonus += 0.1
-            genre = match.groupdict()["genre"]
-            LOG.debug("genre specific_query: genre={}".format(genre))
-            genre, conf = self.get_best_genre(genre)
-            if not genre:
-                LOG.debug("specific_query: genre not found")
-                return None, None
-            confidence = min(conf + bonus, 1.0)
-            LOG.debug("specific_query: genre confidence={}".format(confidence))
-            genre_id = self.sources["genre"][genre]["genre_id"]
-            return (
-                confidence,
-                {"data": genre_id, "name": genre, "type": "genre"},
-            )
-
-        # Check music (genre)
-        match = re.match(self.translate_regex("music"), phrase)
-        LOG.debug("music specific_query: match={}".format(match))
-        if match:
-            bonus += 0.1
-            music = match.groupdict()["music"]
-            LOG.debug("music specific_query: music={}".format(music))
-            music, conf = self.get_best_genre(music)
-            if not music:
-                LOG.debug("specific_query: music not found")
-                return None, None
-            confidence = min(conf + bonus, 1.0)
-            LOG.debug("specific_query: music confidence={}".format(confidence))
-            genre_id = self.sources["genre"][music]["genre_id"]
-            return (
-                confidence,
-                {"data": genre_id, "name": music, "type": "genre"},
-            )
-
-        # Check playlist
-        match = re.match(self.translate_regex("playlist"), phrase)
-        LOG.debug("playlist specific_query: match={}".format(match))
-        if match:
-            bonus += 0.1
-            playlist = match.groupdict()["playlist"]
-            LOG.debug("playlist specific_query: playlist={}".format(playlist))
-            playlist, conf = self.get_best_playlist(playlist)
-            if not playlist:
-                LOG.debug("specific_query: playlist not found")
-                return None, None
-            confidence = min(conf + bonus, 1.0)
-            LOG.debug(
-                "specific_query: playlist confidence={}".format(confidence)
-            )
-            return (
-                confidence,
-                {"data": playlist, "name": playlist, "type": "playlist"},
-            )
-
-        # Check favorite
-        match = re.match(self.translate_regex("favorite"), phrase)
-        LOG.debug("favorite specific_query: match={}".format(match))
-        if match:
-            bonus += 0.1
-            favorite = match.groupdict()["favorite"]
-            LOG.debug("favorite specific_query: favorite={}".format(favorite))
-            favorite, conf = self.get_best_favorite(favorite)
-            if not favorite:
-                LOG.debug("specific_query: favorite not found")
-                return None, None
-            confidence = min(conf + bonus, 1.0)
-            LOG.debug(
-                "specific_query: favorite confidence={}".format(confidence)
-            )
-            favorite_id = self.sources["favorite"][favorite]["favorite_id"]
-            return (
-                confidence,
-                {"data": favorite_id, "name": favorite, "type": "favorite"},
-            )
-
-        # Check podcast
-        match = re.match(self.translate_regex("podcast"), phrase)
-        LOG.debug("podcast specific_query: match={}".format(match))
-        if match:
-            bonus += 0.1
-            podcast = match.groupdict()["podcast"]
-            LOG.debug("podcast specific_query: podcast={}".format(podcast))
-            podcast, conf = self.get_best_podcast(podcast)
-            if not podcast:
-                LOG.debug("specific_query: podcast not found")
-                return None, None
-            confidence = min(conf + bonus, 1.0)
-            LOG.debug(
-                "specific_query: podcast confidence={}".format(confidence)
-            )
-            podcast_id = self.sources["podcast"][podcast]["podcast_id"]
-            return (
-                confidence,
-                {"data": podcast_id, "name": podcast, "type": "podcast"},
-            )
-
-        return None, None
+        # Classify phrase (album, artist, title, genre, music, playlist,
+        # favorite or podcast, checked in that order)
+        query, entity = self.classifier.classify(phrase)
+        LOG.debug("specific_query: query={}".format(query))
+        if query is None:
+            return None, None
+        category, key, query_bonus = SPECIFIC_QUERIES[query]
+        bonus += query_bonus
+        LOG.debug("{} specific_query: {}={}".format(query, query, entity))
+        name, conf = getattr(self, "get_best_{}".format(category))(entity)
+        if not name:
+            LOG.debug("specific_query: {} not found".format(query))
+            return None, None
+        confidence = min(conf + bonus, 1.0)
+        LOG.debug(
+            "specific_query: {} confidence={}".format(query, confidence)
+        )
+        data = name if key is None else self.sources[category][name][key]
+        return (confidence, {"data": data, "name": name, "type": category})
 
     def generic_query(self, phrase, bonus):
         # Fallback to search all entries if type is unknown (slower)
         LOG.debug("generic_query: phrase={}, bonus={}".format(phrase, bonus))
-        playlist, conf = self.get_best_playlist(phrase)
-        if conf > 0.7:
-            return (
-                conf,
-                {"data": playlist, "name": playlist, "type": "playlist"},
-            )
-        favorite, conf = self.get_best_favorite(phrase)
-        if conf > 0.7:
-            favorite_id = self.sources["favorite"][favorite]["favorite_id"]
-            return (
-                conf,
-                {"data": favorite_id, "name": favorite, "type": "favorite"},
-            )
-        podcast, conf = self.get_best_podcast(phrase)
-        if conf > 0.7:
-            podcast_id = self.sources["podcast"][podcast]["podcast_id"]
-            return (
-                conf,
-                {"data": podcast_id, "name": podcast, "type": "podcast"},
-            )
-        genre, conf = self.get_best_genre(phrase)
-        if conf > 0.7:
-            genre_id = self.sources["genre"][genre]["genre_id"]
-            return (conf, {"data": genre_id, "name": genre, "type": "genre"})
-        artist, conf = self.get_best_artist(phrase)
-        if conf > 0.7:
-            artist_id = self.sources["artist"][artist]["artist_id"]
-            return (
-                conf,
-                {"data": artist_id, "name": artist, "type": "artist"},
+        # Categories are scored in priority order until one is good enough
+        matches = self.match_index.iter_best_per_category(
+            phrase.lower(), GENERIC_QUERY_CATEGORIES, self.sources
+        )
+        for category, (key, conf) in matches:
+            conf = conf / 100.0
+            LOG.debug(
+                "generic_query: {} key={}, confidence={}".format(
+                    category, key, conf
+                )
             )
-        album, conf = self.get_best_album(phrase)
-        if conf > 0.7:
-            album_id = self.sources["album"][album]["album_id"]
-            return (conf, {"data": album_id, "name": album, "type": "album"})
-        title, conf = self.get_best_title(phrase)
-        if conf > 0.7:
-            url = self.sources["title"][title]["url"]
-            return (conf, {"data": url, "name": title, "type": "title"})
+            if conf > 0.7:
+                if category == "playlist":
+                    data = key
+                elif category == "title":
+                    data = self.sources["title"][key]["url"]
+                else:
+                    data = self.sources[category][key][
+                        "{}_id".format(category)
+                    ]
+                return (conf, {"data": data, "name": key, "type": category})
 
         return None, None
 
     def CPS_start(self, phrase, data):
         LOG.debug("CPS_start: phrase={}, data={}".format(phrase, data))
+        timer = self.metrics.timer()
         LOG.info(
             "CPS_start: Playing {} ({}) on {} player".format(
                 data["name"], data["type"], data["backend"]
@@ -867,16 +1370,21 @@ class SqueezeBoxMediaSkill(CommonPlaySkill):
             "backend": data["backend"],
         }
         self.play_dialog("playingcontent.wav", "playing", dialog_data)
+        timer.checkpoint("start_dialog")
 
         if data["type"] == "continue":
             self.continue_current_playlist(None)
         elif data["type"] == "title":
             tracklist = []
-            # Get title url
-            url = self.sources["title"][data["name"]]["url"]
-            tracklist.append(url)
+            # Get title url (added by its library track id)
+            title = self.sources["title"][data["name"]]
+            tracklist.append(title["url"])
             try:
-                self.lms.play_tracklist(data["playerid"], tracklist)
+                self.lms.play_tracklist(
+                    data["playerid"],
+                    tracklist,
+                    {title["url"]: title.get("title_id")},
+                )
             except Exception as e:
                 self.log.exception()
         elif data["type"] == "album":
@@ -921,6 +1429,8 @@ class SqueezeBoxMediaSkill(CommonPlaySkill):
                 self.lms.play_podcast(data["playerid"], podcast)
             except Exception as e:
                 self.log.exception()
+        timer.checkpoint("start_command")
+        timer.total("start")
 
     def handle_pause(self, message):
         LOG.info("Handling pause request")
@@ -962,64 +1472,72 @@ class SqueezeBoxMediaSkill(CommonPlaySkill):
     def handle_volumeup(self, message):
         LOG.info("Handling volume up request")
         backend, playerid = self.get_playerid(message.data.get("backend"))
+        since = monotonic()
         self.lms.volumeup(playerid)
-        data = {"volume": self.lms.get_volume(playerid)}
+        data = {"volume": self.get_volume(playerid, since)}
         self.play_dialog("volumeup.wav", "volumeup", data)
 
     @intent_file_handler("VolumeDown.intent")
     def handle_volumedown(self, message):
         LOG.info("Handling volume down request")
         backend, playerid = self.get_playerid(message.data.get("backend"))
+        since = monotonic()
         self.lms.volumedown(playerid)
-        data = {"volume": self.lms.get_volume(playerid)}
+        data = {"volume": self.get_volume(playerid, since)}
         self.play_dialog("volumedown.wav", "volumedown", data)
 
     @intent_file_handler("VolumeQuarter.intent")
     def handle_volumequarter(self, message):
         LOG.info("Handling volume quarter request")
         backend, playerid = self.get_playerid(message.data.get("backend"))
+        since = monotonic()
         self.lms.volumeset(playerid, 25)
-        data = {"volume": self.lms.get_volume(playerid)}
+        data = {"volume": self.get_volume(playerid, since)}
         self.play_dialog("volumeset.wav", "volumeset", data)
 
     @intent_file_handler("VolumeHalf.intent")
     def handle_volumehalf(self, message):
         LOG.info("Handling volume half request")
         backend, playerid = self.get_playerid(message.data.get("backend"))
+        since = monotonic()
         self.lms.volumeset(playerid, 50)
-        data = {"volume": self.lms.get_volume(playerid)}
+        data = {"volume": self.get_volume(playerid, since)}
         self.play_dialog("volumeset.wav", "volumeset", data)
 
     @intent_file_handler("VolumeThreeQuarters.intent")
     def handle_volumethreequarters(self, message):
         LOG.info("Handling volume threequarters request")
         backend, playerid = self.get_playerid(message.data.get("backend"))
+        since = monotonic()
         self.lms.volumeset(playerid, 75)
-        data = {"volume": self.lms.get_volume(playerid)}
+        data = {"volume": self.get_volume(playerid, since)}
         self.play_dialog("volumeset.wav", "volumeset", data)
 
     @intent_file_handler("VolumeMax.intent")
     def handle_volumemax(self, message):
         LOG.info("Handling volume max request")
         backend, playerid = self.get_playerid(message.data.get("backend"))
+        since = monotonic()
         self.lms.volumeset(playerid, 100)
-        data = {"volume": self.lms.get_volume(playerid)}
+        data = {"volume": self.get_volume(playerid, since)}
         self.play_dialog("volumeset.wav", "volumeset", data)
 
     @intent_file_handler("VolumeMute.intent")
     def handle_volumemute(self, message):
         LOG.info("Handling volume mute request")
         backend, playerid = self.get_playerid(message.data.get("backend"))
+        since = monotonic()
         self.lms.volumemute(playerid)
-        data = {"volume": self.lms.get_volume(playerid)}
+        data = {"volume": self.get_volume(playerid, since)}
         self.play_dialog("volumemute.wav", "volumemute", data)
 
     @intent_file_handler("VolumeUnmute.intent")
     def handle_volumeunmute(self, message):
         LOG.info("Handling volume unmute request")
         backend, playerid = self.get_playerid(message.data.get("backend"))
+        since = monotonic()
         self.lms.volumeunmute(playerid)
-        data = {"volume": self.lms.get_volume(playerid)}
+        data = {"volume": self.get_volume(playerid, since)}
         self.play_dialog("volumeunmute.wav", "volumeunmute", data)
 
     @intent_file_handler("PowerOff.intent")
@@ -1042,13 +1560,13 @@ class SqueezeBoxMediaSkill(CommonPlaySkill):
     def handle_identifytrack(self, message):
         LOG.info("Handling identify track request")
         backend, playerid = self.get_playerid(message.data.get("backend"))
-        mode = self.lms.get_current_mode(playerid)
+        mode = self.get_current_mode(playerid)
         if mode == "play":
             try:
-                artist = self.lms.get_current_artist(playerid)
+                artist = self.get_current_artist(playerid)
             except Exception as e:
                 artist = None
-            title = self.lms.get_current_title(playerid)
+            title = self.get_current_title(playerid)
             if not artist:
                 data = {"title": title}
                 self.play_dialog(None, "identifynoartist", data)
@@ -1062,13 +1580,33 @@ class SqueezeBoxMediaSkill(CommonPlaySkill):
     @intent_file_handler("UpdateCache.intent")
     def handle_updatecache(self, message):
         LOG.info("Handling update cache request")
-        if self.update_library_cache():
+        if not self.cache_lock.acquire(blocking=False):
+            LOG.info("Refresh already running. Not updating cache.")
+            self.play_dialog("cachenotupdated.wav", "cachenotupdated", {})
+            return
+        self.refresh_cycle = RefreshCycle(self.lms)
+        try:
+            updated = self.update_library_cache()
+        finally:
+            self.cache_lock.release()
+            LOG.info("Refresh cycle: {}".format(self.refresh_cycle.summary()))
+            self.refresh_cycle = None
+        if updated:
             data = {}
             self.play_dialog("cacheupdated.wav", "cacheupdated", data)
         else:
             data = {}
             self.play_dialog("cachenotupdated.wav", "cachenotupdated", data)
 
+    # Stop following player state (and write stage metrics) when the skill
+    # is unloaded
+    def shutdown(self):
+        if self.player_states is not None:
+            self.player_states.stop()
+        if self.metrics.enabled:
+            self.write_metrics()
+        super().shutdown()
+
 
 def create_skill():
     return SqueezeBoxMediaSkill()
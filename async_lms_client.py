@@ -0,0 +1,441 @@
+import asyncio
+import base64
+import json
+from .lms_client import (
+    BATCH_SIZE,
+    POOL_SIZE,
+    STATUS_TAGS,
+    TIMEOUT,
+    library_track_ids,
+    status_snapshot,
+)
+
+__author__ = "johanpalmqvist"
+
+
+# Raised when a reused idle connection is closed by LMS before any of the
+# response arrives (LMS closes idle keep-alive connections)
+class StaleConnectionError(ConnectionError):
+    pass
+
+
+# Asyncio LMS client with the command surface of LMSClient. Requests share a
+# pool of keep-alive connections, at most pool_size run at once and a
+# cancelled request closes its connection instead of returning it to the
+# pool.
+class AsyncLMSClient(object):
+    def __init__(
+        self,
+        lms_server,
+        lms_port,
+        lms_username,
+        lms_password,
+        pool_size=POOL_SIZE,
+        keep_alive=True,
+        timeout=TIMEOUT,
+    ):
+        self.lms_server = lms_server
+        self.lms_port = int(lms_port or 9000)
+        self.pool_size = pool_size
+        self.keep_alive = keep_alive
+        self.timeout = timeout
+        self.headers = {
+            "Host": "{}:{}".format(self.lms_server, self.lms_port),
+            "X-Requested-With": "XMLHttpRequest",
+            "Content-Type": "application/json",
+            "Connection": "keep-alive" if keep_alive else "close",
+        }
+        if lms_username and lms_password:
+            self.headers["Authorization"] = "Basic {}".format(
+                base64.b64encode(
+                    "{}:{}".format(lms_username, lms_password).encode("utf-8")
+                ).decode("ascii")
+            )
+        # Idle (reader, writer) connections
+        self.connections = []
+        # Limits concurrent requests (created on first request so it belongs
+        # to the running event loop)
+        self.limit = None
+        # Number of requests sent to LMS (for statistics)
+        self.request_count = 0
+
+    # Create client with the connection settings of an LMSClient
+    @classmethod
+    def from_client(cls, lms):
+        return cls(
+            lms.lms_server,
+            lms.lms_port,
+            lms.lms_username,
+            lms.lms_password,
+            lms.pool_size,
+            lms.headers.get("Connection") != "close",
+        )
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc_value, traceback):
+        await self.close()
+
+    # Close pooled connections
+    async def close(self):
+        connections, self.connections = self.connections, []
+        for _, writer in connections:
+            writer.close()
+        for _, writer in connections:
+            try:
+                await writer.wait_closed()
+            except Exception:
+                pass
+
+    # Send JSON-RPC request to LMS. It is sent again (on a new connection)
+    # only if a reused idle connection was closed without any response, as
+    # commands like "mixer volume +5" are not safe to repeat.
+    async def lms_request(self, payload):
+        self.request_count += 1
+        if self.limit is None:
+            self.limit = asyncio.Semaphore(self.pool_size)
+        body = json.dumps(payload).encode("utf-8")
+        async with self.limit:
+            try:
+                try:
+                    return await asyncio.wait_for(
+                        self.post(body, pooled=True), self.timeout
+                    )
+                except StaleConnectionError:
+                    return await asyncio.wait_for(
+                        self.post(body, pooled=False), self.timeout
+                    )
+            except Exception as e:
+                raise Exception(
+                    "Could not connect to server {}:{}: {}".format(
+                        self.lms_server,
+                        self.lms_port,
+                        e or e.__class__.__name__,
+                    )
+                )
+
+    # Post JSON-RPC body over a pooled (or new) connection, returning the
+    # decoded response
+    async def post(self, body, pooled=True):
+        reused = pooled and bool(self.connections)
+        if reused:
+            reader, writer = self.connections.pop()
+        else:
+            reader, writer = await asyncio.open_connection(
+                self.lms_server, self.lms_port
+            )
+        reusable = False
+        try:
+            writer.write(self._request_head(len(body)) + body)
+            await writer.drain()
+            response, reusable = await self._read_response(reader, reused)
+            return json.loads(response.decode("utf-8"))
+        finally:
+            if reusable and self.keep_alive:
+                self.connections.append((reader, writer))
+            else:
+                writer.close()
+
+    # Send command (list of command arguments) to player (or server if
+    # playerid is empty), returning the JSON-RPC response
+    async def command(self, playerid, command):
+        payload = {
+            "id": 1,
+            "method": "slim.request",
+            "params": [playerid, command],
+        }
+        return await self.lms_request(payload)
+
+    # Get result of command sent to player
+    async def query(self, playerid, command):
+        return (await self.command(playerid, command))["result"]
+
+    # Get players from LMS
+    async def get_players(self):
+        return list((await self.query("", ["players", ""]))["players_loop"])
+
+    # Get favorites from LMS
+    async def get_favorites(self):
+        result = await self.query("", ["favorites", "items", 0, 1000])
+        return result["loop_loop"]
+
+    # Get playlists from LMS
+    async def get_playlists(self):
+        result = await self.query("browselibrary", ["playlists", "items"])
+        return result["playlists_loop"]
+
+    # Get podcasts from LMS
+    async def get_podcasts(self, playerid):
+        result = await self.query(playerid, ["podcasts", "items", 0, 1000])
+        return result["loop_loop"]
+
+    # Get podcast episodes from LMS
+    async def get_podcasts_episodes(self, playerid, podcast_id):
+        result = await self.query(
+            playerid,
+            ["podcasts", "items", 0, 1000, "item_id: {}".format(podcast_id)],
+        )
+        return result["loop_loop"]
+
+    # Get latest podcast episode from LMS
+    async def get_podcasts_episodes_latest(self, playerid, podcast_id):
+        result = await self.query(
+            playerid,
+            ["podcasts", "items", 0, 1, "item_id: {}".format(podcast_id)],
+        )
+        return result["loop_loop"]
+
+    # Get time of last library scan from LMS
+    async def get_library_last_scan(self):
+        result = await self.query("", ["serverstatus", 0, 0])
+        return result.get("lastscan")
+
+    # Get library total duration from LMS
+    async def get_library_total_duration(self):
+        result = await self.query("query", ["info", "total", "duration", "?"])
+        return result["_duration"]
+
+    # Set playlist shuffle and repeat (concurrently)
+    async def playlist_mode(self, playerid, shuffle, repeat):
+        await asyncio.gather(
+            self.playlist_shuffle(playerid, shuffle),
+            self.playlist_repeat(playerid, repeat),
+        )
+
+    # Add artist to playlist and start playback
+    async def play_artist(self, playerid, artist_id):
+        await self.playlist_mode(playerid, 1, 2)
+        return await self.command(
+            playerid,
+            ["playlist", "loadtracks", "contributor.id={}".format(artist_id)],
+        )
+
+    # Add album to playlist and start playback
+    async def play_album(self, playerid, album_id):
+        await self.playlist_mode(playerid, 1, 2)
+        return await self.command(
+            playerid,
+            ["playlist", "loadtracks", "album.id={}".format(album_id)],
+        )
+
+    # Add genre to playlist and start playback
+    async def play_genre(self, playerid, genre_id):
+        await self.playlist_mode(playerid, 1, 2)
+        return await self.command(
+            playerid,
+            ["playlist", "loadtracks", "genre.id={}".format(genre_id)],
+        )
+
+    # Add tracklist to playlist and start playback (playback starts with
+    # the first track while the rest are still being queued). Library
+    # tracks are added by track id if track_ids maps their urls/paths.
+    async def play_tracklist(self, playerid, tracklist, track_ids=None):
+        tracklist = library_track_ids(tracklist, track_ids)
+        await self.playlist_clear(playerid)
+        await self.playlist_mode(playerid, 1, 2)
+        if not tracklist:
+            return None
+        await self.playlist_add_tracks(playerid, tracklist[:1])
+        response = await self.command(playerid, ["play"])
+        await self.playlist_add_tracks(playerid, tracklist[1:])
+        return response
+
+    # Add tracks to playlist in order. Consecutive library track ids are
+    # added up to BATCH_SIZE at a time with a single playlistcontrol
+    # request, other tracks (urls/paths) with one request each.
+    async def playlist_add_tracks(self, playerid, tracklist):
+        batch = []
+        for track in tracklist:
+            if str(track).isdigit():
+                batch.append(str(track))
+                if len(batch) == BATCH_SIZE:
+                    await self.playlist_add_track_ids(playerid, batch)
+                    batch = []
+                continue
+            if batch:
+                await self.playlist_add_track_ids(playerid, batch)
+                batch = []
+            await self.playlist_add(playerid, track)
+        if batch:
+            await self.playlist_add_track_ids(playerid, batch)
+
+    # Add library tracks (track ids) to playlist
+    async def playlist_add_track_ids(self, playerid, track_ids):
+        return await self.command(
+            playerid,
+            [
+                "playlistcontrol",
+                "cmd:add",
+                "track_id:{}".format(",".join(track_ids)),
+            ],
+        )
+
+    # Add track to playlist
+    async def playlist_add(self, playerid, track):
+        return await self.command(playerid, ["playlist", "add", track])
+
+    # Add favorite to playlist and start playback
+    async def play_favorite(self, playerid, favorite_id):
+        await self.playlist_mode(playerid, 0, 0)
+        return await self.command(
+            playerid,
+            [
+                "favorites",
+                "playlist",
+                "play",
+                "item_id:{}".format(favorite_id),
+            ],
+        )
+
+    # Add podcast to playlist and start playback
+    async def play_podcast(self, playerid, podcast_id):
+        await self.playlist_mode(playerid, 0, 0)
+        return await self.command(
+            playerid,
+            ["podcasts", "playlist", "play", "item_id:{}".format(podcast_id)],
+        )
+
+    # Load playlist from server and start playback
+    async def play_playlist(self, playerid, playlist):
+        await self.playlist_mode(playerid, 1, 2)
+        return await self.command(
+            playerid,
+            [
+                "playlist",
+                "play",
+                "/var/lib/squeezeboxserver/playlists/{}.m3u".format(playlist),
+            ],
+        )
+
+    # Clear playlist
+    async def playlist_clear(self, playerid):
+        return await self.command(playerid, ["playlist", "clear"])
+
+    # Set playlist repeat
+    async def playlist_repeat(self, playerid, repeat):
+        return await self.command(playerid, ["playlist", "repeat", repeat])
+
+    # Set playlist shuffle
+    async def playlist_shuffle(self, playerid, shuffle):
+        return await self.command(playerid, ["playlist", "shuffle", shuffle])
+
+    # Pause playback
+    async def pause_playlist(self, playerid):
+        return await self.command(playerid, ["pause"])
+
+    # Resume playback
+    async def resume_playlist(self, playerid):
+        return await self.command(playerid, ["play"])
+
+    # Stop playback
+    async def stop_playlist(self, playerid):
+        return await self.command(playerid, ["stop"])
+
+    # Play next track in playlist
+    async def nexttrack_playlist(self, playerid):
+        return await self.command(playerid, ["playlist", "jump", "+1"])
+
+    # Play previous track in playlist
+    async def previoustrack_playlist(self, playerid):
+        return await self.command(playerid, ["playlist", "jump", "-1"])
+
+    # Increase volume
+    async def volumeup(self, playerid):
+        return await self.command(playerid, ["mixer", "volume", "+5"])
+
+    # Decrease volume
+    async def volumedown(self, playerid):
+        return await self.command(playerid, ["mixer", "volume", "-5"])
+
+    # Set volume
+    async def volumeset(self, playerid, volume):
+        return await self.command(playerid, ["mixer", "volume", volume])
+
+    # Mute volume
+    async def volumemute(self, playerid):
+        return await self.command(playerid, ["mixer", "muting", "1"])
+
+    # Unmute volume
+    async def volumeunmute(self, playerid):
+        return await self.command(playerid, ["mixer", "muting", "0"])
+
+    # Get player status snapshot (same as LMSClient.get_status)
+    async def get_status(self, playerid):
+        result = await self.query(
+            playerid, ["status", "-", 1, "tags:{}".format(STATUS_TAGS)]
+        )
+        return status_snapshot(result)
+
+    # Get volume
+    async def get_volume(self, playerid):
+        return (await self.get_status(playerid))["volume"]
+
+    # Get current player mode status
+    async def get_current_mode(self, playerid):
+        return (await self.get_status(playerid))["mode"]
+
+    # Get artist currently playing
+    async def get_current_artist(self, playerid):
+        return (await self.query(playerid, ["artist", "?"]))["_artist"]
+
+    # Get title currently playing
+    async def get_current_title(self, playerid):
+        return (await self.query(playerid, ["title", "?"]))["_title"]
+
+    # Power off
+    async def power_off(self, playerid):
+        return await self.command(playerid, ["power", "0"])
+
+    # Power on
+    async def power_on(self, playerid):
+        return await self.command(playerid, ["power", "1"])
+
+    def _request_head(self, length):
+        lines = ["POST /jsonrpc.js HTTP/1.1"]
+        lines.extend(
+            "{}: {}".format(name, value)
+            for name, value in self.headers.items()
+        )
+        lines.append("Content-Length: {}".format(length))
+        return ("\r\n".join(lines) + "\r\n\r\n").encode("latin-1")
+
+    # Read HTTP response, returning (body, connection reusable)
+    async def _read_response(self, reader, reused=False):
+        status = await reader.readline()
+        if not status:
+            if reused:
+                raise StaleConnectionError("Idle connection closed by server")
+            raise ConnectionError("Connection closed by server")
+        parts = status.decode("latin-1").split(None, 2)
+        if len(parts) < 2 or not parts[1].isdigit():
+            raise ConnectionError("Invalid response: {!r}".format(status))
+        headers = {}
+        while True:
+            line = await reader.readline()
+            if line in (b"\r\n", b"\n", b""):
+                break
+            name, _, value = line.decode("latin-1").partition(":")
+            headers[name.strip().lower()] = value.strip()
+        reusable = headers.get("connection", "").lower() != "close"
+        if headers.get("transfer-encoding", "").lower() == "chunked":
+            body = b""
+            while True:
+                size = int((await reader.readline()).split(b";")[0], 16)
+                if not size:
+                    await reader.readline()
+                    break
+                body += await reader.readexactly(size)
+                await reader.readexactly(2)
+        elif "content-length" in headers:
+            body = await reader.readexactly(int(headers["content-length"]))
+        else:
+            body = await reader.read()
+            reusable = False
+        if int(parts[1]) >= 400:
+            raise Exception(
+                "HTTP {}: {}".format(
+                    parts[1], parts[2].strip() if len(parts) > 2 else ""
+                )
+            )
+        return body, reusable
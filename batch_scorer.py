@@ -0,0 +1,142 @@
+from fuzzywuzzy import fuzz
+from fuzzywuzzy.fuzz import ratio
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+__author__ = "johanpalmqvist"
+
+# Scorer backends (fuzzywuzzy scores one key at a time, numpy scores a
+# packed array of keys at once)
+BACKENDS = ("fuzzywuzzy", "numpy")
+
+# Longest processed query scored in bulk (one bit per query character)
+MAX_QUERY_LENGTH = 64
+
+
+# Check if the numpy backend can be used. It computes the Levenshtein
+# ratio (1 - indel distance / total length) which is what fuzzywuzzy scores
+# with when python-Levenshtein is installed (not its difflib fallback).
+def numpy_available():
+    return np is not None and fuzz.SequenceMatcher.__module__.endswith(
+        "StringMatcher"
+    )
+
+
+# Processed keys packed into a 2D array of ASCII codes (rows sorted by
+# length, longest first) for scoring a query against all of them at once
+class PackedKeys(object):
+    def __init__(self, processed):
+        self.processed = list(processed)
+        lengths = np.array([len(key) for key in self.processed], dtype=np.intp)
+        # Rows in order of decreasing length so a column only involves a
+        # prefix of the rows
+        self.order = np.argsort(-lengths, kind="stable")
+        self.lengths = lengths[self.order]
+        width = int(self.lengths[0]) if len(self.lengths) else 0
+        self.chars = np.zeros((len(self.processed), width), dtype=np.uint8)
+        self.packable = True
+        for row, position in enumerate(self.order):
+            try:
+                encoded = self.processed[position].encode("ascii")
+            except UnicodeEncodeError:
+                self.packable = False
+                break
+            self.chars[row, : len(encoded)] = np.frombuffer(
+                encoded, dtype=np.uint8
+            )
+        # Number of rows longer than each column
+        self.active = np.searchsorted(
+            -self.lengths, -np.arange(width), side="left"
+        )
+
+    def __len__(self):
+        return len(self.processed)
+
+    # Get best (position, score) for processed query among positions (all if
+    # None), with the first position winning ties like extractOne
+    def best(self, processed_query, positions=None):
+        if not len(self.processed):
+            return None, 0
+        scores = self.scores(processed_query, positions)
+        best = int(np.argmax(scores))
+        if positions is not None:
+            return positions[best], int(scores[best])
+        return best, int(scores[best])
+
+    # Get scores (0-100, same as QRatio) of processed query against keys at
+    # positions (all if None), in the order of positions
+    def scores(self, processed_query, positions=None):
+        count = len(self.processed) if positions is None else len(positions)
+        if not processed_query:
+            return np.zeros(count, dtype=np.intp)
+        try:
+            query = processed_query.encode("ascii")
+        except UnicodeEncodeError:
+            query = None
+        if (
+            query is None
+            or len(query) > MAX_QUERY_LENGTH
+            or not self.packable
+        ):
+            keys = (
+                self.processed
+                if positions is None
+                else [self.processed[position] for position in positions]
+            )
+            return np.array(
+                [ratio(processed_query, key) for key in keys], dtype=np.intp
+            )
+        if positions is None:
+            chars, lengths, active = self.chars, self.lengths, self.active
+            order = self.order
+        else:
+            # Rows of positions (still longest first)
+            rank = np.empty(len(self.order), dtype=np.intp)
+            rank[self.order] = np.arange(len(self.order))
+            rows = rank[np.asarray(positions, dtype=np.intp)]
+            order = np.argsort(rows, kind="stable")
+            rows = rows[order]
+            chars, lengths = self.chars[rows], self.lengths[rows]
+            active = np.searchsorted(
+                -lengths, -np.arange(chars.shape[1]), side="left"
+            )
+        common = _lcs_lengths(query, chars, lengths, active)
+        total = len(query) + lengths
+        scores = np.zeros(len(lengths), dtype=np.intp)
+        nonempty = lengths > 0
+        # Computed as python-Levenshtein does (1 - distance / total) so
+        # halves round the same way
+        distance = total[nonempty] - 2 * common[nonempty]
+        scores[nonempty] = np.rint(100 * (1.0 - distance / total[nonempty]))
+        # Back to the order of positions (or of the keys)
+        result = np.empty(len(scores), dtype=np.intp)
+        result[order] = scores
+        return result
+
+
+# Get length of the longest common subsequence of query (ASCII bytes, at
+# most 64) and each row of chars (bit-parallel, all rows at once)
+def _lcs_lengths(query, chars, lengths, active):
+    masks = np.zeros(256, dtype=np.uint64)
+    for i, char in enumerate(query):
+        masks[char] |= np.uint64(1 << i)
+    v = np.full(len(lengths), np.iinfo(np.uint64).max, dtype=np.uint64)
+    for column in range(chars.shape[1]):
+        rows = int(active[column])
+        if not rows:
+            break
+        current = v[:rows]
+        u = current & masks[chars[:rows, column]]
+        v[:rows] = (current + u) | (current - u)
+    unset = ~v & np.uint64((1 << len(query)) - 1)
+    return _popcount(unset)
+
+
+def _popcount(values):
+    if hasattr(np, "bitwise_count"):
+        return np.bitwise_count(values).astype(np.intp)
+    table = np.array([bin(i).count("1") for i in range(256)], dtype=np.intp)
+    return table[values.view(np.uint8)].reshape(-1, 8).sum(axis=1)
@@ -0,0 +1,145 @@
+import socket
+from socketserver import StreamRequestHandler, ThreadingTCPServer
+from threading import Lock, Thread
+from urllib.parse import quote, unquote
+
+__author__ = "johanpalmqvist"
+
+
+# Local stand-in for the Logitech Media Server command line interface (port
+# 9090) as used by PlayerStateCache: answers login, subscribe, players and
+# status, and sends player notifications (see notify) to subscribed
+# connections. Commands received are recorded (unquoted tokens).
+class FakeCLIServer(object):
+    def __init__(self, players=("Living Room",), host="127.0.0.1", port=0):
+        self.players = [
+            {"name": name, "playerid": "00:04:20:00:00:{:02x}".format(i)}
+            for i, name in enumerate(players)
+        ]
+        self.states = {
+            player["playerid"]: {
+                "mode": "stop",
+                "mixer volume": 50,
+                "power": 1,
+                "title": "",
+                "artist": "",
+            }
+            for player in self.players
+        }
+        self.commands = []
+        self.subscribers = []
+        self.lock = Lock()
+        self.server = ThreadingTCPServer((host, port), _Handler)
+        self.server.daemon_threads = True
+        self.server.cli = self
+        self.thread = None
+
+    @property
+    def port(self):
+        return self.server.server_address[1]
+
+    # Start serving in a background thread
+    def start(self):
+        self.thread = Thread(
+            target=self.server.serve_forever, name="FakeCLI", daemon=True
+        )
+        self.thread.start()
+        return self
+
+    # Stop serving (closing subscribed connections)
+    def stop(self):
+        with self.lock:
+            subscribers, self.subscribers = self.subscribers, []
+        for handler in subscribers:
+            handler.close()
+        self.server.shutdown()
+        self.server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+    # Get number of subscribed connections
+    def subscriber_count(self):
+        with self.lock:
+            return len(self.subscribers)
+
+    # Change state of player (status tags, e.g. {"mixer volume": 30}) and
+    # send notification (tokens, e.g. ["mixer", "volume", "30"]) to
+    # subscribed connections
+    def notify(self, playerid, tokens, state=None):
+        with self.lock:
+            self.states[playerid].update(state or {})
+            subscribers = list(self.subscribers)
+        for handler in subscribers:
+            handler.write_tokens([playerid] + list(tokens))
+
+    # Answer command (list of unquoted tokens) received by handler,
+    # returning the tokens of the reply (None for no reply)
+    def execute(self, handler, tokens):
+        with self.lock:
+            self.commands.append(tokens)
+            if tokens[0] == "login":
+                return tokens[:2] + ["******"]
+            if tokens[0] == "subscribe":
+                if handler not in self.subscribers:
+                    self.subscribers.append(handler)
+                return tokens
+            if tokens[0] == "players":
+                reply = tokens[:3] + ["count:{}".format(len(self.players))]
+                for i, player in enumerate(self.players):
+                    reply += [
+                        "playerindex:{}".format(i),
+                        "playerid:{}".format(player["playerid"]),
+                        "name:{}".format(player["name"]),
+                    ]
+                return reply
+            if len(tokens) > 1 and tokens[1] == "status":
+                state = self.states.get(tokens[0])
+                if state is None:
+                    return None
+                return tokens + [
+                    "{}:{}".format(name, value)
+                    for name, value in state.items()
+                ]
+            return tokens
+
+
+class _Handler(StreamRequestHandler):
+    def setup(self):
+        super().setup()
+        self.write_lock = Lock()
+
+    def handle(self):
+        cli = self.server.cli
+        for line in self.rfile:
+            tokens = [
+                unquote(token)
+                for token in line.decode("utf-8").strip().split(" ")
+            ]
+            if not tokens[0]:
+                continue
+            reply = cli.execute(self, tokens)
+            if reply is not None:
+                self.write_tokens(reply)
+        with cli.lock:
+            if self in cli.subscribers:
+                cli.subscribers.remove(self)
+
+    # Send line of tokens (quoted as the CLI does)
+    def write_tokens(self, tokens):
+        line = " ".join(quote(str(token), safe="") for token in tokens)
+        with self.write_lock:
+            try:
+                self.wfile.write("{}\n".format(line).encode("utf-8"))
+            except OSError:
+                pass
+
+    # Close connection (ends handle)
+    def close(self):
+        try:
+            self.connection.shutdown(socket.SHUT_RDWR)
+        except OSError:
+            pass
@@ -0,0 +1,417 @@
+import json
+import random
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from threading import Lock, Thread
+from time import sleep
+from synthetic_library import TAG_FIELDS
+
+__author__ = "johanpalmqvist"
+
+# Tags returned by the titles command unless given
+TITLES_TAGS = "al"
+
+# Tagged parameters (name:value) of commands
+TAGGED_PARAMETERS = ("album_id", "cmd", "item_id", "tags", "track_id")
+
+# Seconds of music per track (for info total duration)
+TRACK_DURATION = 240
+
+
+# Local stand-in for the Logitech Media Server JSON-RPC interface
+# (/jsonrpc.js) serving a synthetic library and players. Implements the
+# slim.request commands LMSClient and AsyncLMSClient send, keeps player
+# state (mode, volume, power, playlist) and counts requests per command.
+# Every request is delayed by latency seconds, and fails (HTTP 500) with
+# probability failure_rate or when its command is in fail_commands.
+class FakeLMSServer(object):
+    def __init__(
+        self,
+        library,
+        items=None,
+        players=("Living Room",),
+        latency=0.0,
+        failure_rate=0.0,
+        fail_commands=(),
+        seed=0,
+        host="127.0.0.1",
+        port=0,
+    ):
+        self.library = library
+        self.items = items or {}
+        self.tracks = {track["id"]: track for track in library}
+        self.urls = {track.get("url"): track for track in library}
+        self.players = [
+            {
+                "name": name,
+                "playerid": "00:04:20:00:00:{:02x}".format(i),
+                "connected": 1,
+                "isplaying": 0,
+            }
+            for i, name in enumerate(players)
+        ]
+        self.states = {
+            player["playerid"]: {
+                "mode": "stop",
+                "volume": 50,
+                "muted": False,
+                "power": 1,
+                "playlist": [],
+                "index": 0,
+                "shuffle": 0,
+                "repeat": 0,
+            }
+            for player in self.players
+        }
+        self.latency = latency
+        self.failure_rate = failure_rate
+        self.fail_commands = set(fail_commands)
+        self.random = random.Random(seed)
+        self.requests = Counter()
+        self.failures = Counter()
+        self.lock = Lock()
+        self.server = ThreadingHTTPServer((host, port), _Handler)
+        self.server.daemon_threads = True
+        self.server.lms = self
+        self.thread = None
+
+    @property
+    def port(self):
+        return self.server.server_address[1]
+
+    # Start serving in a background thread
+    def start(self):
+        self.thread = Thread(
+            target=self.server.serve_forever, name="FakeLMS", daemon=True
+        )
+        self.thread.start()
+        return self
+
+    # Stop serving
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+    # Forget request and failure counts
+    def reset(self):
+        with self.lock:
+            self.requests.clear()
+            self.failures.clear()
+
+    # Get total number of requests served
+    def request_count(self):
+        with self.lock:
+            return sum(self.requests.values())
+
+    # Handle JSON-RPC request, returning (HTTP status, response)
+    def handle(self, request):
+        playerid, command = request["params"]
+        command = [str(arg) for arg in command]
+        name = _command_name(command)
+        with self.lock:
+            self.requests[name] += 1
+            failed = (
+                command[0] in self.fail_commands
+                or name in self.fail_commands
+                or self.random.random() < self.failure_rate
+            )
+            if failed:
+                self.failures[name] += 1
+        if self.latency:
+            sleep(self.latency)
+        if failed:
+            return 500, {"error": "injected failure"}
+        with self.lock:
+            result = self.execute(playerid, command)
+        return 200, {
+            "id": request.get("id"),
+            "method": "slim.request",
+            "params": request["params"],
+            "result": result,
+        }
+
+    # Execute command, returning its result
+    def execute(self, playerid, command):
+        args, tags = _split_tags(command[1:])
+        handler = getattr(self, "command_{}".format(command[0]), None)
+        if handler is None:
+            return {}
+        return handler(playerid, args, tags)
+
+    def command_players(self, playerid, args, tags):
+        return {"count": len(self.players), "players_loop": self.players}
+
+    def command_serverstatus(self, playerid, args, tags):
+        return {"lastscan": "1500000000", "player count": len(self.players)}
+
+    def command_info(self, playerid, args, tags):
+        return {"_duration": TRACK_DURATION * len(self.library)}
+
+    def command_titles(self, playerid, args, tags):
+        titles = self.library
+        if "album_id" in tags:
+            titles = [
+                title
+                for title in titles
+                if str(title.get("album_id")) == tags["album_id"]
+            ]
+        start, count = _page(args, len(titles))
+        fields = {
+            field
+            for tag in tags.get("tags", TITLES_TAGS)
+            for field in TAG_FIELDS.get(tag, ())
+        }
+        return {
+            "count": len(titles),
+            "titles_loop": [
+                {
+                    name: value
+                    for name, value in title.items()
+                    if name in ("id", "title") or name in fields
+                }
+                for title in titles[start : start + count]
+            ],
+        }
+
+    def command_favorites(self, playerid, args, tags):
+        if args[:2] == ["playlist", "play"]:
+            return self.play(playerid, [tags.get("item_id")])
+        favorites = self.items.get("favorite", [])
+        start, count = _page(args[1:], len(favorites))
+        return {
+            "count": len(favorites),
+            "loop_loop": favorites[start : start + count],
+        }
+
+    def command_podcasts(self, playerid, args, tags):
+        if args[:2] == ["playlist", "play"]:
+            return self.play(playerid, [tags.get("item_id")])
+        if "item_id" in tags:
+            episodes = [
+                {
+                    "id": "{}.{}".format(tags["item_id"].strip(), i),
+                    "name": "Episode {}".format(i),
+                    "isaudio": 1,
+                    "hasitems": 0,
+                }
+                for i in range(1, 11)
+            ]
+            start, count = _page(args[1:], len(episodes))
+            return {
+                "count": len(episodes),
+                "loop_loop": episodes[start : start + count],
+            }
+        podcasts = self.items.get("podcast", [])
+        start, count = _page(args[1:], len(podcasts))
+        return {
+            "count": len(podcasts),
+            "loop_loop": podcasts[start : start + count],
+        }
+
+    def command_playlists(self, playerid, args, tags):
+        playlists = self.items.get("playlist", [])
+        return {"count": len(playlists), "playlists_loop": playlists}
+
+    def command_playlist(self, playerid, args, tags):
+        state = self.states.get(playerid)
+        if state is None or not args:
+            return {}
+        action = args[0]
+        if action == "loadtracks" and len(args) > 1:
+            field, _, value = args[1].partition("=")
+            field = {
+                "album.id": "album_id",
+                "contributor.id": "artist_id",
+                "genre.id": "genre_id",
+            }.get(field)
+            return self.play(
+                playerid,
+                [
+                    track["id"]
+                    for track in self.library
+                    if str(track.get(field)) == value
+                ],
+            )
+        if action == "play" and len(args) > 1:
+            return self.play(playerid, [args[1]])
+        if action == "add" and len(args) > 1:
+            state["playlist"].append(args[1])
+        elif action == "clear":
+            state["playlist"] = []
+            state["index"] = 0
+            state["mode"] = "stop"
+        elif action == "jump" and len(args) > 1 and state["playlist"]:
+            state["index"] = (state["index"] + int(args[1])) % len(
+                state["playlist"]
+            )
+        elif action in ("shuffle", "repeat") and len(args) > 1:
+            state[action] = int(args[1])
+        return {}
+
+    def command_playlistcontrol(self, playerid, args, tags):
+        state = self.states.get(playerid)
+        if state is not None and tags.get("cmd") == "add":
+            state["playlist"].extend(
+                int(track) for track in tags.get("track_id", "").split(",")
+            )
+        return {"count": len(state["playlist"]) if state else 0}
+
+    def command_play(self, playerid, args, tags):
+        return self.set_mode(playerid, "play")
+
+    def command_pause(self, playerid, args, tags):
+        return self.set_mode(playerid, "pause")
+
+    def command_stop(self, playerid, args, tags):
+        return self.set_mode(playerid, "stop")
+
+    def command_mixer(self, playerid, args, tags):
+        state = self.states.get(playerid)
+        if state is None or len(args) < 2:
+            return {}
+        if args[0] == "volume":
+            if args[1] == "?":
+                return {"_volume": state["volume"]}
+            if args[1][0] in "+-":
+                volume = state["volume"] + int(args[1])
+            else:
+                volume = int(args[1])
+            state["volume"] = max(0, min(100, volume))
+            state["muted"] = False
+        elif args[0] == "muting":
+            state["muted"] = args[1] == "1"
+        return {}
+
+    def command_power(self, playerid, args, tags):
+        state = self.states.get(playerid)
+        if state is not None and args and args[0] != "?":
+            state["power"] = int(args[0])
+            if not state["power"]:
+                state["mode"] = "stop"
+        return {"_power": state["power"] if state else 0}
+
+    def command_status(self, playerid, args, tags):
+        state = self.states.get(playerid)
+        if state is None:
+            return {}
+        result = {
+            "mode": state["mode"],
+            "power": state["power"],
+            "mixer volume": -state["volume"]
+            if state["muted"]
+            else state["volume"],
+            "playlist repeat": state["repeat"],
+            "playlist shuffle": state["shuffle"],
+            "playlist_tracks": len(state["playlist"]),
+        }
+        track = self.current_track(state)
+        if track is not None:
+            result["playlist_cur_index"] = state["index"]
+            result["playlist_loop"] = [
+                {
+                    name: track[name]
+                    for name in ("id", "title", "artist", "album")
+                    if name in track
+                }
+            ]
+        return result
+
+    def command_artist(self, playerid, args, tags):
+        track = self.current_track(self.states.get(playerid))
+        return {"_artist": track.get("artist", "") if track else ""}
+
+    def command_title(self, playerid, args, tags):
+        track = self.current_track(self.states.get(playerid))
+        return {"_title": track.get("title", "") if track else ""}
+
+    # Replace playlist of player with tracks and start playing
+    def play(self, playerid, tracks):
+        state = self.states.get(playerid)
+        if state is None:
+            return {}
+        state["playlist"] = list(tracks)
+        state["index"] = 0
+        state["power"] = 1
+        state["mode"] = "play" if tracks else "stop"
+        return {"count": len(tracks)}
+
+    def set_mode(self, playerid, mode):
+        state = self.states.get(playerid)
+        if state is not None:
+            state["mode"] = mode if state["playlist"] else "stop"
+        return {}
+
+    # Get current track of player state (None if not playing a library
+    # track)
+    def current_track(self, state):
+        if not state or not state["playlist"]:
+            return None
+        track = state["playlist"][state["index"]]
+        if track in self.urls:
+            return self.urls[track]
+        return self.tracks.get(track) or {"title": str(track)}
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    # Headers and body are written separately, don't wait for the ACK
+    disable_nagle_algorithm = True
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_POST(self):
+        if self.path != "/jsonrpc.js":
+            self.send_error(404)
+            return
+        try:
+            request = json.loads(
+                self.rfile.read(int(self.headers["Content-Length"]))
+            )
+            status, response = self.server.lms.handle(request)
+        except Exception as e:
+            status, response = 400, {"error": str(e)}
+        body = json.dumps(response).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+# Get name of command (with its subcommand, e.g. "mixer volume")
+def _command_name(command):
+    if len(command) > 1 and command[1].isalpha():
+        return " ".join(command[:2])
+    return command[0] if command else ""
+
+
+# Split command arguments into positional arguments and tagged parameters
+# (name:value)
+def _split_tags(args):
+    positional = []
+    tags = {}
+    for arg in args:
+        name, separator, value = arg.partition(":")
+        if separator and name in TAGGED_PARAMETERS:
+            tags[name] = value.strip()
+        else:
+            positional.append(arg)
+    return positional, tags
+
+
+# Get (start, count) of page from positional arguments (all if not given
+# or -1)
+def _page(args, total):
+    numbers = [int(arg) for arg in args if arg.lstrip("-").isdigit()]
+    start = numbers[0] if numbers else 0
+    count = numbers[1] if len(numbers) > 1 else total
+    if count < 0:
+        count = total
+    return start, count
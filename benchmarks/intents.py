@@ -0,0 +1,250 @@
+import argparse
+import json
+import logging
+import sys
+import tempfile
+from collections import Counter
+from time import perf_counter
+from fake_lms import FakeLMSServer
+from matching import PLAYERS, SOURCES, make_skill, parse_settings, percentile
+from stubs import Message, load_skill
+from synthetic_library import (
+    generate_library,
+    generate_sources,
+    generate_utterances,
+    server_items,
+)
+
+__author__ = "johanpalmqvist"
+
+# Library size (tracks)
+TRACKS = 5000
+
+# Times each intent is run
+RUNS = 20
+
+# Intents handled by a skill handler (intent name, handler, message data)
+HANDLER_INTENTS = (
+    ("pause", "handle_pause", {}),
+    ("resume", "handle_resume", {}),
+    ("next track", "handle_nexttrack", {}),
+    ("previous track", "handle_previoustrack", {}),
+    ("stop", "handle_stop", {}),
+    ("volume up", "handle_volumeup", {}),
+    ("volume down", "handle_volumedown", {}),
+    ("volume half", "handle_volumehalf", {}),
+    ("volume mute", "handle_volumemute", {}),
+    ("volume unmute", "handle_volumeunmute", {}),
+    ("identify track", "handle_identifytrack", {}),
+    ("power off", "handle_poweroff", {"backend": "kitchen"}),
+    ("power on", "handle_poweron", {"backend": "kitchen"}),
+    ("update cache", "handle_updatecache", {}),
+)
+
+
+# Run intent (a function taking no arguments) of skill against server,
+# returning (seconds, requests by command, number of failed requests, error
+# or None). The player status snapshot left by the previous intent is
+# discarded, so every intent pays for the requests it needs.
+def measure(skill, server, intent):
+    with skill.lms.status_lock:
+        skill.lms.status_cache.clear()
+    server.reset()
+    error = None
+    start = perf_counter()
+    try:
+        intent()
+    except Exception as e:
+        error = e
+    seconds = perf_counter() - start
+    with server.lock:
+        requests = Counter(server.requests)
+        failed = sum(server.failures.values())
+    return seconds, requests, failed, error
+
+
+# Get play intent for phrase (match the phrase like the common play
+# framework, then start playback of the match)
+def play_intent(skill, phrase):
+    def intent():
+        match = skill.CPS_match_query_phrase(phrase)
+        if match is None:
+            raise LookupError("No match for {}".format(phrase))
+        matched_phrase, _, data = match
+        skill.CPS_start(matched_phrase, data)
+
+    return intent
+
+
+# Get handler intent (handler called with a message with data)
+def handler_intent(skill, handler, data):
+    def intent():
+        getattr(skill, handler)(Message("recognizer_loop:utterance", data))
+
+    return intent
+
+
+# Drive the skill against a fake LMS, returning per intent results
+def run(skill_module, args, settings):
+    library = generate_library(args.tracks, args.seed)
+    sources = generate_sources(SOURCES, args.seed)
+    server = FakeLMSServer(
+        library,
+        server_items(sources),
+        PLAYERS,
+        args.latency,
+        args.failure_rate,
+        args.fail_command,
+        args.seed,
+    )
+    phrases = generate_utterances(
+        library, args.runs * 20, args.seed, sources, players=PLAYERS
+    )
+    measurements = {}
+    with server, tempfile.TemporaryDirectory() as directory:
+        settings = dict(settings)
+        settings["server"] = "127.0.0.1"
+        settings["port"] = server.port
+        skill = make_skill(skill_module, None, directory, settings)
+        # Sources are loaded without injected failures so every run
+        # starts from the same sources
+        server.failure_rate = 0
+        measurements["refresh sources"] = [
+            measure(skill, server, skill.refresh_sources)
+        ]
+        server.failure_rate = args.failure_rate
+        intents = []
+        scheduled = Counter()
+        for category, phrase in phrases:
+            name = "play {}".format(category)
+            if scheduled[name] < args.runs:
+                scheduled[name] += 1
+                intents.append((name, play_intent(skill, phrase)))
+        for _ in range(args.runs):
+            for name, handler, data in HANDLER_INTENTS:
+                intents.append((name, handler_intent(skill, handler, data)))
+        for name, intent in intents:
+            measurements.setdefault(name, []).append(
+                measure(skill, server, intent)
+            )
+        skill.shutdown()
+    return {
+        name: summarize(results) for name, results in measurements.items()
+    }
+
+
+# Summarize (seconds, requests, failed requests, error) measurements of an
+# intent
+def summarize(results):
+    seconds = sorted(result[0] for result in results)
+    requests = Counter()
+    for result in results:
+        requests.update(result[1])
+    return {
+        "runs": len(results),
+        "errors": sum(1 for result in results if result[3] is not None),
+        "requests": sum(requests.values()) / len(results),
+        "failed": sum(result[2] for result in results) / len(results),
+        "commands": {
+            command: count / len(results)
+            for command, count in requests.most_common()
+        },
+        "p50": percentile(seconds, 50),
+        "p95": percentile(seconds, 95),
+        "max": seconds[-1],
+    }
+
+
+# Print results as text
+def report(results, commands=False):
+    print(
+        "{:<20} {:>4} {:>6} {:>9} {:>7} {:>9} {:>9} {:>9}".format(
+            "intent",
+            "runs",
+            "errors",
+            "requests",
+            "failed",
+            "p50 ms",
+            "p95 ms",
+            "max ms",
+        )
+    )
+    for name, result in results.items():
+        print(
+            "{:<20} {:>4} {:>6} {:>9.1f} {:>7.1f} {:>9.1f} {:>9.1f} "
+            "{:>9.1f}".format(
+                name,
+                result["runs"],
+                result["errors"],
+                result["requests"],
+                result["failed"],
+                result["p50"] * 1000,
+                result["p95"] * 1000,
+                result["max"] * 1000,
+            )
+        )
+        if commands:
+            for command, count in result["commands"].items():
+                print("    {:<30} {:>9.1f}".format(command, count))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Drive the skill's intents against a fake LMS and "
+        "report requests and latency per intent"
+    )
+    parser.add_argument("--tracks", type=int, default=TRACKS)
+    parser.add_argument("--runs", type=int, default=RUNS)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument(
+        "--latency",
+        type=float,
+        default=0.0,
+        help="seconds the fake LMS takes to answer each request",
+    )
+    parser.add_argument(
+        "--failure-rate",
+        type=float,
+        default=0.0,
+        help="fraction of requests the fake LMS fails",
+    )
+    parser.add_argument(
+        "--fail-command",
+        action="append",
+        default=[],
+        metavar="COMMAND",
+        help="command the fake LMS always fails (e.g. status, "
+        "'mixer volume')",
+    )
+    parser.add_argument(
+        "--set",
+        metavar="NAME=VALUE",
+        action="append",
+        default=[],
+        help="skill setting (e.g. pool_size=1, player_cache_ttl=0)",
+    )
+    parser.add_argument(
+        "--commands",
+        action="store_true",
+        help="show requests per command for each intent",
+    )
+    parser.add_argument(
+        "--json", action="store_true", help="print results as JSON"
+    )
+    parser.add_argument(
+        "--verbose", action="store_true", help="show skill log messages"
+    )
+    args = parser.parse_args(argv)
+    logging.basicConfig(
+        level=logging.DEBUG if args.verbose else logging.CRITICAL
+    )
+    results = run(load_skill(), args, parse_settings(args.set))
+    if args.json:
+        print(json.dumps(results, indent=4))
+    else:
+        report(results, args.commands)
+        sys.stdout.flush()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,329 @@
+import argparse
+import json
+import logging
+import sys
+import tempfile
+import tracemalloc
+from math import ceil
+from os import listdir
+from os.path import basename, getsize, join
+from time import perf_counter
+from stubs import load_skill
+from synthetic_library import (
+    generate_library,
+    generate_sources,
+    generate_utterances,
+    server_items,
+)
+
+__author__ = "johanpalmqvist"
+
+# Library sizes (tracks) benchmarked by default
+SIZES = (1000, 10000, 100000)
+
+# Number of utterances matched per library size
+UTTERANCES = 500
+
+# Number of favorites, playlists and podcasts
+SOURCES = 50
+
+# Names of the players
+PLAYERS = ("Living Room", "Kitchen")
+
+# Skill settings used unless overridden (phrase cache disabled so every
+# utterance is matched)
+SETTINGS = {
+    "server": "localhost",
+    "port": 9000,
+    "default_player_name": "living room",
+    "phrase_cache_size": 0,
+    "player_state_enabled": False,
+}
+
+# Skill attributes holding cache and state filenames
+FILENAMES = (
+    "sources_cache_filename",
+    "library_cache_filename",
+    "sources_keys_filename",
+    "library_total_duration_state_filename",
+    "library_last_scan_state_filename",
+    "metrics_filename",
+)
+
+
+# In-process stand-in for LMSClient serving a synthetic library (counting
+# requests as LMSClient does)
+class FakeLMS(object):
+    def __init__(self, library, items=None, players=PLAYERS):
+        self.library = library
+        self.items = items or {}
+        self.players = [
+            {"name": name, "playerid": "00:04:20:00:00:{:02x}".format(i)}
+            for i, name in enumerate(players)
+        ]
+        self.request_count = 0
+
+    def close(self):
+        pass
+
+    def get_players(self):
+        self.request_count += 1
+        return self.players
+
+    def get_library_total_duration(self):
+        self.request_count += 1
+        return 240 * len(self.library)
+
+    def get_library_last_scan(self):
+        self.request_count += 1
+        return "1500000000"
+
+    def get_favorites(self):
+        self.request_count += 1
+        return self.items.get("favorite", [])
+
+    def get_playlists(self):
+        self.request_count += 1
+        return self.items.get("playlist", [])
+
+    def get_podcasts(self, playerid=None):
+        self.request_count += 1
+        return self.items.get("podcast", [])
+
+    def iter_library_titles(self, page_size, tags=None, album_id=None):
+        titles = self.library
+        if album_id is not None:
+            titles = [
+                t for t in titles if str(t.get("album_id")) == str(album_id)
+            ]
+        for start in range(0, len(titles), page_size):
+            self.request_count += 1
+            yield titles[start : start + page_size]
+
+    def lms_request(self, payload):
+        self.request_count += 1
+        return {"result": {"titles_loop": self.library}}
+
+
+# Create skill (with settings) using lms (the skill's own LMSClient if
+# None) and keeping its files in directory
+def make_skill(skill_module, lms, directory, settings=None):
+    skill = skill_module.create_skill()
+    skill.settings.update(SETTINGS)
+    skill.settings.update(settings or {})
+    sqlite = skill.settings.get("sources_backend") == "sqlite"
+    skill.settings["sources_backend"] = "file"
+    skill.initialize()
+    # Sources are loaded by the benchmark, not in the background
+    skill.get_sources = lambda message: None
+    skill.get_settings()
+    if lms is not None:
+        skill.lms = lms
+        skill.players = skill_module.PlayerRegistry(lms, skill.players.ttl)
+    for name in FILENAMES:
+        setattr(skill, name, join(directory, basename(getattr(skill, name))))
+    if sqlite:
+        skill.sources_backend = "sqlite"
+        skill.sources_cache_filename = join(directory, "sources_cache.sqlite")
+        skill.sources_store = skill_module.SQLiteStore(
+            skill.sources_cache_filename
+        )
+    return skill
+
+
+# Load sources cache together with favorites, playlists and podcasts (as
+# the skill does when refreshing). Lazily loaded categories are loaded
+# right away so loading isn't timed as part of the first match.
+def load_sources(skill):
+    sources = dict(skill.load_sources_cache() or {})
+    sources["favorite"] = skill.load_favorites(skill.lms.get_favorites())
+    sources["playlist"] = skill.load_playlists(skill.lms.get_playlists())
+    sources["podcast"] = skill.load_podcasts(skill.lms.get_podcasts())
+    for mapping in sources.values():
+        len(mapping)
+    return sources
+
+
+# Build match index for sources
+def build_index(skill, sources):
+    match_index = skill.new_match_index()
+    match_index.build(sources)
+    return match_index
+
+
+# Get percentile (nearest rank) of sorted values
+def percentile(values, percent):
+    if not values:
+        return None
+    return values[max(0, ceil(percent / 100 * len(values)) - 1)]
+
+
+# Benchmark library of tracks, returning results
+def run(skill_module, tracks, utterances, seed, settings):
+    library = generate_library(tracks, seed)
+    sources = generate_sources(SOURCES, seed)
+    lms = FakeLMS(library, server_items(sources))
+    phrases = generate_utterances(
+        library, utterances, seed, sources, players=PLAYERS
+    )
+    with tempfile.TemporaryDirectory() as directory:
+        skill = make_skill(skill_module, lms, directory, settings)
+
+        start = perf_counter()
+        skill.save_sources_cache()
+        build_seconds = perf_counter() - start
+        cache_bytes = sum(
+            getsize(join(directory, name)) for name in listdir(directory)
+        )
+        skill.results = None
+
+        # Memory held by loaded sources and match index (measured apart
+        # as tracing slows everything down)
+        tracemalloc.start()
+        sources = load_sources(skill)
+        match_index = build_index(skill, sources)
+        memory_bytes = tracemalloc.get_traced_memory()[0]
+        tracemalloc.stop()
+        del sources, match_index
+
+        start = perf_counter()
+        sources = load_sources(skill)
+        load_seconds = perf_counter() - start
+        start = perf_counter()
+        match_index = build_index(skill, sources)
+        index_seconds = perf_counter() - start
+        skill.swap_sources(sources, match_index)
+
+        latencies = {}
+        matched = {}
+        for category, phrase in phrases:
+            start = perf_counter()
+            result = skill.CPS_match_query_phrase(phrase)
+            latencies.setdefault(category, []).append(perf_counter() - start)
+            matched[category] = matched.get(category, 0) + (
+                result is not None
+            )
+        match_stats = skill.match_index.stats()
+        if skill.sources_store is not None:
+            skill.sources_store.close()
+    return {
+        "tracks": tracks,
+        "cache_build_seconds": build_seconds,
+        "cache_load_seconds": load_seconds,
+        "index_build_seconds": index_seconds,
+        "memory_bytes": memory_bytes,
+        "cache_bytes": cache_bytes,
+        "scored": match_stats["scored"],
+        "pruned": match_stats["pruned"],
+        "categories": {
+            category: {
+                "utterances": len(values),
+                "matched": matched[category],
+                "p50": percentile(sorted(values), 50),
+                "p95": percentile(sorted(values), 95),
+                "p99": percentile(sorted(values), 99),
+            }
+            for category, values in sorted(latencies.items())
+        },
+    }
+
+
+# Print results as text
+def report(results):
+    print(
+        "{} tracks: cache build {:.2f}s, cache load {:.2f}s, index build "
+        "{:.2f}s, memory {:.1f} MB, cache files {:.1f} MB".format(
+            results["tracks"],
+            results["cache_build_seconds"],
+            results["cache_load_seconds"],
+            results["index_build_seconds"],
+            results["memory_bytes"] / 1e6,
+            results["cache_bytes"] / 1e6,
+        )
+    )
+    considered = results["scored"] + results["pruned"]
+    print(
+        "  keys scored {}, pruned {} ({:.0%})".format(
+            results["scored"],
+            results["pruned"],
+            results["pruned"] / considered if considered else 0,
+        )
+    )
+    print(
+        "  {:<16} {:>5} {:>7} {:>9} {:>9} {:>9}".format(
+            "category", "count", "matched", "p50 ms", "p95 ms", "p99 ms"
+        )
+    )
+    for category, latency in results["categories"].items():
+        print(
+            "  {:<16} {:>5} {:>7} {:>9.2f} {:>9.2f} {:>9.2f}".format(
+                category,
+                latency["utterances"],
+                latency["matched"],
+                latency["p50"] * 1000,
+                latency["p95"] * 1000,
+                latency["p99"] * 1000,
+            )
+        )
+
+
+# Parse skill setting overrides (name=value)
+def parse_settings(values):
+    settings = {}
+    for value in values:
+        name, _, setting = value.partition("=")
+        settings[name] = setting
+    return settings
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Benchmark sources cache and query matching on "
+        "synthetic libraries (no LMS or Mycroft needed)"
+    )
+    parser.add_argument(
+        "--tracks",
+        type=int,
+        nargs="+",
+        default=list(SIZES),
+        help="library sizes (default: {})".format(
+            " ".join(str(size) for size in SIZES)
+        ),
+    )
+    parser.add_argument("--utterances", type=int, default=UTTERANCES)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument(
+        "--set",
+        metavar="NAME=VALUE",
+        action="append",
+        default=[],
+        help="skill setting (e.g. cache_format=binary, "
+        "sources_backend=sqlite, scorer_backend=numpy)",
+    )
+    parser.add_argument(
+        "--json", action="store_true", help="print results as JSON"
+    )
+    parser.add_argument(
+        "--verbose", action="store_true", help="show skill log messages"
+    )
+    args = parser.parse_args(argv)
+    logging.basicConfig(
+        level=logging.DEBUG if args.verbose else logging.ERROR
+    )
+    skill_module = load_skill()
+    settings = parse_settings(args.set)
+    all_results = []
+    for tracks in args.tracks:
+        results = run(
+            skill_module, tracks, args.utterances, args.seed, settings
+        )
+        all_results.append(results)
+        if not args.json:
+            report(results)
+            sys.stdout.flush()
+    if args.json:
+        print(json.dumps(all_results, indent=4))
+
+
+if __name__ == "__main__":
+    main()
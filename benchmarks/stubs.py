@@ -0,0 +1,131 @@
+import importlib.util
+import logging
+import sys
+import types
+from os.path import abspath, dirname, isfile, join
+
+__author__ = "johanpalmqvist"
+
+# Skill directory (parent of the benchmarks directory)
+SKILL_DIR = dirname(dirname(abspath(__file__)))
+
+# Name the skill package is imported as
+PACKAGE = "squeezebox_skill"
+
+LOG = logging.getLogger("squeezebox")
+
+
+# Match levels of the Mycroft common play framework
+class CPSMatchLevel(object):
+    EXACT = 1
+    MULTI_KEY = 2
+    TITLE = 3
+    ARTIST = 4
+    CATEGORY = 5
+    GENERIC = 6
+
+
+# Message sent on the message bus
+class Message(object):
+    def __init__(self, msg_type, data=None, context=None):
+        self.msg_type = msg_type
+        self.data = data or {}
+        self.context = context or {}
+
+    def response(self, data=None, context=None):
+        return Message(self.msg_type + ".response", data, context)
+
+
+# Skill logger (exception() logs the current exception without a message)
+class SkillLog(object):
+    def __getattr__(self, name):
+        return getattr(LOG, name)
+
+    def exception(self, message="Exception"):
+        LOG.exception(message)
+
+
+# Message bus recording emitted messages
+class MessageBus(object):
+    def __init__(self):
+        self.emitted = []
+
+    def emit(self, message):
+        self.emitted.append(message)
+
+
+# Stand-in for mycroft.skills.common_play_skill.CommonPlaySkill with just
+# what the skill uses (no bus, scheduler or dialogs)
+class CommonPlaySkill(object):
+    def __init__(self, name=None):
+        self.name = name
+        self.settings = {}
+        self.bus = MessageBus()
+        self.log = SkillLog()
+        self.events = {}
+        self.scheduled = {}
+        self.spoken = []
+
+    def initialize(self):
+        pass
+
+    def shutdown(self):
+        pass
+
+    def add_event(self, name, handler):
+        self.events[name] = handler
+
+    def schedule_repeating_event(self, handler, when, frequency, name=None):
+        self.scheduled[name] = (handler, frequency)
+
+    def cancel_scheduled_event(self, name):
+        self.scheduled.pop(name, None)
+
+    def speak_dialog(self, name, data=None, **kwargs):
+        self.spoken.append((name, data))
+
+    def find_resource(self, name, res_dirname=None):
+        path = join(SKILL_DIR, "locale", "en-us", name)
+        return path if isfile(path) else None
+
+
+# Install stand-ins for the mycroft modules imported by the skill
+def install():
+    modules = {
+        name: types.ModuleType(name)
+        for name in (
+            "mycroft",
+            "mycroft.skills",
+            "mycroft.skills.core",
+            "mycroft.skills.common_play_skill",
+            "mycroft.util",
+            "mycroft.util.log",
+        )
+    }
+    modules["mycroft.skills.core"].intent_file_handler = lambda name: (
+        lambda handler: handler
+    )
+    modules["mycroft.skills.common_play_skill"].CommonPlaySkill = (
+        CommonPlaySkill
+    )
+    modules["mycroft.skills.common_play_skill"].CPSMatchLevel = CPSMatchLevel
+    modules["mycroft.util"].play_wav = lambda filename: None
+    modules["mycroft.util.log"].LOG = LOG
+    sys.modules.update(modules)
+
+
+# Import the skill package with the mycroft stand-ins (so benchmarks run
+# the same with or without Mycroft installed)
+def load_skill():
+    if PACKAGE in sys.modules:
+        return sys.modules[PACKAGE]
+    install()
+    spec = importlib.util.spec_from_file_location(
+        PACKAGE,
+        join(SKILL_DIR, "__init__.py"),
+        submodule_search_locations=[SKILL_DIR],
+    )
+    module = importlib.util.module_from_spec(spec)
+    sys.modules[PACKAGE] = module
+    spec.loader.exec_module(module)
+    return module
@@ -0,0 +1,264 @@
+import random
+
+__author__ = "johanpalmqvist"
+
+# Tags of generated titles (LMS titles command tags)
+TAGS = "aegilpstu"
+
+# Fields of titles_loop entries returned for each tag
+TAG_FIELDS = {
+    "a": ("artist",),
+    "e": ("album_id",),
+    "g": ("genre",),
+    "i": ("disc",),
+    "l": ("album",),
+    "n": ("modificationTime",),
+    "p": ("genre_id",),
+    "s": ("artist_id",),
+    "t": ("tracknum",),
+    "u": ("url",),
+}
+
+# Tracks per album and albums per artist (on average)
+TRACKS_PER_ALBUM = 11
+ALBUMS_PER_ARTIST = 4
+
+GENRES = (
+    "Rock",
+    "Pop",
+    "Jazz",
+    "Blues",
+    "Classical",
+    "Electronic",
+    "Hip Hop",
+    "Folk",
+    "Country",
+    "Reggae",
+    "Soul",
+    "Metal",
+    "Punk",
+    "Ambient",
+    "Synthpop",
+    "Industrial",
+    "Soundtrack",
+    "Latin",
+    "Funk",
+    "Disco",
+)
+
+WORDS = (
+    "midnight river silver morning golden shadow electric summer winter "
+    "broken heart city lights ocean fire stone glass velvet thunder rain "
+    "paper moon northern southern wild quiet little lonely crystal dancing "
+    "burning falling rising hidden secret distant endless lost sweet black "
+    "white blue red green yellow neon wooden iron highway station garden "
+    "mirror window dream echo signal machine ghost angel devil kingdom "
+    "empire harbor island desert forest mountain valley canyon thunderbird "
+    "satellite radio cassette vinyl memory promise letter story song "
+    "ballad anthem lullaby serenade waltz tango rhapsody symphony nocturne "
+    "sunrise sunset twilight horizon starlight moonlight daylight"
+).split()
+
+ARTIST_FORMS = (
+    "The {} {}s",
+    "{} {}",
+    "{} & The {}s",
+    "DJ {}",
+    "{} Orchestra",
+    "{} {} Band",
+)
+
+FIRST_NAMES = (
+    "Anna Johan Maria Erik Sofia Lars Emma Karl Lisa Nils Ella Oskar Clara "
+    "Hugo Alice Axel Maja Leo Ida Felix Nora Otto Vera Max"
+).split()
+
+
+# Generate deterministic synthetic library of tracks (as returned by the
+# LMS titles command with tags) with realistic artist, album and title
+# names and the same shape (ids, optional fields) as titles_loop
+def generate_library(tracks, seed=0, tags=TAGS):
+    rng = random.Random(seed)
+    albums = max(1, tracks // TRACKS_PER_ALBUM)
+    artists = max(1, albums // ALBUMS_PER_ARTIST)
+    artist_names = _unique(artists, lambda: _artist_name(rng))
+    album_names = _unique(albums, lambda: _phrase(rng, 1, 3))
+    album_artists = [rng.randrange(artists) for _ in range(albums)]
+    album_genres = [rng.randrange(len(GENRES)) for _ in range(albums)]
+    fields = {
+        field for tag in tags for field in TAG_FIELDS.get(tag, ())
+    }
+    library = []
+    previous_album_id = None
+    for track_id in range(1, tracks + 1):
+        album_id = (track_id - 1) * albums // tracks
+        if album_id != previous_album_id:
+            previous_album_id = album_id
+            tracknum = 0
+        tracknum += 1
+        artist_id = album_artists[album_id]
+        genre_id = album_genres[album_id]
+        title = {
+            "id": track_id,
+            "title": _phrase(rng, 1, 4),
+            "artist": artist_names[artist_id],
+            "artist_id": artist_id + 1,
+            "album": album_names[album_id],
+            "album_id": album_id + 1,
+            "genre": GENRES[genre_id],
+            "genre_id": genre_id + 1,
+            "disc": 1,
+            "tracknum": tracknum,
+            "url": "file:///music/{}/{}/{:02d}.flac".format(
+                artist_id + 1, album_id + 1, track_id
+            ),
+            "modificationTime": 1500000000 + track_id,
+        }
+        library.append(
+            {
+                name: value
+                for name, value in title.items()
+                if name in ("id", "title") or name in fields
+            }
+        )
+    return library
+
+
+# Generate deterministic utterances (phrases as handed to
+# CPS_match_query_phrase, without "play") for library (generated with at
+# least the a, g and l tags) and extra sources ({category: names}). Returns
+# (category, phrase) pairs, where category is the kind of query (album,
+# artist, title, title by artist, genre, music, generic, backend,
+# playlist, favorite or podcast). The first entity of a fraction of the
+# phrases is misspelled.
+def generate_utterances(
+    library, count, seed=0, sources=None, typos=0.2, players=("Kitchen",)
+):
+    rng = random.Random(seed)
+    sources = sources or {}
+    templates = [
+        ("album", "the album {}", lambda track: [track["album"]]),
+        ("artist", "artist {}", lambda track: [track["artist"]]),
+        ("title", "the song {}", lambda track: [track["title"]]),
+        (
+            "title by artist",
+            "{} by {}",
+            lambda track: [track["title"], track["artist"]],
+        ),
+        ("genre", "genre {}", lambda track: [track["genre"]]),
+        ("music", "{} music", lambda track: [track["genre"]]),
+        ("generic", "{}", lambda track: [track["title"]]),
+        (
+            "backend",
+            "{} on {}",
+            lambda track: [track["album"], rng.choice(players)],
+        ),
+    ]
+    for category, form in (
+        ("playlist", "playlist {}"),
+        ("favorite", "radio {}"),
+        ("podcast", "podcast {}"),
+    ):
+        names = list(sources.get(category, ()))
+        if names:
+            templates.append(
+                (
+                    category,
+                    form,
+                    lambda track, names=names: [rng.choice(names)],
+                )
+            )
+    utterances = []
+    for _ in range(count):
+        category, form, entities = rng.choice(templates)
+        entities = [entity.lower() for entity in entities(rng.choice(library))]
+        if rng.random() < typos:
+            entities[0] = _misspell(rng, entities[0])
+        utterances.append((category, form.format(*entities)))
+    return utterances
+
+
+# Generate names of favorites, playlists and podcasts
+def generate_sources(count, seed=0):
+    rng = random.Random(seed)
+    return {
+        "favorite": _unique(
+            count, lambda: "{} FM".format(_phrase(rng, 1, 2))
+        ),
+        "playlist": _unique(count, lambda: _phrase(rng, 1, 3)),
+        "podcast": _unique(
+            count, lambda: "The {} Show".format(_phrase(rng, 1, 2))
+        ),
+    }
+
+
+# Get favorites, playlists and podcasts of sources ({category: names}) as
+# returned by the LMS favorites, playlists and podcasts commands
+def server_items(sources):
+    return {
+        "favorite": [
+            {
+                "id": "{:08x}.{}".format(i, i),
+                "name": name,
+                "type": "audio",
+                "isaudio": 1,
+                "hasitems": 0,
+            }
+            for i, name in enumerate(sources.get("favorite", ()))
+        ],
+        "playlist": [
+            {"id": 1000 + i, "playlist": name}
+            for i, name in enumerate(sources.get("playlist", ()))
+        ],
+        "podcast": [
+            {
+                "id": "{:08x}.{}".format(i, i),
+                "name": name,
+                "type": "link",
+                "isaudio": 0,
+                "hasitems": 1,
+            }
+            for i, name in enumerate(sources.get("podcast", ()))
+        ],
+    }
+
+
+def _phrase(rng, low, high):
+    return " ".join(
+        rng.choice(WORDS).capitalize() for _ in range(rng.randint(low, high))
+    )
+
+
+def _artist_name(rng):
+    form = rng.choice(ARTIST_FORMS)
+    names = [
+        rng.choice(FIRST_NAMES) if rng.random() < 0.3 else word.capitalize()
+        for word in rng.sample(WORDS, form.count("{}"))
+    ]
+    return form.format(*names)
+
+
+# Get count distinct names from make (numbering repeated names)
+def _unique(count, make):
+    names = []
+    seen = set()
+    while len(names) < count:
+        name = make()
+        if name in seen:
+            name = "{} {}".format(name, len(names) + 1)
+        seen.add(name)
+        names.append(name)
+    return names
+
+
+# Misspell text by dropping, doubling or swapping a letter
+def _misspell(rng, text):
+    if len(text) < 3:
+        return text
+    i = rng.randrange(len(text) - 1)
+    edit = rng.randrange(3)
+    if edit == 0:
+        return text[:i] + text[i + 1 :]
+    if edit == 1:
+        return text[:i] + text[i] + text[i:]
+    return text[:i] + text[i + 1] + text[i] + text[i + 2 :]
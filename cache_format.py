@@ -0,0 +1,370 @@
+import gzip
+import json
+import mmap
+import struct
+import sys
+from array import array
+from collections.abc import Mapping, Sequence
+from os import replace, stat
+from os.path import basename
+
+__author__ = "johanpalmqvist"
+
+# Binary cache layout (all integers little-endian):
+#   header:    magic (8 bytes), version (uint16), kind (uint16),
+#              directory offset (uint64), directory length (uint64)
+#   sections:  per section an optional key table and a value table, each an
+#              array of count + 1 uint32 offsets followed by a blob of
+#              UTF-8 strings (keys) or compact JSON documents (values).
+#              Keys are sorted by UTF-8 bytes (same order as sort_keys=True)
+#   directory: JSON object mapping section name to its table positions
+MAGIC = b"SQBXCACH"
+VERSION = 1
+KIND_SOURCES = 1
+KIND_LIBRARY = 2
+KIND_KEYS = 3
+HEADER = struct.Struct("<8sHHQQ")
+OFFSET = struct.Struct("<I")
+
+# Section holding the library titles
+LIBRARY_SECTION = "titles"
+
+# Lines of a gzip JSON library cache decoded at a time
+JSON_CHUNK_SIZE = 1000
+
+# Section of a keys cache holding the fingerprint of its sources cache
+SOURCE_SECTION = "source"
+
+
+class CacheFormatError(ValueError):
+    pass
+
+
+# Read-only mapping of keys to JSON values backed by a mapped file
+class MappedTable(Mapping):
+    def __init__(self, buffer, section):
+        self.count = section["count"]
+        self.key_offsets = _offsets(buffer, section["key_offsets"], self.count)
+        self.key_blob = section["key_blob"]
+        self.value_offsets = _offsets(
+            buffer, section["value_offsets"], self.count
+        )
+        self.value_blob = section["value_blob"]
+        self.buffer = buffer
+
+    def __len__(self):
+        return self.count
+
+    def __iter__(self):
+        for position in range(self.count):
+            yield self.key_at(position)
+
+    def __contains__(self, key):
+        return self.find(key) is not None
+
+    def __getitem__(self, key):
+        position = self.find(key)
+        if position is None:
+            raise KeyError(key)
+        return self.value_at(position)
+
+    # Get key at position
+    def key_at(self, position):
+        return bytes(self._key_bytes(position)).decode("utf-8")
+
+    # Get value at position
+    def value_at(self, position):
+        start = self.value_blob + self.value_offsets[position]
+        end = self.value_blob + self.value_offsets[position + 1]
+        return json.loads(bytes(self.buffer[start:end]).decode("utf-8"))
+
+    # Find position of key (binary search over sorted keys)
+    def find(self, key):
+        if not isinstance(key, str):
+            return None
+        wanted = key.encode("utf-8")
+        low, high = 0, self.count
+        while low < high:
+            middle = (low + high) // 2
+            if bytes(self._key_bytes(middle)) < wanted:
+                low = middle + 1
+            else:
+                high = middle
+        if low < self.count and bytes(self._key_bytes(low)) == wanted:
+            return low
+        return None
+
+    def _key_bytes(self, position):
+        start = self.key_blob + self.key_offsets[position]
+        end = self.key_blob + self.key_offsets[position + 1]
+        return self.buffer[start:end]
+
+
+# Read-only sequence of JSON values backed by a mapped file
+class MappedList(Sequence):
+    def __init__(self, buffer, section):
+        self.count = section["count"]
+        self.value_offsets = _offsets(
+            buffer, section["value_offsets"], self.count
+        )
+        self.value_blob = section["value_blob"]
+        self.buffer = buffer
+
+    def __len__(self):
+        return self.count
+
+    def __getitem__(self, position):
+        if isinstance(position, slice):
+            return [self[i] for i in range(*position.indices(self.count))]
+        if position < 0:
+            position += self.count
+        if not 0 <= position < self.count:
+            raise IndexError(position)
+        start = self.value_blob + self.value_offsets[position]
+        end = self.value_blob + self.value_offsets[position + 1]
+        return json.loads(bytes(self.buffer[start:end]).decode("utf-8"))
+
+
+# Write binary cache sections to a temporary file which replaces filename
+# when closed
+class CacheWriter(object):
+    def __init__(self, filename, kind):
+        self.filename = filename
+        self.partial_filename = "{}.partial".format(filename)
+        self.kind = kind
+        self.directory = {}
+        self.f = open(self.partial_filename, "wb")
+        self.f.write(HEADER.pack(MAGIC, VERSION, kind, 0, 0))
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            self.close()
+        else:
+            self.f.close()
+
+    # Write mapping as a keyed section
+    def write_table(self, name, mapping):
+        keys = sorted(mapping, key=lambda key: key.encode("utf-8"))
+        key_offsets, key_blob, count = self._write_blob(
+            key.encode("utf-8") for key in keys
+        )
+        value_offsets, value_blob, count = self._write_blob(
+            _encode(mapping[key]) for key in keys
+        )
+        self.directory[name] = {
+            "count": count,
+            "key_offsets": key_offsets,
+            "key_blob": key_blob,
+            "value_offsets": value_offsets,
+            "value_blob": value_blob,
+        }
+
+    # Write values (any iterable, consumed once) as a list section
+    def write_list(self, name, values):
+        value_offsets, value_blob, count = self._write_blob(
+            _encode(value) for value in values
+        )
+        self.directory[name] = {
+            "count": count,
+            "value_offsets": value_offsets,
+            "value_blob": value_blob,
+        }
+        return count
+
+    # Write directory, patch header and move file into place
+    def close(self):
+        directory = json.dumps(self.directory).encode("utf-8")
+        directory_offset = self.f.tell()
+        self.f.write(directory)
+        self.f.seek(0)
+        self.f.write(
+            HEADER.pack(
+                MAGIC, VERSION, self.kind, directory_offset, len(directory)
+            )
+        )
+        self.f.close()
+        replace(self.partial_filename, self.filename)
+
+    # Write blob of items followed by its offsets (items are streamed, the
+    # offsets are kept in memory at 4 bytes per item)
+    def _write_blob(self, items):
+        self._align()
+        blob = self.f.tell()
+        offsets = array("I", [0])
+        size = 0
+        for item in items:
+            self.f.write(item)
+            size += len(item)
+            offsets.append(size)
+        self._align()
+        offsets_position = self.f.tell()
+        if sys.byteorder != "little":
+            offsets.byteswap()
+        self.f.write(offsets.tobytes())
+        return offsets_position, blob, len(offsets) - 1
+
+    def _align(self):
+        padding = -self.f.tell() % 4
+        if padding:
+            self.f.write(b"\0" * padding)
+
+
+# Open binary cache file, returning (kind, mapped buffer, directory)
+def open_cache(filename):
+    with open(filename, "rb") as f:
+        buffer = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    if len(buffer) < HEADER.size:
+        raise CacheFormatError("Truncated cache file: {}".format(filename))
+    magic, version, kind, directory_offset, directory_length = (
+        HEADER.unpack_from(buffer, 0)
+    )
+    if magic != MAGIC:
+        raise CacheFormatError("Not a binary cache file: {}".format(filename))
+    if version != VERSION:
+        raise CacheFormatError(
+            "Unsupported cache version {} in {}".format(version, filename)
+        )
+    directory = json.loads(
+        bytes(
+            buffer[directory_offset : directory_offset + directory_length]
+        ).decode("utf-8")
+    )
+    return kind, memoryview(buffer), directory
+
+
+# Read sources cache as {category: MappedTable}
+def read_sources(filename):
+    kind, buffer, directory = open_cache(filename)
+    if kind != KIND_SOURCES:
+        raise CacheFormatError("Not a sources cache: {}".format(filename))
+    return {
+        category: MappedTable(buffer, section)
+        for category, section in directory.items()
+    }
+
+
+# Read library cache as MappedList of titles
+def read_library(filename):
+    kind, buffer, directory = open_cache(filename)
+    if kind != KIND_LIBRARY:
+        raise CacheFormatError("Not a library cache: {}".format(filename))
+    return MappedList(buffer, directory[LIBRARY_SECTION])
+
+
+# Read titles from gzip JSON library cache file. Files written one title
+# per line are parsed a chunk of lines at a time (without decompressing the
+# whole file first), others (like indented ones) as a whole.
+def read_json_library(filename, chunk_size=JSON_CHUNK_SIZE):
+    with gzip.GzipFile(filename) as f:
+        try:
+            titles = []
+            chunk = []
+            for line in f:
+                line = line.strip().rstrip(b",")
+                if line in (b"[", b"]", b""):
+                    continue
+                chunk.append(line)
+                if len(chunk) == chunk_size:
+                    titles.extend(_decode_lines(chunk))
+                    chunk = []
+            titles.extend(_decode_lines(chunk))
+            return titles
+        except ValueError:
+            f.seek(0)
+            return json.loads(f.read().decode("utf-8"))
+
+
+# Read processed keys cache as {category: MappedList of processed keys}
+# (fails unless it was written for the current sources cache file)
+def read_keys(filename, sources_filename):
+    kind, buffer, directory = open_cache(filename)
+    if kind != KIND_KEYS:
+        raise CacheFormatError("Not a keys cache: {}".format(filename))
+    source = directory.pop(SOURCE_SECTION, None)
+    if source is None or list(MappedList(buffer, source)) != fingerprint(
+        sources_filename
+    ):
+        raise CacheFormatError(
+            "Keys cache {} not written for {}".format(
+                filename, sources_filename
+            )
+        )
+    return {
+        category: MappedList(buffer, section)
+        for category, section in directory.items()
+    }
+
+
+# Write processed keys ({category: [processed key]}) of the sources cache
+# file to binary cache file
+def write_keys(filename, keys, sources_filename):
+    with CacheWriter(filename, KIND_KEYS) as writer:
+        writer.write_list(SOURCE_SECTION, fingerprint(sources_filename))
+        for category, processed in keys.items():
+            writer.write_list(category, processed)
+
+
+# Get fingerprint (name, size and modification time) of file
+def fingerprint(filename):
+    status = stat(filename)
+    return [basename(filename), status.st_size, status.st_mtime_ns]
+
+
+# Write sources ({category: {key: value}}) to binary cache file
+def write_sources(filename, sources):
+    with CacheWriter(filename, KIND_SOURCES) as writer:
+        for category, mapping in sources.items():
+            writer.write_table(category, mapping)
+
+
+# Write library titles (any iterable) to binary cache file, returning the
+# number of titles written
+def write_library(filename, titles):
+    with CacheWriter(filename, KIND_LIBRARY) as writer:
+        return writer.write_list(LIBRARY_SECTION, titles)
+
+
+# Convert gzip JSON sources or library cache to binary cache file
+def convert(json_filename, filename):
+    with gzip.GzipFile(json_filename) as f:
+        data = json.loads(f.read().decode("utf-8"))
+    if isinstance(data, dict):
+        write_sources(filename, data)
+    else:
+        write_library(filename, data)
+
+
+# Decode lines holding one JSON document each (as one array, so the
+# documents share their decoded keys)
+def _decode_lines(lines):
+    return json.loads(b"[" + b",".join(lines) + b"]")
+
+
+def _encode(value):
+    return json.dumps(
+        value, separators=(",", ":"), ensure_ascii=False
+    ).encode("utf-8")
+
+
+def _offsets(buffer, position, count):
+    size = (count + 1) * OFFSET.size
+    if sys.byteorder == "little":
+        return buffer[position : position + size].cast("I")
+    offsets = array("I", bytes(buffer[position : position + size]))
+    offsets.byteswap()
+    return offsets
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(
+        description="Convert gzip JSON cache files to binary cache files"
+    )
+    parser.add_argument("json_filename")
+    parser.add_argument("filename")
+    args = parser.parse_args()
+    convert(args.json_filename, args.filename)
@@ -0,0 +1,335 @@
+from collections import Counter
+from heapq import nlargest
+from threading import RLock
+from time import monotonic
+from fuzzywuzzy.fuzz import ratio
+from fuzzywuzzy.utils import full_process, intr
+from .batch_scorer import PackedKeys
+
+__author__ = "johanpalmqvist"
+
+# Default number of candidates the trigram index hands to the scorer
+# (higher gives better recall, lower gives faster matching, 0 disables it)
+CANDIDATES = 200
+
+# Categories indexed for matching
+CATEGORIES = (
+    "playlist",
+    "favorite",
+    "podcast",
+    "genre",
+    "artist",
+    "album",
+    "title",
+)
+
+
+# Process key the same way QRatio does
+def process_key(key):
+    return full_process(key, force_ascii=True)
+
+
+# Process query the same way extractOne(processor=full_process) and QRatio
+# do together
+def process_query(query):
+    return full_process(full_process(query), force_ascii=True)
+
+
+# Get set of character trigrams for processed string
+def trigrams(processed):
+    if not processed:
+        return set()
+    padded = " {} ".format(processed)
+    return {padded[i : i + 3] for i in range(len(padded) - 2)}
+
+
+# Get {category: processed keys in sorted key order} of sources (as
+# persisted next to the sources cache)
+def processed_keys(sources, categories=CATEGORIES):
+    return {
+        category: [process_key(key) for key in sorted(sources[category])]
+        for category in categories
+        if category in sources
+    }
+
+
+# Get highest score (0-100) a processed key of length can reach against a
+# processed query of query_length (their edit distance is at least the
+# length difference)
+def score_bound(query_length, length):
+    if not query_length or not length:
+        return 0
+    total = query_length + length
+    shorter = min(query_length, length)
+    return intr(
+        100 * max(1.0 - (total - 2 * shorter) / total, 2.0 * shorter / total)
+    )
+
+
+# Get {length: positions in order} of processed keys at positions (all if
+# None)
+def length_buckets(processed, positions=None):
+    buckets = {}
+    if positions is None:
+        positions = range(len(processed))
+    for position in positions:
+        buckets.setdefault(len(processed[position]), []).append(position)
+    return buckets
+
+
+# Get best (position, score) of processed keys (grouped by length) for
+# processed query, scoring like extractOne with QRatio (the first position
+# wins ties). Lengths are searched by decreasing score bound, skipping keys
+# that cannot beat the best score so far and stopping once no remaining
+# length can (right away after a score of 100). Adds the number of keys
+# scored and pruned to stats.
+def search_buckets(processed_query, processed, buckets, stats=None):
+    query_length = len(processed_query)
+    bounds = sorted(
+        ((score_bound(query_length, length), length) for length in buckets),
+        reverse=True,
+    )
+    best_position, best_score = None, -1
+    scored = 0
+    for bound, length in bounds:
+        if bound < best_score:
+            break
+        for position in buckets[length]:
+            if bound == best_score and position > best_position:
+                break
+            score = ratio(processed_query, processed[position]) if bound else 0
+            scored += 1
+            if score > best_score or (
+                score == best_score and position < best_position
+            ):
+                best_position, best_score = position, score
+    if stats is not None:
+        stats["scored"] += scored
+        stats["pruned"] += sum(map(len, buckets.values())) - scored
+    return best_position, max(best_score, 0)
+
+
+# Get best (key, score) of (key, processed key) pairs for processed query,
+# scoring like extractOne with QRatio (the first key wins ties)
+def best_match(processed_query, pairs, stats=None):
+    keys, processed = unzip(pairs)
+    position, score = search_buckets(
+        processed_query, processed, length_buckets(processed), stats
+    )
+    if position is None:
+        return None, 0
+    return keys[position], score
+
+
+# Get keys and processed keys of (key, processed key) pairs
+def unzip(pairs):
+    keys, processed = [], []
+    for key, processed_key in pairs:
+        keys.append(key)
+        processed.append(processed_key)
+    return keys, processed
+
+
+# Keys of one category with their processed keys and (unless candidates
+# are disabled) a trigram index of them
+class TrigramIndex(object):
+    def __init__(self, keys, processed=None, postings=True):
+        self.keys = list(keys)
+        if processed is None or len(processed) != len(self.keys):
+            processed = [process_key(key) for key in self.keys]
+        self.processed = list(processed)
+        self.sizes = []
+        self.postings = {}
+        self.buckets = None
+        self.packed = None
+        if postings:
+            for position, processed_key in enumerate(self.processed):
+                key_trigrams = trigrams(processed_key)
+                self.sizes.append(len(key_trigrams))
+                for trigram in key_trigrams:
+                    self.postings.setdefault(trigram, []).append(position)
+        self.last_used = monotonic()
+
+    # Get positions of up to limit keys sharing the most trigrams with the
+    # query (trigrams of the processed query), in index order (so ties
+    # resolve like a full scan)
+    def shortlist(self, query_trigrams, limit):
+        self.last_used = monotonic()
+        if not query_trigrams:
+            return []
+        shared = Counter()
+        for trigram in query_trigrams:
+            postings = self.postings.get(trigram)
+            if postings:
+                shared.update(postings)
+        query_size = len(query_trigrams)
+        sizes = self.sizes
+        best = nlargest(
+            limit,
+            shared.items(),
+            key=lambda item: item[1] / (query_size + sizes[item[0]]),
+        )
+        return sorted(position for position, _ in best)
+
+    # Get best (key, score) at positions (all if None) for processed query
+    # (see search_buckets)
+    def best(self, processed_query, positions=None, stats=None):
+        self.last_used = monotonic()
+        if positions is None:
+            if self.buckets is None:
+                self.buckets = length_buckets(self.processed)
+            buckets = self.buckets
+        else:
+            buckets = length_buckets(self.processed, positions)
+        position, score = search_buckets(
+            processed_query, self.processed, buckets, stats
+        )
+        if position is None:
+            return None, 0
+        return self.keys[position], score
+
+    # Get best (key, score) at positions (all if None) for processed query
+    # with the numpy scorer (packing the processed keys on first use)
+    def best_packed(self, processed_query, positions=None):
+        self.last_used = monotonic()
+        if self.packed is None:
+            self.packed = PackedKeys(self.processed)
+        position, score = self.packed.best(processed_query, positions)
+        if position is None:
+            return None, 0
+        return self.keys[position], score
+
+
+# Get best (key, score) of (key, processed key) pairs for processed query
+# with the numpy scorer
+def best_match_packed(processed_query, pairs):
+    keys, processed = unzip(pairs)
+    position, score = PackedKeys(processed).best(processed_query)
+    if position is None:
+        return None, 0
+    return keys[position], score
+
+
+class MatchIndex(object):
+    def __init__(
+        self,
+        candidates=CANDIDATES,
+        processed=None,
+        scorer="fuzzywuzzy",
+    ):
+        self.candidates = candidates
+        # Scorer backend (see batch_scorer.BACKENDS)
+        self.scorer = scorer
+        # {category: processed keys} persisted with the cache (in key order)
+        self.processed = processed or {}
+        self.indexes = {}
+        # Number of keys scored and pruned (skipped by search_buckets)
+        self.counts = Counter(scored=0, pruned=0)
+        self.lock = RLock()
+
+    # Build trigram indexes for the source categories (indexes evicted when
+    # idle are rebuilt on first use, see index_for)
+    def build(self, sources):
+        with self.lock:
+            self.indexes = {}
+        for category in CATEGORIES:
+            if sources.get(category):
+                index = self.index_for(category, sources[category])
+                if index is not None and self.scorer == "numpy":
+                    index.packed = PackedKeys(index.processed)
+
+    # Get trigram index for category, building it if needed (None for
+    # categories that provide their own candidates, like the SQLite backend)
+    def index_for(self, category, choices):
+        if hasattr(choices, "candidates"):
+            return None
+        with self.lock:
+            index = self.indexes.get(category)
+            if index is None:
+                index = TrigramIndex(
+                    choices,
+                    self.processed.get(category),
+                    self.candidates > 0,
+                )
+                self.indexes[category] = index
+            return index
+
+    # Forget trigram indexes not used for seconds, returning their categories
+    def evict_idle(self, seconds):
+        with self.lock:
+            idle = [
+                category
+                for category, index in self.indexes.items()
+                if monotonic() - index.last_used > seconds
+            ]
+            for category in idle:
+                del self.indexes[category]
+        return idle
+
+    # Get number of keys scored and pruned while matching
+    def stats(self):
+        with self.lock:
+            considered = self.counts["scored"] + self.counts["pruned"]
+            return {
+                "scored": self.counts["scored"],
+                "pruned": self.counts["pruned"],
+                "pruned_rate": (
+                    self.counts["pruned"] / considered if considered else 0.0
+                ),
+            }
+
+    # Get best key and score (0-100) for query in category
+    def extract_best(self, category, query, sources):
+        return self.extract_best_per_category(query, (category,), sources)[
+            category
+        ]
+
+    # Get best key and score (0-100) for query in each category
+    def extract_best_per_category(self, query, categories, sources):
+        return dict(self.iter_best_per_category(query, categories, sources))
+
+    # Get (category, (best key, score)) for query in each category in turn,
+    # so callers can stop at the first good enough category. The query is
+    # processed once and only the shortlisted processed keys (falls back to
+    # all keys of a category whose shortlist comes back empty) that can beat
+    # the best score so far are scored.
+    def iter_best_per_category(self, query, categories, sources):
+        processed_query = process_query(query)
+        query_trigrams = trigrams(processed_query)
+        for category in categories:
+            counts = Counter()
+            best = self.best_in_category(
+                category,
+                query,
+                processed_query,
+                query_trigrams,
+                sources,
+                counts,
+            )
+            with self.lock:
+                self.counts.update(counts)
+            yield category, best
+
+    # Get best key and score (0-100) for processed query in category
+    def best_in_category(
+        self, category, query, processed_query, query_trigrams, sources, counts
+    ):
+        choices = sources.get(category)
+        if not choices:
+            return None, 0
+        index = self.index_for(category, choices)
+        if index is not None:
+            positions = None
+            if self.candidates > 0:
+                positions = index.shortlist(query_trigrams, self.candidates)
+            if self.scorer == "numpy":
+                return index.best_packed(processed_query, positions or None)
+            return index.best(processed_query, positions or None, counts)
+        pairs = None
+        if self.candidates > 0:
+            pairs = choices.candidates(query, self.candidates)
+        if not pairs:
+            pairs = choices.processed_items()
+        if self.scorer == "numpy":
+            return best_match_packed(processed_query, pairs)
+        return best_match(processed_query, pairs, counts)
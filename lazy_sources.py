@@ -0,0 +1,53 @@
+from collections.abc import Mapping
+from threading import RLock
+from time import monotonic
+
+__author__ = "johanpalmqvist"
+
+
+# Read-only mapping of one source category which is loaded on first access
+# (and can be evicted again, reloading on next access)
+class LazyCategory(Mapping):
+    def __init__(self, name, load):
+        self.name = name
+        self.load = load
+        self.lock = RLock()
+        self._data = None
+        self.last_used = None
+
+    # Get category data, loading it if needed
+    @property
+    def data(self):
+        with self.lock:
+            if self._data is None:
+                self._data = self.load(self.name)
+            self.last_used = monotonic()
+            return self._data
+
+    # Check if category data is loaded
+    def loaded(self):
+        return self._data is not None
+
+    # Check if category data is loaded but not used for seconds
+    def idle(self, seconds):
+        return self.loaded() and monotonic() - self.last_used > seconds
+
+    # Drop category data (reloaded on next access)
+    def evict(self):
+        with self.lock:
+            self._data = None
+
+    def __len__(self):
+        return len(self.data)
+
+    def __iter__(self):
+        return iter(self.data)
+
+    def __contains__(self, key):
+        return key in self.data
+
+    def __getitem__(self, key):
+        return self.data[key]
+
+    def keys(self):
+        return self.data.keys()
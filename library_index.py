@@ -0,0 +1,101 @@
+from collections import defaultdict
+from time import monotonic
+
+__author__ = "johanpalmqvist"
+
+
+# Build artist, album, title and genre sources from the library titles
+# (LMS titles_loop) in linear time. Tracks are grouped by album_id up front
+# so each album only visits its own tracks. Returns the sources together
+# with a dict of build statistics.
+def build_sources(results, log=None):
+    start = monotonic()
+    sources = {
+        "artist": defaultdict(dict),
+        "album": defaultdict(dict),
+        "title": defaultdict(dict),
+        "genre": defaultdict(dict),
+    }
+    artists = sources["artist"]
+    albums = sources["album"]
+    titles = sources["title"]
+    genres = sources["genre"]
+
+    # Group tracks by album_id, artist_id and genre_id (keeping library
+    # order) and load artist sources in the same pass
+    tracks_by_album = defaultdict(list)
+    artist_ids = set()
+    genre_ids = set()
+    for result in results:
+        if "album_id" in result:
+            tracks_by_album[result["album_id"]].append(result)
+        if "artist_id" in result:
+            artist_ids.add(result["artist_id"])
+        if "genre_id" in result:
+            genre_ids.add(result["genre_id"])
+        try:
+            if not artists[result["artist"]]:
+                artists[result["artist"]]["artist_id"] = result["artist_id"]
+                artists[result["artist"]]["album"] = []
+        except Exception as e:
+            _warning(log, "Failed to load artist. Exception: {}".format(e))
+
+    for result in results:
+        # Album and title sources
+        try:
+            if not albums[result["album"]]:
+                albums[result["album"]]["album_id"] = result["album_id"]
+                albums[result["album"]]["title"] = []
+                album_by_artist = "{} by {}".format(
+                    result["album"], result["artist"]
+                )
+                albums[album_by_artist]["album_id"] = result["album_id"]
+                albums[album_by_artist]["title"] = []
+                artists[result["artist"]]["album"].append(result["album_id"])
+                for track in tracks_by_album[result["album_id"]]:
+                    try:
+                        titles[track["title"]] = {
+                            "title_id": track["id"],
+                            "url": track["url"],
+                        }
+                        title_by_artist = "{} by {}".format(
+                            track["title"], track["artist"]
+                        )
+                        titles[title_by_artist] = {
+                            "title_id": track["id"],
+                            "url": track["url"],
+                        }
+                        albums[result["album"]]["title"].append(track["id"])
+                        albums[album_by_artist]["title"].append(track["id"])
+                    except Exception as e:
+                        _warning(
+                            log,
+                            "Failed to load album. Exception: {}".format(e),
+                        )
+        except Exception as e:
+            _warning(log, "Failed to load album. Exception: {}".format(e))
+
+        # Genre sources
+        try:
+            if not genres[result["genre"]]:
+                genres[result["genre"]]["genre_id"] = result["genre_id"]
+        except Exception as e:
+            _warning(log, "Failed to load genre. Exception: {}".format(e))
+
+    stats = {
+        "tracks": len(results),
+        "album_ids": len(tracks_by_album),
+        "artist_ids": len(artist_ids),
+        "genre_ids": len(genre_ids),
+        "artist": len(artists),
+        "album": len(albums),
+        "title": len(titles),
+        "genre": len(genres),
+        "seconds": monotonic() - start,
+    }
+    return sources, stats
+
+
+def _warning(log, message):
+    if log is not None:
+        log.warning(message)
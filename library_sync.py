@@ -0,0 +1,61 @@
+import hashlib
+import json
+from collections import defaultdict
+
+__author__ = "johanpalmqvist"
+
+# Tags needed to fingerprint albums (album_id, modificationTime)
+FINGERPRINT_TAGS = "en"
+
+# Fall back to a full resync if more than this fraction of albums changed
+MAX_CHANGED_FRACTION = 0.25
+
+
+# Get {album_id: fingerprint} of tracks (track ids and modification times)
+def album_fingerprints(tracks):
+    album_tracks = defaultdict(list)
+    for track in tracks:
+        album_tracks[str(track.get("album_id"))].append(
+            (str(track.get("id")), str(track.get("modificationTime")))
+        )
+    return {
+        album_id: hashlib.sha1(
+            json.dumps(sorted(entries)).encode("utf-8")
+        ).hexdigest()
+        for album_id, entries in album_tracks.items()
+    }
+
+
+# Check if tracks carry what album_fingerprints needs
+def fingerprintable(tracks):
+    return all(
+        "modificationTime" in track and "album_id" in track for track in tracks
+    )
+
+
+# Compare album fingerprints, returning (changed, removed) album ids where
+# changed includes added albums
+def diff_albums(old, new):
+    changed = {
+        album_id
+        for album_id, fingerprint in new.items()
+        if old.get(album_id) != fingerprint
+    }
+    removed = set(old) - set(new)
+    return changed, removed
+
+
+# Replace tracks of changed and removed albums with fetched tracks, in the
+# order of listing (the current library titles, as listed for
+# album_fingerprints) so the result is ordered like a full fetch
+def apply_album_changes(tracks, changed, removed, fetched, listing):
+    dropped = changed | removed
+    order = {
+        str(track.get("id")): position
+        for position, track in enumerate(listing)
+    }
+    merged = [
+        track for track in tracks if str(track.get("album_id")) not in dropped
+    ] + list(fetched)
+    merged.sort(key=lambda track: order.get(str(track.get("id")), len(order)))
+    return merged
@@ -1,13 +1,43 @@
 import requests
+from threading import Lock
+from time import monotonic
+from urllib.parse import quote
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 
 __author__ = "johanpalmqvist"
 
 # Timeout time for LMS requests
 TIMEOUT = 60
 
+# Number of pooled keep-alive connections to LMS
+POOL_SIZE = 4
+
+# Number of library track ids added to a playlist per request
+BATCH_SIZE = 100
+
+# Tags requested for library titles (modificationTime is used to detect
+# changed albums when synchronizing incrementally)
+LIBRARY_TAGS = "aegilnpstu"
+
+# Seconds a player status snapshot is reused (any other command sent to the
+# player discards it)
+STATUS_TTL = 2
+
+# Tags requested for the current track with player status (artist, album)
+STATUS_TAGS = "al"
+
 
 class LMSClient(object):
-    def __init__(self, lms_server, lms_port, lms_username, lms_password):
+    def __init__(
+        self,
+        lms_server,
+        lms_port,
+        lms_username,
+        lms_password,
+        pool_size=POOL_SIZE,
+        keep_alive=True,
+    ):
         self.lms_server = lms_server
         self.lms_port = lms_port
         self.lms_username = lms_username
@@ -27,17 +57,46 @@ class LMSClient(object):
             "X-Requested-With": "XMLHttpRequest",
             "Content-type": "application/x-www-form-urlencoded",
         }
+        if not keep_alive:
+            self.headers["Connection"] = "close"
+        self.pool_size = pool_size
+        self.session = self.new_session()
+        # Number of requests sent to LMS (for statistics)
+        self.request_count = 0
+        # {playerid: (fetched, status snapshot)}
+        self.status_cache = {}
+        self.status_lock = Lock()
+
+    # Create HTTP session with a pool of keep-alive connections to LMS.
+    # Only failures to connect are retried (once): a request that may have
+    # reached LMS is never sent again, as commands like "mixer volume +5"
+    # or "playlist jump +1" aren't safe to repeat. Pooled connections
+    # closed by LMS are dropped by the pool before they are reused.
+    def new_session(self):
+        session = requests.Session()
+        adapter = HTTPAdapter(
+            pool_connections=1,
+            pool_maxsize=self.pool_size,
+            pool_block=False,
+            max_retries=Retry(
+                total=1, connect=1, read=0, redirect=0, status=0, other=0
+            ),
+        )
+        session.mount("http://", adapter)
+        session.mount("https://", adapter)
+        return session
+
+    # Close pooled connections
+    def close(self):
+        self.session.close()
 
     # Send JSON-RPC request to LMS
     def lms_request(self, payload):
+        self.request_count += 1
+        with self.status_lock:
+            self.status_cache.pop(payload["params"][0], None)
         try:
-            response = requests.post(
-                self.lms_json_rpc_url,
-                json=payload,
-                headers=self.headers,
-                timeout=TIMEOUT,
-            )
-            return response.json()
+            return self.post(payload).json()
         except Exception as e:
             raise Exception(
                 "Could not connect to server {}: {}".format(
@@ -45,6 +104,15 @@ class LMSClient(object):
                 )
             )
 
+    # Post JSON-RPC payload using pooled session
+    def post(self, payload):
+        return self.session.post(
+            self.lms_json_rpc_url,
+            json=payload,
+            headers=self.headers,
+            timeout=TIMEOUT,
+        )
+
     # Get players from LMS
     def get_players(self):
         payload = {
@@ -151,6 +219,43 @@ class LMSClient(object):
         }
         return self.lms_request(payload)["result"]["titles_loop"]
 
+    # Get page of library titles (with tags, optionally of one album) from
+    # LMS
+    def get_library_titles(
+        self, start, count, tags=LIBRARY_TAGS, album_id=None
+    ):
+        command = ["titles", str(start), str(count)]
+        if album_id is not None:
+            command.append("album_id:{}".format(album_id))
+        command.append("tags:{}".format(tags))
+        payload = {
+            "id": 1,
+            "method": "slim.request",
+            "params": ["query", command],
+        }
+        return self.lms_request(payload)["result"].get("titles_loop", [])
+
+    # Get library titles from LMS one page at a time (so only a page of
+    # titles is held in memory at once)
+    def iter_library_titles(self, page_size, tags=LIBRARY_TAGS, album_id=None):
+        start = 0
+        while True:
+            titles = self.get_library_titles(start, page_size, tags, album_id)
+            if titles:
+                yield titles
+            if len(titles) < page_size:
+                return
+            start += len(titles)
+
+    # Get time of last library scan from LMS
+    def get_library_last_scan(self):
+        payload = {
+            "id": 1,
+            "method": "slim.request",
+            "params": ["", ["serverstatus", 0, 0]],
+        }
+        return self.lms_request(payload)["result"].get("lastscan")
+
     # Get library total duration from LMS
     def get_library_total_duration(self):
         payload = {
@@ -206,23 +311,69 @@ class LMSClient(object):
         }
         return self.lms_request(payload)
 
-    # Add tracklist to playlist and start playback
-    def play_tracklist(self, playerid, tracklist):
+    # Add tracklist to playlist and start playback (playback starts with
+    # the first track while the rest are still being queued). track_ids
+    # maps urls of library tracks to their track ids (see
+    # library_track_ids).
+    def play_tracklist(self, playerid, tracklist, track_ids=None):
+        tracklist = library_track_ids(tracklist, track_ids)
         self.playlist_clear(playerid)
         self.playlist_shuffle(playerid, 1)
         self.playlist_repeat(playerid, 2)
-        for track in tracklist:
-            payload = {
-                "id": 1,
-                "method": "slim.request",
-                "params": [playerid, ["playlist", "add", track]],
-            }
-            self.lms_request(payload)
+        if not tracklist:
+            return None
+        self.playlist_add_tracks(playerid, tracklist[:1])
         payload = {
             "id": 1,
             "method": "slim.request",
             "params": [playerid, ["play"]],
         }
+        response = self.lms_request(payload)
+        self.playlist_add_tracks(playerid, tracklist[1:])
+        return response
+
+    # Add tracks to playlist in order. Consecutive library track ids are
+    # added up to BATCH_SIZE at a time with a single playlistcontrol
+    # request, other tracks (urls/paths) with one request each.
+    def playlist_add_tracks(self, playerid, tracklist):
+        batch = []
+        for track in tracklist:
+            if str(track).isdigit():
+                batch.append(str(track))
+                if len(batch) == BATCH_SIZE:
+                    self.playlist_add_track_ids(playerid, batch)
+                    batch = []
+                continue
+            if batch:
+                self.playlist_add_track_ids(playerid, batch)
+                batch = []
+            self.playlist_add(playerid, track)
+        if batch:
+            self.playlist_add_track_ids(playerid, batch)
+
+    # Add library tracks (track ids) to playlist
+    def playlist_add_track_ids(self, playerid, track_ids):
+        payload = {
+            "id": 1,
+            "method": "slim.request",
+            "params": [
+                playerid,
+                [
+                    "playlistcontrol",
+                    "cmd:add",
+                    "track_id:{}".format(",".join(track_ids)),
+                ],
+            ],
+        }
+        return self.lms_request(payload)
+
+    # Add track to playlist
+    def playlist_add(self, playerid, track):
+        payload = {
+            "id": 1,
+            "method": "slim.request",
+            "params": [playerid, ["playlist", "add", track]],
+        }
         return self.lms_request(payload)
 
     # Add favorite to playlist and start playback
@@ -283,8 +434,9 @@ class LMSClient(object):
         }
         return self.lms_request(payload)
 
-    # Load playlist from local file and start playback
-    def play_local_playlist(self, playerid, playlist_file):
+    # Load playlist from local file and start playback (track_ids as for
+    # play_tracklist)
+    def play_local_playlist(self, playerid, playlist_file, track_ids=None):
         import re
 
         fh = open(playlist_file, "r")
@@ -294,7 +446,7 @@ class LMSClient(object):
         for title in data:
             if not re.search("^#", title):
                 tracklist.append(str.strip(title))
-        return self.play_tracklist(playerid, tracklist)
+        return self.play_tracklist(playerid, tracklist, track_ids)
 
     # Clear playlist
     def playlist_clear(self, playerid):
@@ -413,14 +565,30 @@ class LMSClient(object):
         }
         return self.lms_request(payload)
 
-    # Get volume
-    def get_volume(self, playerid):
+    # Get player status snapshot (mode, volume, muting, power and artist,
+    # title and album of the current track) with a single status request,
+    # reusing a snapshot fetched less than STATUS_TTL seconds ago
+    def get_status(self, playerid, refresh=False):
+        with self.status_lock:
+            cached = self.status_cache.get(playerid)
+        if cached and not refresh and monotonic() - cached[0] < STATUS_TTL:
+            return cached[1]
         payload = {
             "id": 1,
             "method": "slim.request",
-            "params": [playerid, ["status"]],
+            "params": [
+                playerid,
+                ["status", "-", 1, "tags:{}".format(STATUS_TAGS)],
+            ],
         }
-        return self.lms_request(payload)["result"]["mixer volume"]
+        status = status_snapshot(self.lms_request(payload)["result"])
+        with self.status_lock:
+            self.status_cache[playerid] = (monotonic(), status)
+        return status
+
+    # Get volume
+    def get_volume(self, playerid):
+        return self.get_status(playerid)["volume"]
 
     # Power off
     def power_off(self, playerid):
@@ -460,9 +628,36 @@ class LMSClient(object):
 
     # Get current player mode status
     def get_current_mode(self, playerid):
-        payload = {
-            "id": 1,
-            "method": "slim.request",
-            "params": [playerid, ["status"]],
-        }
-        return self.lms_request(payload)["result"]["mode"]
+        return self.get_status(playerid)["mode"]
+
+
+# Get status snapshot from result of status request (with STATUS_TAGS)
+def status_snapshot(result):
+    track = (result.get("playlist_loop") or [{}])[0]
+    volume = result.get("mixer volume")
+    return {
+        "mode": result.get("mode"),
+        "volume": volume,
+        "muting": volume is not None and float(volume) < 0,
+        "power": result.get("power"),
+        "artist": track.get("artist"),
+        "title": track.get("title") or result.get("current_title"),
+        "album": track.get("album"),
+    }
+
+
+# Replace urls and paths of library tracks in tracklist with their track ids
+# (track_ids maps urls to track ids, as in the title sources). Paths are
+# looked up as file urls. Other tracks are kept as they are.
+def library_track_ids(tracklist, track_ids):
+    if not track_ids:
+        return list(tracklist)
+    tracks = []
+    for track in tracklist:
+        track_id = track_ids.get(track)
+        if track_id is None and str(track).startswith("/"):
+            track_id = track_ids.get(
+                "file://{}".format(quote(track, safe="/;:@&=+$,!~*'()"))
+            )
+        tracks.append(track if track_id is None else track_id)
+    return tracks
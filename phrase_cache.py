@@ -0,0 +1,71 @@
+from collections import OrderedDict
+from threading import Lock
+
+__author__ = "johanpalmqvist"
+
+# Default number of phrases remembered
+SIZE = 128
+
+
+# Least recently used cache of phrase match results. All entries belong to
+# one version (of the sources and players) and are dropped when it changes.
+class PhraseCache(object):
+    def __init__(self, size=SIZE):
+        self.size = size
+        self.version = None
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.lock = Lock()
+
+    # Get normalized phrase used as cache key
+    @staticmethod
+    def normalize(phrase):
+        return phrase.strip()
+
+    # Get (found, result) for phrase in version
+    def get(self, phrase, version):
+        key = self.normalize(phrase)
+        with self.lock:
+            if version != self.version:
+                self.entries.clear()
+                self.version = version
+            if key in self.entries:
+                self.entries.move_to_end(key)
+                self.hits += 1
+                return True, self.entries[key]
+            self.misses += 1
+            return False, None
+
+    # Remember result for phrase in version (evicting the least recently
+    # used phrase when full)
+    def put(self, phrase, version, result):
+        if self.size <= 0:
+            return
+        key = self.normalize(phrase)
+        with self.lock:
+            if version != self.version:
+                self.entries.clear()
+                self.version = version
+            self.entries[key] = result
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.size:
+                self.entries.popitem(last=False)
+
+    # Forget all phrases
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+            self.version = None
+
+    # Get hit and miss counters
+    def stats(self):
+        with self.lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+                "entries": len(self.entries),
+                "size": self.size,
+            }
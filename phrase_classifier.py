@@ -0,0 +1,134 @@
+import re
+
+__author__ = "johanpalmqvist"
+
+# Specific query categories (in priority order), each with a regex of the
+# same name capturing the entity in a group of the same name
+CATEGORIES = (
+    "album",
+    "artist",
+    "title",
+    "genre",
+    "music",
+    "playlist",
+    "favorite",
+    "podcast",
+)
+
+# Regexes applied to the phrase before classifying it
+PHRASE_REGEXES = ("squeezebox_bonus", "on_squeezebox", "backend")
+
+# All regexes used by the classifier
+REGEXES = PHRASE_REGEXES + CATEGORIES
+
+
+# Classifies phrases with the regexes compiled once. The category regexes
+# are joined into one alternation so a single match finds the first
+# category (in priority order) matching the start of the phrase.
+class PhraseClassifier(object):
+    def __init__(self, patterns):
+        self.bonus_regex = re.compile(patterns["squeezebox_bonus"])
+        self.on_squeezebox_regex = re.compile(patterns["on_squeezebox"])
+        self.backend_regex = re.compile(patterns["backend"])
+        self.categories = [
+            category for category in CATEGORIES if category in patterns
+        ]
+        self.regex = re.compile(
+            "|".join(
+                "(?:{})".format(patterns[category])
+                for category in self.categories
+            )
+        )
+
+    # Check if phrase mentions squeezebox
+    def has_bonus(self, phrase):
+        return self.bonus_regex.search(phrase) is not None
+
+    # Remove "on squeezebox" from phrase
+    def strip_squeezebox(self, phrase):
+        return self.on_squeezebox_regex.sub("", phrase).strip()
+
+    # Split phrase into backend (None if not given) and rest of phrase
+    def split_backend(self, phrase):
+        match = self.backend_regex.search(phrase)
+        if not match:
+            return None, phrase
+        if match.end() == len(phrase):
+            # Nothing left to remove after the (only) match
+            rest = phrase[: match.start()]
+        else:
+            rest = self.backend_regex.sub("", phrase)
+        return match.group("backend"), rest
+
+    # Get category and entity of phrase ((None, None) if no category
+    # matches)
+    def classify(self, phrase):
+        match = self.regex.match(phrase)
+        if match:
+            groups = match.groupdict()
+            for category in self.categories:
+                if groups[category] is not None:
+                    return category, groups[category]
+        return None, None
+
+
+# Load classifier regexes from locale directory
+def load_patterns(directory):
+    patterns = {}
+    for name in REGEXES:
+        with open("{}/{}.regex".format(directory, name)) as f:
+            patterns[name] = f.read().strip()
+    return patterns
+
+
+if __name__ == "__main__":
+    import argparse
+    from os.path import abspath, dirname, join
+    from time import perf_counter
+
+    parser = argparse.ArgumentParser(
+        description="Benchmark phrase classification (phrases per second)"
+    )
+    parser.add_argument("--lang", default="en-us")
+    parser.add_argument("--rounds", type=int, default=20000)
+    args = parser.parse_args()
+    patterns = load_patterns(
+        join(abspath(dirname(__file__)), "locale", args.lang)
+    )
+    phrases = [
+        "the album dark side of the moon",
+        "something by the beatles",
+        "the song yesterday",
+        "genre jazz",
+        "some jazz music",
+        "my playlist morning",
+        "radio station slay radio",
+        "podcast news cast",
+        "bohemian rhapsody",
+    ]
+
+    # Previous approach: one re.match per category in priority order
+    def sequential(phrase):
+        for category in CATEGORIES:
+            match = re.match(patterns[category], phrase)
+            if match:
+                return category, match.groupdict()[category]
+        return None, None
+
+    classifier = PhraseClassifier(patterns)
+    for phrase in phrases:
+        assert classifier.classify(phrase) == sequential(phrase), phrase
+    for name, classify in (
+        ("sequential", sequential),
+        ("classifier", classifier.classify),
+    ):
+        start = perf_counter()
+        for _ in range(args.rounds):
+            for phrase in phrases:
+                classify(phrase)
+        seconds = perf_counter() - start
+        print(
+            "{}: {:.0f} phrases/s".format(
+                name, args.rounds * len(phrases) / seconds
+            )
+        )
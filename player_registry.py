@@ -0,0 +1,100 @@
+from threading import RLock
+from time import monotonic
+from fuzzywuzzy.process import extractOne
+from fuzzywuzzy.fuzz import QRatio
+from fuzzywuzzy.utils import full_process
+
+__author__ = "johanpalmqvist"
+
+# Default time (in seconds) the players list is cached
+TTL = 300
+
+# Minimum confidence for a player name match
+MIN_CONFIDENCE = 0.5
+
+
+class PlayerRegistry(object):
+    def __init__(self, lms, ttl=TTL):
+        self.lms = lms
+        self.ttl = ttl
+        # Incremented whenever the set of players changes
+        self.version = 0
+        self.fetched = None
+        self.refreshes = 0
+        self._players = []
+        self._resolved = {}
+        self._lock = RLock()
+
+    # Get players (from cache unless expired or forced)
+    def get_players(self, refresh=False):
+        with self._lock:
+            if refresh or self.expired():
+                self.refresh()
+            return self._players
+
+    # Check if cached players list has expired
+    def expired(self):
+        return (
+            self.fetched is None
+            or self.ttl <= 0
+            or monotonic() - self.fetched > self.ttl
+        )
+
+    # Fetch players from LMS, forgetting resolutions if the players changed
+    def refresh(self):
+        with self._lock:
+            players = self.lms.get_players()
+            self.fetched = monotonic()
+            self.refreshes += 1
+            if self._signature(players) != self._signature(self._players):
+                self._resolved = {}
+                self.version += 1
+            self._players = players
+            return players
+
+    # Forget cached players and resolutions
+    def invalidate(self):
+        with self._lock:
+            self.fetched = None
+            self._resolved = {}
+            self.version += 1
+
+    # Resolve name to (player name, playerid, confidence), refreshing the
+    # players list once if the cached one has no good match
+    def resolve(self, name):
+        with self._lock:
+            refreshes = self.refreshes
+            players = self.get_players()
+            if name in self._resolved:
+                return self._resolved[name]
+            resolved = self._match(name, players)
+            if resolved[1] is None and self.refreshes == refreshes:
+                resolved = self._match(name, self.get_players(refresh=True))
+            if resolved[1] is not None:
+                self._resolved[name] = resolved
+            return resolved
+
+    @staticmethod
+    def _match(name, players):
+        match = extractOne(
+            name,
+            [player["name"] for player in players],
+            processor=full_process,
+            scorer=QRatio,
+            score_cutoff=0,
+        )
+        if match is None:
+            return None, None, 0.0
+        player_name, confidence = match
+        confidence = confidence / 100.0
+        if confidence <= MIN_CONFIDENCE:
+            return None, None, confidence
+        playerid = None
+        for player in players:
+            if player_name == player["name"]:
+                playerid = player["playerid"]
+        return player_name, playerid, confidence
+
+    @staticmethod
+    def _signature(players):
+        return [(player["playerid"], player["name"]) for player in players]
@@ -0,0 +1,246 @@
+import socket
+from threading import Condition, Event, Lock, Thread
+from time import monotonic
+from urllib.parse import quote, unquote
+
+__author__ = "johanpalmqvist"
+
+# Port of the LMS command line interface
+CLI_PORT = 9090
+
+# Seconds to wait before reconnecting to the CLI
+RECONNECT_DELAY = 10
+
+# Seconds to wait for the CLI to report a change made by a command
+CHANGE_TIMEOUT = 1
+
+# Notifications subscribed to
+SUBSCRIPTIONS = "client,mixer,pause,play,playlist,power,stop"
+
+# Status tags mapped to player state keys
+STATUS_KEYS = {
+    "mode": "mode",
+    "mixer volume": "volume",
+    "power": "power",
+    "title": "title",
+    "artist": "artist",
+}
+
+
+# In-memory state of players (mode, volume, current track and power) kept
+# up to date by subscribing to LMS player events over the CLI. State is only
+# served while connected.
+class PlayerStateCache(object):
+    def __init__(
+        self,
+        lms_server,
+        cli_port=CLI_PORT,
+        lms_username=None,
+        lms_password=None,
+        reconnect_delay=RECONNECT_DELAY,
+    ):
+        self.lms_server = lms_server
+        self.cli_port = int(cli_port or CLI_PORT)
+        self.lms_username = lms_username
+        self.lms_password = lms_password
+        self.reconnect_delay = reconnect_delay
+        self.states = {}
+        self.updated = {}
+        self.connected = False
+        self.changed = Condition()
+        self.send_lock = Lock()
+        self.stopped = Event()
+        self.socket = None
+        self.thread = None
+
+    # Start listening in a background thread
+    def start(self):
+        self.stopped.clear()
+        self.thread = Thread(
+            target=self.run, name="SqueezeBoxPlayerState", daemon=True
+        )
+        self.thread.start()
+
+    # Stop listening and forget player state
+    def stop(self):
+        self.stopped.set()
+        self.disconnect()
+
+    # Get copy of player state (None if unknown or not connected)
+    def get_state(self, playerid):
+        with self.changed:
+            if not self.connected or playerid not in self.states:
+                return None
+            return dict(self.states[playerid])
+
+    # Get value of key in player state (None if unknown). With since, wait
+    # for a value reported after since (a monotonic time), up to timeout.
+    def get(self, playerid, key, since=None, timeout=CHANGE_TIMEOUT):
+        deadline = monotonic() + timeout
+        with self.changed:
+            while True:
+                if not self.connected:
+                    return None
+                if playerid not in self.states:
+                    self.request_status(playerid)
+                    return None
+                updated = self.updated.get((playerid, key))
+                if updated is not None and (since is None or updated >= since):
+                    return self.states[playerid].get(key)
+                if since is None:
+                    return None
+                remaining = deadline - monotonic()
+                if remaining <= 0:
+                    return None
+                self.changed.wait(remaining)
+
+    # Ask the CLI for the full status of player (answered asynchronously)
+    def request_status(self, playerid):
+        self.send(playerid, "status", "-", "1", "tags:a")
+
+    # Send command to the CLI (ignored if not connected)
+    def send(self, *command):
+        line = " ".join(quote(str(part), safe="") for part in command)
+        with self.send_lock:
+            if self.socket is None:
+                return
+            try:
+                self.socket.sendall("{}\n".format(line).encode("utf-8"))
+            except OSError:
+                pass
+
+    # Connect, subscribe and process notifications until stopped
+    def run(self):
+        while not self.stopped.is_set():
+            try:
+                self.connect()
+                self.listen()
+            except OSError:
+                pass
+            finally:
+                self.disconnect()
+            self.stopped.wait(self.reconnect_delay)
+
+    # Connect to the CLI, subscribe to notifications and request the
+    # players (whose status is requested in turn)
+    def connect(self):
+        connection = socket.create_connection(
+            (self.lms_server, self.cli_port), timeout=self.reconnect_delay
+        )
+        connection.settimeout(None)
+        with self.send_lock:
+            self.socket = connection
+        if self.lms_username and self.lms_password:
+            self.send("login", self.lms_username, self.lms_password)
+        self.send("subscribe", SUBSCRIPTIONS)
+        self.send("players", "0", "100")
+        with self.changed:
+            self.connected = True
+
+    # Close connection and forget player state (it goes stale while
+    # disconnected)
+    def disconnect(self):
+        with self.send_lock:
+            connection, self.socket = self.socket, None
+        if connection is not None:
+            try:
+                connection.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+            connection.close()
+        with self.changed:
+            self.connected = False
+            self.states = {}
+            self.updated = {}
+            self.changed.notify_all()
+
+    # Process notifications line by line
+    def listen(self):
+        with self.send_lock:
+            connection = self.socket
+        if connection is None:
+            return
+        for line in connection.makefile("r", encoding="utf-8"):
+            if self.stopped.is_set():
+                return
+            self.handle_line(line)
+
+    # Update player state from one CLI line
+    def handle_line(self, line):
+        tokens = [unquote(token) for token in line.strip().split(" ")]
+        if not tokens or not tokens[0]:
+            return
+        if tokens[0] == "players":
+            for token in tokens:
+                name, _, value = token.partition(":")
+                if name == "playerid":
+                    self.request_status(value)
+            return
+        if len(tokens) < 2 or tokens[0] in ("login", "subscribe", "listen"):
+            return
+        playerid, command, args = tokens[0], tokens[1], tokens[2:]
+        action = args[0] if args else None
+        value = args[1] if len(args) > 1 else None
+        if command == "status":
+            changes = {"title": None, "artist": None}
+            for token in args:
+                name, _, value = token.partition(":")
+                if name in STATUS_KEYS:
+                    changes[STATUS_KEYS[name]] = value
+            for key in ("volume", "power"):
+                if _is_int(changes.get(key)):
+                    changes[key] = int(changes[key])
+            self.update(playerid, changes)
+        elif command == "mixer" and action == "volume" and _is_level(value):
+            self.update(playerid, {"volume": int(value)})
+        elif command == "playlist" and action == "pause" and _is_flag(value):
+            self.update(playerid, {"mode": _pause_mode(value)})
+        elif command == "playlist" and action == "stop":
+            self.update(playerid, {"mode": "stop"})
+        elif command == "playlist" and action == "newsong":
+            self.update(playerid, {"mode": "play", "title": value})
+            self.request_status(playerid)
+        elif command == "pause" and _is_flag(action):
+            self.update(playerid, {"mode": _pause_mode(action)})
+        elif command in ("play", "stop"):
+            self.update(playerid, {"mode": command})
+        elif command == "power" and _is_int(action):
+            self.update(playerid, {"power": int(action)})
+        elif command == "client" and action in ("disconnect", "forget"):
+            self.forget(playerid)
+        elif command in ("client", "mixer", "pause", "playlist", "power"):
+            # Relative or toggling change, ask for the resulting state
+            self.request_status(playerid)
+
+    # Merge changes into player state
+    def update(self, playerid, changes):
+        now = monotonic()
+        with self.changed:
+            self.states.setdefault(playerid, {}).update(changes)
+            for key in changes:
+                self.updated[(playerid, key)] = now
+            self.changed.notify_all()
+
+    # Forget state of player
+    def forget(self, playerid):
+        with self.changed:
+            self.states.pop(playerid, None)
+            for key in [key for key in self.updated if key[0] == playerid]:
+                del self.updated[key]
+
+
+def _is_int(value):
+    return value is not None and value.lstrip("-").isdigit()
+
+
+# Absolute level (relative changes are echoed as +N and -N)
+def _is_level(value):
+    return value is not None and value.isdigit()
+
+
+def _is_flag(value):
+    return value in ("0", "1")
+
+
+def _pause_mode(value):
+    return "pause" if value == "1" else "play"
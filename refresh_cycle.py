@@ -0,0 +1,88 @@
+from contextlib import contextmanager
+from time import monotonic
+
+__author__ = "johanpalmqvist"
+
+
+# One refresh of the caches: reads server state (library total duration,
+# last scan) at most once and records LMS requests and time spent per stage
+class RefreshCycle(object):
+    def __init__(self, lms):
+        self.lms = lms
+        self.started = monotonic()
+        self.started_request_count = lms.request_count
+        self.stages = []
+        self._state = {}
+        self._checkpoint = (self.started, self.started_request_count)
+
+    # Get server state value, fetching it only once per cycle
+    def server_state(self, name, fetch):
+        if name not in self._state:
+            with self.stage(name):
+                self._state[name] = fetch()
+        return self._state[name]
+
+    # Get library total duration (once per cycle)
+    def library_total_duration(self):
+        return self.server_state(
+            "library_total_duration", self.lms.get_library_total_duration
+        )
+
+    # Get time of last library scan (once per cycle)
+    def library_last_scan(self):
+        return self.server_state(
+            "library_last_scan", self.lms.get_library_last_scan
+        )
+
+    # Record LMS requests and time spent in stage
+    @contextmanager
+    def stage(self, name):
+        requests = self.lms.request_count
+        start = monotonic()
+        try:
+            yield
+        finally:
+            self.stages.append(
+                (name, self.lms.request_count - requests, monotonic() - start)
+            )
+
+    # Record LMS requests and time spent since previous checkpoint (or
+    # start of cycle) as stage
+    def checkpoint(self, name):
+        now = (monotonic(), self.lms.request_count)
+        self.stages.append(
+            (
+                name,
+                now[1] - self._checkpoint[1],
+                now[0] - self._checkpoint[0],
+            )
+        )
+        self._checkpoint = now
+
+    # Record time spent in stage run concurrently with other stages (None if
+    # it failed), where the LMS requests can't be attributed to the stage
+    def record(self, name, seconds):
+        self.stages.append((name, None, seconds))
+
+    # Get total LMS requests made in cycle
+    def request_count(self):
+        return self.lms.request_count - self.started_request_count
+
+    # Get per-stage breakdown of requests made and time spent
+    def summary(self):
+        return "{} requests in {:.2f}s ({})".format(
+            self.request_count(),
+            monotonic() - self.started,
+            ", ".join(
+                _format_stage(name, requests, seconds)
+                for name, requests, seconds in self.stages
+            ),
+        )
+
+
+def _format_stage(name, requests, seconds):
+    if seconds is None:
+        return "{}: failed".format(name)
+    if requests is None:
+        return "{}: {:.2f}s".format(name, seconds)
+    return "{}: {} requests {:.2f}s".format(name, requests, seconds)
@@ -0,0 +1,243 @@
+import json
+import sqlite3
+from collections.abc import Mapping
+from threading import Lock, RLock
+from .fuzzy_index import process_key, process_query
+
+__author__ = "johanpalmqvist"
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS sources (
+    id INTEGER PRIMARY KEY,
+    category TEXT NOT NULL,
+    key TEXT NOT NULL,
+    value TEXT NOT NULL,
+    UNIQUE (category, key)
+);
+"""
+
+
+# SQLite store for sources with an FTS5 index of the processed keys for
+# candidate retrieval (trigram tokenizer when available, words otherwise).
+# Reads share one connection, writes go through their own connection (in
+# WAL mode, so reads see the previous sources until a write commits).
+class SQLiteStore(object):
+    def __init__(self, filename):
+        self.filename = filename
+        self.lock = RLock()
+        self.write_lock = Lock()
+        self.connection = sqlite3.connect(filename, check_same_thread=False)
+        with self.lock, self.connection:
+            self.connection.execute("PRAGMA journal_mode=WAL")
+            self.connection.executescript(SCHEMA)
+            self.tokenizer = self._create_fts()
+
+    # Close database connection
+    def close(self):
+        with self.lock:
+            self.connection.close()
+
+    # Get categories stored in database
+    def categories(self):
+        with self.lock:
+            rows = self.connection.execute(
+                "SELECT DISTINCT category FROM sources ORDER BY category"
+            ).fetchall()
+        return [row[0] for row in rows]
+
+    # Get {category: SQLiteTable} for all stored categories
+    def tables(self):
+        return {
+            category: SQLiteTable(self, category)
+            for category in self.categories()
+        }
+
+    # Upsert sources ({category: {key: value}}) row by row, removing keys
+    # (and categories) no longer present. Returns (written, removed) counts.
+    def write(self, sources):
+        with self.write_lock:
+            connection = sqlite3.connect(self.filename)
+            try:
+                with connection:
+                    return self._write(connection, sources)
+            finally:
+                connection.close()
+
+    def _write(self, connection, sources):
+        written = 0
+        removed = 0
+        categories = {
+            row[0]
+            for row in connection.execute(
+                "SELECT DISTINCT category FROM sources"
+            )
+        }
+        for category in categories - set(sources):
+            removed += self._delete_category(connection, category)
+        for category, mapping in sources.items():
+            existing = {
+                key: (rowid, value)
+                for rowid, key, value in connection.execute(
+                    "SELECT id, key, value FROM sources "
+                    "WHERE category = ?",
+                    (category,),
+                )
+            }
+            for key, value in mapping.items():
+                value = _encode(value)
+                if key in existing:
+                    rowid, old_value = existing.pop(key)
+                    if old_value == value:
+                        continue
+                    connection.execute(
+                        "UPDATE sources SET value = ? WHERE id = ?",
+                        (value, rowid),
+                    )
+                else:
+                    rowid = connection.execute(
+                        "INSERT INTO sources (category, key, value) "
+                        "VALUES (?, ?, ?)",
+                        (category, key, value),
+                    ).lastrowid
+                    connection.execute(
+                        "INSERT INTO sources_fts (rowid, norm) "
+                        "VALUES (?, ?)",
+                        (rowid, process_key(key)),
+                    )
+                written += 1
+            for rowid, _ in existing.values():
+                self._delete_row(connection, rowid)
+                removed += 1
+        return written, removed
+
+    # Get value of key in category (None if missing)
+    def get(self, category, key):
+        with self.lock:
+            row = self.connection.execute(
+                "SELECT value FROM sources WHERE category = ? AND key = ?",
+                (category, key),
+            ).fetchone()
+        return json.loads(row[0]) if row else None
+
+    # Get keys of category (in sorted order, same as the cache files)
+    def keys(self, category):
+        with self.lock:
+            rows = self.connection.execute(
+                "SELECT key FROM sources WHERE category = ? ORDER BY key",
+                (category,),
+            ).fetchall()
+        return [row[0] for row in rows]
+
+    # Count keys in category
+    def count(self, category):
+        with self.lock:
+            return self.connection.execute(
+                "SELECT COUNT(*) FROM sources WHERE category = ?",
+                (category,),
+            ).fetchone()[0]
+
+    # Get (key, processed key) pairs of all keys in category (in sorted key
+    # order)
+    def processed_items(self, category):
+        with self.lock:
+            rows = self.connection.execute(
+                "SELECT s.key, f.norm FROM sources s"
+                " JOIN sources_fts f ON f.rowid = s.id"
+                " WHERE s.category = ? ORDER BY s.key",
+                (category,),
+            ).fetchall()
+        return [tuple(row) for row in rows]
+
+    # Get (key, processed key) pairs of up to limit keys in category best
+    # matching query in the FTS index, in sorted key order (so ties resolve
+    # like a full scan)
+    def candidates(self, category, query, limit):
+        match = self._match_expression(process_query(query))
+        if not match:
+            return []
+        with self.lock:
+            rows = self.connection.execute(
+                "SELECT key, norm FROM ("
+                " SELECT s.key AS key, sources_fts.norm AS norm"
+                " FROM sources_fts"
+                " JOIN sources s ON s.id = sources_fts.rowid"
+                " WHERE sources_fts MATCH ? AND s.category = ?"
+                " ORDER BY rank LIMIT ?"
+                ") ORDER BY key",
+                (match, category, limit),
+            ).fetchall()
+        return [tuple(row) for row in rows]
+
+    def _create_fts(self):
+        for tokenizer in ("trigram", "unicode61"):
+            try:
+                self.connection.execute(
+                    "CREATE VIRTUAL TABLE IF NOT EXISTS sources_fts "
+                    "USING fts5(norm, tokenize='{}')".format(tokenizer)
+                )
+            except sqlite3.OperationalError:
+                continue
+            row = self.connection.execute(
+                "SELECT sql FROM sqlite_master WHERE name = 'sources_fts'"
+            ).fetchone()
+            return "trigram" if "trigram" in row[0] else "unicode61"
+        raise sqlite3.OperationalError("SQLite FTS5 is not available")
+
+    def _match_expression(self, processed):
+        if self.tokenizer == "trigram":
+            tokens = {
+                processed[i : i + 3] for i in range(len(processed) - 2)
+            }
+        else:
+            tokens = set(processed.split())
+        return " OR ".join(
+            '"{}"'.format(token.replace('"', '""')) for token in sorted(tokens)
+        )
+
+    def _delete_row(self, connection, rowid):
+        connection.execute("DELETE FROM sources_fts WHERE rowid = ?", (rowid,))
+        connection.execute("DELETE FROM sources WHERE id = ?", (rowid,))
+
+    def _delete_category(self, connection, category):
+        rowids = [
+            row[0]
+            for row in connection.execute(
+                "SELECT id FROM sources WHERE category = ?", (category,)
+            )
+        ]
+        for rowid in rowids:
+            self._delete_row(connection, rowid)
+        return len(rowids)
+
+
+# Read-only mapping view of one category in SQLiteStore
+class SQLiteTable(Mapping):
+    def __init__(self, store, category):
+        self.store = store
+        self.category = category
+
+    def __len__(self):
+        return self.store.count(self.category)
+
+    def __iter__(self):
+        return iter(self.store.keys(self.category))
+
+    def __getitem__(self, key):
+        value = self.store.get(self.category, key)
+        if value is None:
+            raise KeyError(key)
+        return value
+
+    # Get (key, processed key) candidate pairs for query (used by
+    # MatchIndex instead of an in-memory trigram index)
+    def candidates(self, query, limit):
+        return self.store.candidates(self.category, query, limit)
+
+    # Get (key, processed key) pairs of all keys (processed keys are stored
+    # in the FTS index)
+    def processed_items(self):
+        return self.store.processed_items(self.category)
+
+
+def _encode(value):
+    return json.dumps(value, separators=(",", ":"), ensure_ascii=False)
@@ -0,0 +1,171 @@
+from bisect import bisect_left
+from os import replace
+from threading import Lock
+from time import monotonic
+
+__author__ = "johanpalmqvist"
+
+# Upper bounds (in seconds) of the histogram buckets (the last bucket has
+# no upper bound)
+BUCKETS = (
+    0.0001,
+    0.00025,
+    0.0005,
+    0.001,
+    0.0025,
+    0.005,
+    0.01,
+    0.025,
+    0.05,
+    0.1,
+    0.25,
+    0.5,
+    1.0,
+    2.5,
+    5.0,
+    10.0,
+)
+
+# Seconds of history kept in the rolling histograms
+WINDOW = 300
+
+# Number of slots the window is split into (history expires one slot at a
+# time)
+SLOTS = 10
+
+# Name of the histograms in the metrics file
+METRIC = "squeezebox_stage_seconds"
+
+
+# Rolling histograms of time spent per stage. Recording a time is a bucket
+# lookup and a few additions under a lock, so it can be left on.
+class StageMetrics(object):
+    def __init__(
+        self, enabled=True, window=WINDOW, slots=SLOTS, buckets=BUCKETS
+    ):
+        self.enabled = enabled
+        self.buckets = tuple(buckets)
+        self.slot_seconds = window / slots
+        # [(slot number, {stage: [count per bucket..., total seconds]})]
+        self.slots = [(None, {})] * slots
+        self.lock = Lock()
+
+    # Get timer whose checkpoints are recorded as stages
+    def timer(self):
+        return StageTimer(self)
+
+    # Record seconds spent in stage
+    def record(self, stage, seconds):
+        if not self.enabled:
+            return
+        bucket = bisect_left(self.buckets, seconds)
+        number = int(monotonic() // self.slot_seconds)
+        index = number % len(self.slots)
+        with self.lock:
+            slot_number, stages = self.slots[index]
+            if slot_number != number:
+                stages = {}
+                self.slots[index] = (number, stages)
+            counts = stages.get(stage)
+            if counts is None:
+                counts = stages[stage] = [0] * (len(self.buckets) + 2)
+            counts[bucket] += 1
+            counts[-1] += seconds
+
+    # Get {stage: [count per bucket..., total seconds]} over the window
+    def merged(self):
+        oldest = int(monotonic() // self.slot_seconds) - len(self.slots) + 1
+        merged = {}
+        with self.lock:
+            for number, stages in self.slots:
+                if number is None or number < oldest:
+                    continue
+                for stage, counts in stages.items():
+                    total = merged.setdefault(stage, [0] * len(counts))
+                    for i, count in enumerate(counts):
+                        total[i] += count
+        return merged
+
+    # Get {stage: histogram} over the window, where histogram has count,
+    # sum (seconds), buckets ([upper bound, cumulative count], the last
+    # bound None) and p50, p95 and p99 (upper bound of the bucket holding
+    # the percentile, None if beyond the last bound)
+    def snapshot(self):
+        bounds = self.buckets + (None,)
+        snapshot = {}
+        for stage, counts in sorted(self.merged().items()):
+            cumulative = []
+            running = 0
+            for bound, count in zip(bounds, counts):
+                running += count
+                cumulative.append([bound, running])
+            snapshot[stage] = {
+                "count": running,
+                "sum": counts[-1],
+                "buckets": cumulative,
+                "p50": _percentile(cumulative, 0.5),
+                "p95": _percentile(cumulative, 0.95),
+                "p99": _percentile(cumulative, 0.99),
+            }
+        return snapshot
+
+    # Write histograms to filename (Prometheus text format, replaced
+    # atomically)
+    def write(self, filename):
+        lines = [
+            "# HELP {} Time spent per stage over the last {:.0f}s".format(
+                METRIC, self.slot_seconds * len(self.slots)
+            ),
+            "# TYPE {} histogram".format(METRIC),
+        ]
+        for stage, histogram in self.snapshot().items():
+            for bound, count in histogram["buckets"]:
+                lines.append(
+                    '{}_bucket{{stage="{}",le="{}"}} {}'.format(
+                        METRIC,
+                        stage,
+                        "+Inf" if bound is None else repr(bound),
+                        count,
+                    )
+                )
+            lines.append(
+                '{}_sum{{stage="{}"}} {!r}'.format(
+                    METRIC, stage, histogram["sum"]
+                )
+            )
+            lines.append(
+                '{}_count{{stage="{}"}} {}'.format(
+                    METRIC, stage, histogram["count"]
+                )
+            )
+        partial_filename = "{}.partial".format(filename)
+        with open(partial_filename, "w") as f:
+            f.write("\n".join(lines) + "\n")
+        replace(partial_filename, filename)
+
+
+# Records time spent between checkpoints as stages
+class StageTimer(object):
+    def __init__(self, metrics):
+        self.metrics = metrics
+        self.started = self.last = monotonic()
+
+    # Record time since previous checkpoint (or start) as stage
+    def checkpoint(self, stage):
+        now = monotonic()
+        self.metrics.record(stage, now - self.last)
+        self.last = now
+
+    # Record time since start as stage
+    def total(self, stage):
+        self.metrics.record(stage, monotonic() - self.started)
+
+
+def _percentile(cumulative, fraction):
+    total = cumulative[-1][1]
+    if not total:
+        return None
+    for bound, count in cumulative:
+        if count >= fraction * total:
+            return bound
+    return None
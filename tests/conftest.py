@@ -0,0 +1,13 @@
+import sys
+from os.path import abspath, dirname, join
+
+__author__ = "johanpalmqvist"
+
+# The skill is imported as a package with Mycroft stubbed (see
+# benchmarks/stubs.py), so tests can import its modules as
+# squeezebox_skill.<module>
+sys.path.insert(0, join(dirname(dirname(abspath(__file__))), "benchmarks"))
+
+from stubs import load_skill  # noqa: E402
+
+load_skill()
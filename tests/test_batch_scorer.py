@@ -0,0 +1,149 @@
+import random
+import string
+import pytest
+from fuzzywuzzy.fuzz import QRatio, ratio
+from fuzzywuzzy.process import extractOne
+from fuzzywuzzy.utils import full_process
+from squeezebox_skill.batch_scorer import PackedKeys, numpy_available
+from squeezebox_skill.fuzzy_index import (
+    MatchIndex,
+    length_buckets,
+    process_key,
+    process_query,
+    search_buckets,
+    trigrams,
+)
+
+ALPHABET = string.ascii_letters + string.digits + "    &'-.éüøß東京"
+
+needs_numpy = pytest.mark.skipif(
+    not numpy_available(), reason="numpy backend not available"
+)
+
+
+def random_text(rng, low, high):
+    return "".join(
+        rng.choice(ALPHABET) for _ in range(rng.randint(low, high))
+    )
+
+
+# Keys with punctuation, non-ASCII characters and keys that are empty once
+# processed
+@pytest.fixture(scope="module")
+def keys():
+    rng = random.Random(0)
+    keys = [random_text(rng, 0, 70) for _ in range(2000)]
+    keys += ["éü東京", "Björk", "Sigur Rós", "Motörhead"]
+    # Unique keys in order (like the keys of a sources category)
+    return list(dict.fromkeys(keys))
+
+
+# Queries that are random text or prefixes of keys (and edge cases)
+@pytest.fixture(scope="module")
+def queries(keys):
+    rng = random.Random(1)
+    queries = [random_text(rng, 0, 60) for _ in range(30)]
+    queries += [rng.choice(keys)[: rng.randint(1, 30)] for _ in range(30)]
+    queries += ["", "björk", "sigur ros", "東京", "x" * 80]
+    return queries
+
+
+# Get (key, score) extractOne picks among keys for query with QRatio
+def expected_best(query, keys):
+    key, score = extractOne(query, keys, scorer=QRatio)
+    return key, score
+
+
+@needs_numpy
+def test_packed_scores_match_qratio(keys, queries):
+    processed = [process_key(key) for key in keys]
+    packed = PackedKeys(processed)
+    for query in queries:
+        expected = [QRatio(full_process(query), key) for key in keys]
+        assert packed.scores(process_query(query)).tolist() == expected
+
+
+@needs_numpy
+def test_packed_scores_of_shortlist_match_qratio(keys, queries):
+    rng = random.Random(2)
+    processed = [process_key(key) for key in keys]
+    packed = PackedKeys(processed)
+    for query in queries:
+        positions = sorted(rng.sample(range(len(keys)), 50))
+        expected = [
+            QRatio(full_process(query), keys[position])
+            for position in positions
+        ]
+        scores = packed.scores(process_query(query), positions)
+        assert scores.tolist() == expected
+
+
+@needs_numpy
+def test_packed_scores_of_non_ascii_keys_match_ratio(keys, queries):
+    processed = [full_process(key) for key in keys]
+    packed = PackedKeys(processed)
+    assert not packed.packable
+    for query in queries:
+        processed_query = full_process(query)
+        expected = [ratio(processed_query, key) for key in processed]
+        assert packed.scores(processed_query).tolist() == expected
+
+
+@pytest.mark.parametrize(
+    "scorer",
+    ["fuzzywuzzy", pytest.param("numpy", marks=needs_numpy)],
+)
+def test_full_scan_matches_extract_one(keys, queries, scorer):
+    match_index = MatchIndex(candidates=0, scorer=scorer)
+    sources = {"title": dict.fromkeys(keys)}
+    for query in queries:
+        assert match_index.extract_best(
+            "title", query, sources
+        ) == expected_best(query, keys)
+
+
+@pytest.mark.parametrize(
+    "scorer",
+    ["fuzzywuzzy", pytest.param("numpy", marks=needs_numpy)],
+)
+def test_shortlist_matches_extract_one_on_candidates(keys, queries, scorer):
+    match_index = MatchIndex(candidates=50, scorer=scorer)
+    sources = {"title": dict.fromkeys(keys)}
+    index = match_index.index_for("title", sources["title"])
+    for query in queries:
+        positions = index.shortlist(
+            trigrams(process_query(query)), match_index.candidates
+        )
+        candidates = [keys[position] for position in positions] or keys
+        assert match_index.extract_best(
+            "title", query, sources
+        ) == expected_best(query, candidates)
+
+
+# Pruning by score bound gives the same (position, score) as scoring every
+# key, for all keys and for a subset of positions
+def test_search_buckets_matches_exhaustive_scan(keys, queries):
+    rng = random.Random(3)
+    processed = [process_key(key) for key in keys]
+    for query in queries:
+        processed_query = process_query(query)
+        for positions in (None, sorted(rng.sample(range(len(keys)), 100))):
+            stats = {"scored": 0, "pruned": 0}
+            result = search_buckets(
+                processed_query,
+                processed,
+                length_buckets(processed, positions),
+                stats,
+            )
+            considered = range(len(keys)) if positions is None else positions
+            # First position with the highest score (QRatio scores empty
+            # strings 0)
+            expected = (None, -1)
+            for position in considered:
+                score = 0
+                if processed_query and processed[position]:
+                    score = ratio(processed_query, processed[position])
+                if score > expected[1]:
+                    expected = (position, score)
+            assert result == expected
+            assert stats["scored"] + stats["pruned"] == len(considered)
@@ -0,0 +1,52 @@
+from squeezebox_skill.library_index import build_sources
+from squeezebox_skill.library_sync import (
+    album_fingerprints,
+    apply_album_changes,
+    diff_albums,
+)
+
+
+def track(track_id, album_id, album, title, modified="1"):
+    return {
+        "id": track_id,
+        "album_id": album_id,
+        "album": album,
+        "artist": "Artist {}".format(album_id),
+        "artist_id": album_id,
+        "title": title,
+        "url": "file:///music/{}.flac".format(track_id),
+        "genre": "Rock",
+        "genre_id": 1,
+        "modificationTime": modified,
+    }
+
+
+# Albums sharing a name and tracks sharing a title (build_sources keeps the
+# first album_id and the last track of each name)
+def test_sync_builds_same_sources_as_full_fetch():
+    cached = [
+        track(1, 10, "Greatest Hits", "Intro"),
+        track(2, 20, "Greatest Hits", "Intro"),
+        track(3, 30, "Live", "Outro"),
+    ]
+    # Album 10 modified and album 40 added (listed first by LMS)
+    current = [
+        track(4, 40, "Greatest Hits", "Intro"),
+        track(1, 10, "Greatest Hits", "Intro", "2"),
+        track(2, 20, "Greatest Hits", "Intro"),
+        track(3, 30, "Live", "Outro"),
+    ]
+    changed, removed = diff_albums(
+        album_fingerprints(cached), album_fingerprints(current)
+    )
+    assert (changed, removed) == ({"10", "40"}, set())
+    # Changed albums are fetched one at a time
+    fetched = [
+        t
+        for album_id in sorted(changed)
+        for t in current
+        if str(t["album_id"]) == album_id
+    ]
+    synced = apply_album_changes(cached, changed, removed, fetched, current)
+    assert synced == current
+    assert build_sources(synced)[0] == build_sources(current)[0]
@@ -0,0 +1,145 @@
+from time import monotonic, sleep
+import pytest
+from fake_cli import FakeCLIServer
+from squeezebox_skill.player_state import PlayerStateCache
+
+PLAYERID = "00:04:20:00:00:00"
+
+
+# Wait up to timeout seconds for condition to hold
+def wait_for(condition, timeout=5):
+    deadline = monotonic() + timeout
+    while not condition():
+        if monotonic() > deadline:
+            return False
+        sleep(0.01)
+    return True
+
+
+# Player state cache recording the commands it sends instead of sending
+# them (marked connected so state is served)
+@pytest.fixture
+def cache():
+    cache = PlayerStateCache("localhost")
+    cache.sent = []
+    cache.send = lambda *command: cache.sent.append(command)
+    cache.connected = True
+    cache.update(PLAYERID, {"mode": "play", "volume": 50, "power": 1})
+    cache.sent.clear()
+    return cache
+
+
+def test_status_sets_state(cache):
+    cache.handle_line(
+        "{} status - 1 tags%3Aa mode%3Apause mixer%20volume%3A-20 "
+        "power%3A0 title%3AMy%20Song artist%3AThe%20Band\n".format(PLAYERID)
+    )
+    assert cache.get_state(PLAYERID) == {
+        "mode": "pause",
+        "volume": -20,
+        "power": 0,
+        "title": "My Song",
+        "artist": "The Band",
+    }
+
+
+def test_absolute_volume_is_stored(cache):
+    cache.handle_line("{} mixer volume 30\n".format(PLAYERID))
+    assert cache.get_state(PLAYERID)["volume"] == 30
+    assert cache.sent == []
+
+
+@pytest.mark.parametrize("change", ["-5", "%2B5"])
+def test_relative_volume_requests_status(cache, change):
+    cache.handle_line("{} mixer volume {}\n".format(PLAYERID, change))
+    assert cache.get_state(PLAYERID)["volume"] == 50
+    assert cache.sent == [(PLAYERID, "status", "-", "1", "tags:a")]
+
+
+def test_relative_volume_is_not_reported_as_change(cache):
+    since = monotonic()
+    cache.handle_line("{} mixer volume -5\n".format(PLAYERID))
+    assert cache.get(PLAYERID, "volume", since, timeout=0.05) is None
+
+
+@pytest.mark.parametrize(
+    "line, mode",
+    [
+        ("playlist pause 1", "pause"),
+        ("playlist pause 0", "play"),
+        ("pause 1", "pause"),
+        ("stop", "stop"),
+        ("playlist stop", "stop"),
+    ],
+)
+def test_mode_changes(cache, line, mode):
+    cache.handle_line("{} {}\n".format(PLAYERID, line))
+    assert cache.get_state(PLAYERID)["mode"] == mode
+
+
+def test_newsong_sets_title_and_requests_status(cache):
+    cache.handle_line("{} playlist newsong Other%20Song 3\n".format(PLAYERID))
+    state = cache.get_state(PLAYERID)
+    assert (state["mode"], state["title"]) == ("play", "Other Song")
+    assert cache.sent == [(PLAYERID, "status", "-", "1", "tags:a")]
+
+
+def test_power_and_toggle(cache):
+    cache.handle_line("{} power 0\n".format(PLAYERID))
+    assert cache.get_state(PLAYERID)["power"] == 0
+    cache.handle_line("{} pause\n".format(PLAYERID))
+    assert cache.sent == [(PLAYERID, "status", "-", "1", "tags:a")]
+
+
+def test_client_forget(cache):
+    cache.handle_line("{} client forget\n".format(PLAYERID))
+    assert cache.get_state(PLAYERID) is None
+
+
+def test_players_requests_status_of_each_player(cache):
+    cache.handle_line(
+        "players 0 100 count%3A2 playerindex%3A0 playerid%3Aaa "
+        "name%3AOne playerindex%3A1 playerid%3Abb name%3ATwo\n"
+    )
+    assert [command[0] for command in cache.sent] == ["aa", "bb"]
+
+
+def test_follows_fake_cli():
+    with FakeCLIServer(("Living Room", "Kitchen")) as cli:
+        cache = PlayerStateCache(
+            "127.0.0.1", cli.port, "user", "secret", reconnect_delay=0.1
+        )
+        cache.start()
+        try:
+            assert wait_for(
+                lambda: cache.get_state(PLAYERID) is not None
+                and cli.subscriber_count() == 1
+            )
+            assert cache.get_state(PLAYERID)["volume"] == 50
+            assert cli.commands[0] == ["login", "user", "secret"]
+
+            since = monotonic()
+            cli.notify(
+                PLAYERID, ["mixer", "volume", "30"], {"mixer volume": 30}
+            )
+            assert cache.get(PLAYERID, "volume", since) == 30
+
+            # Relative change is followed by the resulting status
+            since = monotonic()
+            cli.notify(
+                PLAYERID, ["mixer", "volume", "-5"], {"mixer volume": 25}
+            )
+            assert cache.get(PLAYERID, "volume", since) == 25
+
+            cli.notify(
+                PLAYERID,
+                ["playlist", "newsong", "Song", "0"],
+                {"mode": "play", "title": "Song", "artist": "The Band"},
+            )
+            assert wait_for(
+                lambda: cache.get_state(PLAYERID)["artist"] == "The Band"
+            )
+            assert cache.get_state(PLAYERID)["mode"] == "play"
+        finally:
+            cache.stop()
+        assert cache.get_state(PLAYERID) is None